@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the client paths of osrm (the functions of `osrm.core`,
+the batch functions, `AccessIsochrone` and `isochrone_many`) against
+a local mock OSRM server (see mock_server.py), measuring for each case :
+
+    - the throughput (requests per second),
+    - the median and 95th percentile latency of a call,
+    - the client CPU time per call (the overhead of the client, the
+      server running in its own process),
+    - the peak of memory allocated during a call (with tracemalloc),
+
+the cost of the geometry decoding being given by the difference between
+the 'route' and 'route_wkt' (or 'match' and 'match_columnar') cases.
+
+The results can be saved in a JSON file and compared with the results
+saved for another commit.
+
+Usage :
+    python benchmarks/bench_client.py [--latency 0.002] [--points 500]
+        [--table-size 200] [--calls 200] [--cases route table ...]
+        [--save results.json] [--compare previous.json]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import osrm
+from mock_server import MockOsrmServer
+
+METRICS = ('req_per_s', 'p50_ms', 'p95_ms', 'cpu_ms', 'peak_kb')
+
+
+def make_coords(n, seed=0):
+    """ Random (x, y) coordinates, around Skopje """
+    rng = np.random.RandomState(seed)
+    coords = rng.uniform((21.3, 41.9), (21.5, 42.1), size=(n, 2))
+    return [tuple(c) for c in np.round(coords, 5).tolist()]
+
+
+def make_cases(config, table_size):
+    """ Return the benchmarked calls as a dict of functions """
+    coords = make_coords(max(table_size, 1000))
+    trace = make_coords(100, seed=1)
+    pairs = list(zip(coords[:50], coords[50:100]))
+
+    return {
+        'nearest': lambda: osrm.nearest(coords[0], url_config=config),
+        'route': lambda: osrm.simple_route(
+            coords[0], coords[1], overview="full", url_config=config),
+        'route_wkt': lambda: osrm.simple_route(
+            coords[0], coords[1], overview="full", geometry='wkt',
+            url_config=config),
+        'table': lambda: osrm.table(
+            coords[:table_size], url_config=config),
+        'table_tiled': lambda: osrm.table(
+            coords[:table_size], tile_size=max(table_size // 4, 1),
+            url_config=config),
+        'table_one_to_many': lambda: osrm.table_one_to_many(
+            coords[0], coords[:1000], url_config=config),
+        'match': lambda: osrm.match(
+            trace, overview="full", url_config=config),
+        'match_columnar': lambda: osrm.match(
+            trace, overview="full", output="columnar", url_config=config),
+        'trip': lambda: osrm.trip(coords[:10], url_config=config),
+        'route_many': lambda: list(osrm.route_many(
+            pairs, workers=8, url_config=config, overview="full")),
+        'access_isochrone': lambda: osrm.AccessIsochrone(
+            coords[0], points_grid=400, size=0.1, url_config=config),
+        'access_isochrone_adaptive': lambda: osrm.AccessIsochrone(
+            coords[0], points_grid=100, size=0.1, breaks=[5, 10],
+            precision=0.005, url_config=config),
+        'isochrone_many': lambda: list(osrm.isochrone_many(
+            coords[:20], breaks=[5, 10], points_grid=100, size=0.1,
+            group_size=10, processes=0, url_config=config)),
+        }
+
+
+def measure(func, calls, warmup=3):
+    """ Measure the latency, throughput, CPU time and memory of `func` """
+    for _ in range(warmup):
+        func()
+    latencies = []
+    start, cpu_start = time.time(), time.process_time()
+    for _ in range(calls):
+        t0 = time.time()
+        func()
+        latencies.append(time.time() - t0)
+    elapsed = time.time() - start
+    cpu = time.process_time() - cpu_start
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'req_per_s': calls / elapsed,
+        'p50_ms': np.percentile(latencies, 50) * 1000,
+        'p95_ms': np.percentile(latencies, 95) * 1000,
+        'cpu_ms': cpu / calls * 1000,
+        'peak_kb': peak / 1024.,
+        }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+            stderr=subprocess.STDOUT).decode().strip()
+    except Exception:
+        return None
+
+
+def print_header():
+    print("{:<26}".format('case')
+          + ''.join('{:>12}'.format(m) for m in METRICS))
+
+
+def report(results, baseline=None):
+    """ Print the results (and their ratio to the `baseline` results) """
+    for name, values in results.items():
+        if 'error' in values:
+            print("{:<26}  error: {}".format(name, values['error']))
+            continue
+        print("{:<26}".format(name)
+              + ''.join('{:>12.2f}'.format(values[m]) for m in METRICS))
+        previous = (baseline or {}).get(name)
+        if previous and 'error' not in previous:
+            print("{:<26}".format('  vs baseline')
+                  + ''.join('{:>11.2f}x'.format(values[m] / previous[m])
+                            if previous[m] else '{:>12}'.format('-')
+                            for m in METRICS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--latency', type=float, default=0.,
+                        help="latency of the mock server, in seconds")
+    parser.add_argument('--points', type=int, default=500,
+                        help="number of points of the geometries")
+    parser.add_argument('--table-size', type=int, default=200,
+                        help="number of coordinates of the 'table' cases")
+    parser.add_argument('--calls', type=int, default=100,
+                        help="number of measured calls of each case")
+    parser.add_argument('--cases', nargs='*',
+                        help="the cases to run (default: all)")
+    parser.add_argument('--no-session', action='store_true',
+                        help="open a new connection for each request")
+    parser.add_argument('--save', help="JSON file to save the results to")
+    parser.add_argument('--compare', help="JSON file of previous results")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        print("Baseline: commit {} ({})".format(
+            previous['meta']['commit'], args.compare))
+        baseline = previous['results']
+
+    results = {}
+    with MockOsrmServer(latency=args.latency, points=args.points) as server:
+        config = osrm.RequestConfig(
+            server.address + "/v1/driving",
+            session=None if args.no_session else osrm.Session())
+        cases = make_cases(config, args.table_size)
+        print_header()
+        for name in args.cases or cases:
+            # Fewer calls for the slowest cases :
+            calls = args.calls if name not in (
+                'route_many', 'access_isochrone', 'access_isochrone_adaptive',
+                'isochrone_many', 'table', 'table_tiled') \
+                else max(args.calls // 10, 3)
+            try:
+                results[name] = measure(cases[name], calls)
+            except Exception as err:
+                results[name] = {'error': repr(err)}
+            report({name: results[name]}, baseline)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'meta': {
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'osrm': osrm.__version__,
+                'args': vars(args),
+                }, 'results': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the time and memory needed by `import osrm`, checking that
+the heavy dependencies (pandas, GDAL, geopandas, matplotlib, scipy and
+shapely) are not loaded until they are used.
+
+Usage :
+    python benchmarks/bench_import.py [max_ms]
+
+Exits with a non-zero status if a heavy dependency is loaded by `import osrm`
+or if the median import time is above `max_ms` (if provided).
+"""
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = ('pandas', 'geopandas', 'matplotlib', 'scipy', 'shapely',
+                 'osgeo', 'ogr')
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CODE = """
+import resource, sys, time
+t0 = time.time()
+{}
+elapsed = time.time() - t0
+loaded = [m for m in {!r} if m in sys.modules]
+print(elapsed * 1000, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+      ','.join(loaded) or '-')
+"""
+
+
+def measure(statement, repeat=7):
+    """ Run `statement` in fresh interpreters and return the median values """
+    results = []
+    for _ in range(repeat):
+        out = subprocess.check_output(
+            [sys.executable, '-c', CODE.format(statement, HEAVY_MODULES)],
+            cwd=ROOT_DIR)
+        elapsed, max_rss, loaded = out.decode().split()
+        results.append((float(elapsed), int(max_rss), loaded))
+    results.sort()
+    return results[len(results) // 2]
+
+
+def main(max_ms=None):
+    status = 0
+    for statement in ("import osrm",
+                      "import osrm; osrm.AccessIsochrone"):
+        elapsed, max_rss, loaded = measure(statement)
+        print("{:<36} {:>8.1f} ms {:>8.1f} MB   loaded: {}".format(
+            statement, elapsed, max_rss / 1024., loaded))
+        if statement == "import osrm":
+            if loaded != '-':
+                print("  -> heavy dependencies loaded by `import osrm`")
+                status = 1
+            if max_ms is not None and elapsed > max_ms:
+                print("  -> slower than {} ms".format(max_ms))
+                status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main(*[float(arg) for arg in sys.argv[1:]]))
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the decoding of encoded polylines, comparing the vectorized
+decoder (osrm.decode_polyline) with the point by point decoding of
+the `polyline` package previously used by osrm.core, and of their
+conversion to WKB / WKT.
+
+Usage :
+    python benchmarks/bench_polyline.py [n_points]
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+from polyline import encode as polyline_encode
+from polyline.codec import PolylineCodec
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from osrm import decode_polyline, line_to_wkb, line_to_wkt
+
+
+def make_polyline(n_points, precision=5, seed=0):
+    """ Encode a random walk of `n_points` points, like a 'full' overview """
+    rng = np.random.RandomState(seed)
+    steps = rng.normal(scale=5e-4, size=(n_points, 2))
+    coords = np.cumsum(steps, axis=0) + (42.0, 21.0)
+    return polyline_encode(coords.tolist(), precision)
+
+
+def codec_to_list(encoded):
+    return [[lng, lat] for lat, lng in PolylineCodec().decode(encoded)]
+
+
+def vectorized_to_list(encoded):
+    return decode_polyline(encoded).tolist()
+
+
+def vectorized_to_array(encoded):
+    return decode_polyline(encoded)
+
+
+def vectorized_to_wkb(encoded):
+    return line_to_wkb(decode_polyline(encoded))
+
+
+def vectorized_to_wkt(encoded):
+    return line_to_wkt(decode_polyline(encoded))
+
+
+def main(n_points=10000):
+    encoded = make_polyline(n_points)
+    assert codec_to_list(encoded) == vectorized_to_list(encoded)
+
+    print("Decoding a polyline of {} points ({} bytes) :"
+          .format(n_points, len(encoded)))
+    for func in (codec_to_list, vectorized_to_list, vectorized_to_array,
+                 vectorized_to_wkb, vectorized_to_wkt):
+        number = max(1, 200000 // n_points)
+        timings = timeit.repeat(
+            lambda: func(encoded), number=number, repeat=5)
+        print("  {:<22} {:>10.3f} ms".format(
+            func.__name__, min(timings) / number * 1000))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
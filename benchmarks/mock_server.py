@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for an OSRM instance, serving synthetic 'route', 'table',
+'match', 'trip' and 'nearest' responses (computed from the coordinates of
+the queries, with geometries of a configurable number of points) after
+a configurable latency, in order to benchmark the client offline.
+
+The responses are computed once per url and then served from memory,
+so the server costs as little as possible to the measured client.
+
+Usage :
+    python benchmarks/mock_server.py [--port 5000] [--latency 0.005]
+                                     [--points 500]
+
+From a benchmark, the server is run in its own process (not to compete
+with the client for the GIL) :
+    with MockOsrmServer(latency=0.005, points=500) as server:
+        config = osrm.RequestConfig(server.address + "/v1/driving")
+"""
+import argparse
+import json
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlsplit, parse_qs, unquote
+except:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlsplit, parse_qs
+    from urllib2 import unquote
+
+import numpy as np
+from polyline import decode as polyline_decode, encode as polyline_encode
+
+# Synthetic travel speed (in degrees per second, about 50 km/h) :
+SPEED = 1.25e-4
+
+
+def parse_coords(text):
+    """ Parse the coordinates of a query (as a (n, 2) array of x, y) """
+    text = unquote(text)
+    if text.startswith('polyline('):
+        return np.array(polyline_decode(text[9:-1]))[:, ::-1].reshape(-1, 2)
+    return np.array([c.split(',') for c in text.split(';')], dtype=float)
+
+
+def waypoint(coord):
+    return {"hint": "", "distance": 0.5, "name": "",
+            "location": [round(coord[0], 6), round(coord[1], 6)]}
+
+
+def line(coords, n_points):
+    """
+    Encode the geometry of a path through `coords`, made of (about)
+    `n_points` points, as a polyline
+    """
+    n_points = max(n_points, len(coords))
+    pos = np.linspace(0, len(coords) - 1, n_points)
+    i = np.minimum(pos.astype(int), len(coords) - 2) if len(coords) > 1 \
+        else np.zeros(n_points, dtype=int)
+    frac = (pos - i)[:, None]
+    start, end = coords[i], coords[np.minimum(i + 1, len(coords) - 1)]
+    points = start + (end - start) * frac
+    return polyline_encode(points[:, ::-1].tolist())
+
+
+def legs(coords):
+    """ Distance (in degrees) and duration of each leg between `coords` """
+    dist = np.abs(np.diff(coords, axis=0)).sum(axis=1)
+    return [{"distance": round(d * 1e5, 1), "duration": round(d / SPEED, 1),
+             "summary": "", "steps": [], "weight": round(d / SPEED, 1)}
+            for d in dist]
+
+
+def route_response(coords, params, n_points):
+    route_legs = legs(coords)
+    route = {
+        "geometry": line(coords, n_points),
+        "legs": route_legs,
+        "distance": round(sum(leg["distance"] for leg in route_legs), 1),
+        "duration": round(sum(leg["duration"] for leg in route_legs), 1),
+        "weight_name": "routability",
+        "weight": round(sum(leg["weight"] for leg in route_legs), 1),
+        }
+    return {"code": "Ok", "routes": [route],
+            "waypoints": [waypoint(c) for c in coords]}
+
+
+def table_response(coords, params, n_points):
+    sources = [int(i) for i in params['sources'][0].split(';')] \
+        if 'sources' in params else list(range(len(coords)))
+    destinations = [int(i) for i in params['destinations'][0].split(';')] \
+        if 'destinations' in params else list(range(len(coords)))
+    src, dest = coords[sources], coords[destinations]
+    dist = np.abs(src[:, None, :] - dest[None, :, :]).sum(axis=2)
+    result = {"code": "Ok",
+              "sources": [waypoint(c) for c in src],
+              "destinations": [waypoint(c) for c in dest]}
+    annotations = params.get('annotations', ['duration'])[0].split(',')
+    if 'duration' in annotations:
+        result["durations"] = np.round(dist / SPEED, 1).tolist()
+    if 'distance' in annotations:
+        result["distances"] = np.round(dist * 1e5, 1).tolist()
+    return result
+
+
+def match_response(coords, params, n_points):
+    route = route_response(coords, params, n_points)["routes"][0]
+    route["confidence"] = 0.9
+    return {"code": "Ok", "matchings": [route],
+            "tracepoints": [dict(waypoint(c), matchings_index=0,
+                                 waypoint_index=i, alternatives_count=0)
+                            for i, c in enumerate(coords)]}
+
+
+def trip_response(coords, params, n_points):
+    trip = route_response(np.vstack([coords, coords[:1]]),
+                          params, n_points)["routes"][0]
+    return {"code": "Ok", "trips": [trip],
+            "waypoints": [dict(waypoint(c), trips_index=0, waypoint_index=i)
+                          for i, c in enumerate(coords)]}
+
+
+def nearest_response(coords, params, n_points):
+    number = int(params.get('number', ['1'])[0])
+    return {"code": "Ok",
+            "waypoints": [dict(waypoint(coords[0] + 1e-4 * i),
+                               distance=round(10. * i, 1))
+                          for i in range(number)]}
+
+
+SERVICES = {
+    'route': route_response, 'table': table_response,
+    'match': match_response, 'trip': trip_response,
+    'nearest': nearest_response,
+    }
+
+
+class MockOsrmHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    latency = 0.
+    n_points = 100
+    responses = {}
+    lock = threading.Lock()
+
+    def do_GET(self):
+        start = time.time()
+        with self.lock:
+            body = self.responses.get(self.path)
+        if body is None:
+            body = self.respond(self.path)
+            with self.lock:
+                if len(self.responses) > 10000:
+                    self.responses.clear()
+                self.responses[self.path] = body
+        delay = self.latency - (time.time() - start)
+        if delay > 0:
+            time.sleep(delay)
+        self.send_response(200 if b'"code":"Ok"' in body[:30] else 400)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def respond(self, path):
+        _, _, path, query, _ = urlsplit(path)
+        parts = path.strip('/').split('/')
+        func = SERVICES.get(parts[0])
+        if func is None or len(parts) != 4:
+            result = {"code": "InvalidUrl", "message": "Unknown service"}
+        else:
+            try:
+                result = func(parse_coords(parts[3]), parse_qs(query),
+                              self.n_points)
+            except Exception as err:
+                result = {"code": "InvalidQuery", "message": str(err)}
+        return json.dumps(result, separators=(',', ':')).encode('utf-8')
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class MockOsrmServer:
+    """
+    Mock OSRM server run in a child process.
+
+    Parameters
+    ----------
+    latency : float, optional
+        The minimum number of seconds taken to answer each request
+        (default: 0).
+    points : int, optional
+        The number of points of the geometries (default: 100).
+    port : int, optional
+        The port to listen to (default: 0, ie. any free port).
+
+    Attributes
+    ----------
+    address : str
+        The address of the server, like "127.0.0.1:41234".
+    """
+    def __init__(self, latency=0., points=100, port=0):
+        self.latency = latency
+        self.points = points
+        self.port = port
+        self.address = None
+        self._process = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        self._process = subprocess.Popen(
+            [sys.executable, __file__, '--port', str(self.port),
+             '--latency', str(self.latency), '--points', str(self.points)],
+            stdout=subprocess.PIPE)
+        # The first line written by the server is its address :
+        self.address = self._process.stdout.readline().decode().strip()
+        return self
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait()
+            self._process.stdout.close()
+            self._process = None
+
+
+def serve(port=5000, latency=0., points=100):
+    MockOsrmHandler.latency = latency
+    MockOsrmHandler.n_points = points
+    server = ThreadingHTTPServer(('127.0.0.1', port), MockOsrmHandler)
+    print("127.0.0.1:{}".format(server.server_port))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--latency', type=float, default=0.,
+                        help="minimum response time, in seconds")
+    parser.add_argument('--points', type=int, default=100,
+                        help="number of points of the geometries")
+    args = parser.parse_args()
+    serve(args.port, args.latency, args.points)
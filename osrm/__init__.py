@@ -18,6 +18,11 @@ class DefaultRequestConfig:
         self.profile = "driving"
         self.version = "v1"
         self.auth = None
+        self.session = None
+        self.cache = None
+        self.max_url_length = 8000
+        self.hosts = None
+        self.metrics = None
 
     def __str__(self):
         return("/".join([self.host, '*', self.version, self.profile]))
@@ -26,8 +31,13 @@ class DefaultRequestConfig:
         return("/".join([self.host, '*', self.version, self.profile]))
 
     @staticmethod
-    def __call__(addr=None, basic_auth=None):
+    def __call__(addr=None, basic_auth=None, session=None, cache=None,
+                 max_url_length=8000, hosts=None, metrics=None):
         cla = DefaultRequestConfig()
+        cla.session = session
+        cla.cache = cache
+        cla.metrics = metrics
+        cla.max_url_length = max_url_length
 
         if addr:
             tmp = addr.split('/')
@@ -36,6 +46,12 @@ class DefaultRequestConfig:
             cla.version = tmp[i-2]
             cla.profile = tmp[i-1]
 
+        if hosts:
+            from .hosts import HostPool
+            cla.hosts = hosts if isinstance(hosts, HostPool) \
+                else HostPool(hosts)
+            cla.host = cla.hosts.hosts[0]
+
         if basic_auth:
             user, password = basic_auth
 
@@ -50,5 +66,26 @@ RequestConfig = DefaultRequestConfig()
 
 Point = namedtuple("Point", ("longitude", "latitude"))
 
-from .core import match, simple_route, nearest, table, trip, _chain
-from .extra import AccessIsochrone
+from .session import Session
+from .cache import ResponseCache, MatrixCache
+from .hosts import HostPool, HostStatus, HedgeInfo
+from .metrics import Metrics, Histogram
+from .geometry import decode_polyline, line_to_wkb, line_to_wkt
+from .core import (
+    match, simple_route, nearest, table, table_one_to_many, table_many_to_one,
+    trip, set_json_backend, TableResult, MatchColumns, _chain)
+from .batch import (
+    route_many, match_many, match_stream, BatchResult, BatchStats, MatchSegment)
+
+# The `osrm.extra` module (and its heavy dependencies: matplotlib, geopandas,
+# shapely and scipy) is only loaded when AccessIsochrone (or isochrone_many)
+# is first accessed :
+if sys.version_info < (3, 7):
+    from .extra import AccessIsochrone, isochrone_many
+else:
+    def __getattr__(name):
+        if name in ('AccessIsochrone', 'isochrone_many'):
+            from . import extra
+            return getattr(extra, name)
+        raise AttributeError(
+            "module {!r} has no attribute {!r}".format(__name__, name))
@@ -0,0 +1,479 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio versions of the osrm.core functions
+-------------------------------------------
+Wrap OSRM services 'route', 'nearest', 'table', 'match' and 'trip' with
+coroutines, sharing the building of the urls and the decoding of the
+responses with the functions of `osrm.core`.
+
+Requests are made on pooled keep-alive connections, with a bounded number of
+concurrent requests per host, so thousands of queries can be awaited
+on the same event loop without using any thread.
+
+(requires python >= 3.5)
+"""
+import asyncio
+import weakref
+from urllib.parse import urlsplit
+from urllib.request import URLError, HTTPError
+from io import BytesIO
+
+from . import RequestConfig
+from .core import (
+    _match_url, _match_result, _geom_request, _route_url, _route_result,
+    _table_output, _table_request_url, _table_trim, _table_result,
+    _nearest_url, _trip_url, _trip_result, _parse_response,
+    _parse_table_response, _cache_lookup, _cache_store, _match_query,
+    _route_query, _table_query, _nearest_query, _trip_query, _switch_host,
+    _timed, _record_response)
+from .hosts import _clock
+
+
+class Client:
+    """
+    Pool of keep-alive connections for use with the coroutines of `osrm.aio`.
+
+    Parameters
+    ----------
+    limit_per_host : int, optional
+        The maximum number of concurrent requests sent to the same host
+        (default: 100). Other requests wait for a free slot.
+    timeout : float, optional
+        Timeout (in seconds) for each request (default: None, ie. no timeout).
+
+    Examples
+    --------
+    >>> async with osrm.aio.Client(limit_per_host=50) as client:
+    ...     results = await asyncio.gather(*[
+    ...         osrm.aio.simple_route(o, d, client=client) for o, d in pairs])
+    """
+    def __init__(self, limit_per_host=100, timeout=None):
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self._semaphores = {}
+        self._pools = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def _get_connection(self, scheme, netloc):
+        pool = self._pools.get((scheme, netloc))
+        while pool:
+            reader, writer = pool.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer, True
+            writer.close()
+        host, _, port = netloc.rpartition(':')
+        if not host or not port.isdigit():
+            host, port = netloc, None
+        try:
+            if scheme == 'https':
+                reader, writer = await asyncio.open_connection(
+                    host, int(port or 443), ssl=True)
+            else:
+                reader, writer = await asyncio.open_connection(
+                    host, int(port or 80))
+        except OSError as err:
+            raise URLError(err)
+        return reader, writer, False
+
+    @staticmethod
+    async def _read_response(reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed by the server')
+        status_line = status_line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+        version, status = status_line[0], int(status_line[1])
+        reason = status_line[2] if len(status_line) > 2 else ''
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = headers.get('connection', '').lower() != 'close' \
+            and version != 'HTTP/1.0'
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            content = b''.join(chunks)
+        elif 'content-length' in headers:
+            content = await reader.readexactly(int(headers['content-length']))
+        else:
+            content = await reader.read()
+            keep_alive = False
+        return status, reason, headers, content, keep_alive
+
+    async def _request(self, url, auth):
+        scheme, netloc, path, query, _ = urlsplit(url)
+        if query:
+            path = '?'.join([path, query])
+        request = ''.join([
+            'GET ', path or '/', ' HTTP/1.1\r\n',
+            'Host: ', netloc, '\r\n',
+            'Connection: keep-alive\r\n',
+            'Authorization: {}\r\n'.format(auth) if auth else '',
+            '\r\n']).encode('latin-1')
+
+        for attempt in range(2):
+            reader, writer, reused = \
+                await self._get_connection(scheme, netloc)
+            try:
+                writer.write(request)
+                await writer.drain()
+                status, reason, headers, content, keep_alive = \
+                    await self._read_response(reader)
+            except (OSError, asyncio.IncompleteReadError, ValueError) as err:
+                writer.close()
+                # The server may have closed an idle connection from the pool,
+                # so try again once with a fresh one :
+                if reused and attempt == 0:
+                    continue
+                raise URLError(err)
+            except BaseException:
+                # Cancelled (or timed out) while waiting for the response :
+                writer.close()
+                raise
+            break
+
+        if keep_alive:
+            self._pools.setdefault((scheme, netloc), []).append(
+                (reader, writer))
+        else:
+            writer.close()
+
+        if status >= 400:
+            raise HTTPError(url, status, reason, headers, BytesIO(content))
+        return content
+
+    async def fetch(self, url, auth=None):
+        """
+        Query `url` and return the body of the response.
+
+        Parameters
+        ----------
+        url : str
+            The url to query.
+        auth : str, optional
+            The value of the "Authorization" header to send, if any.
+
+        Returns
+        -------
+        content : bytes
+            The body of the response.
+
+        Raises
+        ------
+        URLError
+            If the host can't be reached.
+        HTTPError
+            If the server replied with an HTTP error code.
+        """
+        key = urlsplit(url)[:2]
+        semaphore = self._semaphores.get(key)
+        if semaphore is None:
+            semaphore = self._semaphores[key] = \
+                asyncio.Semaphore(self.limit_per_host)
+        async with semaphore:
+            if self.timeout is None:
+                return await self._request(url, auth)
+            return await asyncio.wait_for(
+                self._request(url, auth), self.timeout)
+
+    async def close(self):
+        """ Close all the idle connections of the pool """
+        pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            for _, writer in pool:
+                writer.close()
+
+
+_default_clients = weakref.WeakKeyDictionary()
+
+
+def _get_client(client):
+    """
+    Helper function to get the `Client` to use (a default one is created
+    for each event loop if the user doesn't provide any)
+    """
+    if client is not None:
+        return client
+    loop = asyncio.get_event_loop()
+    client = _default_clients.get(loop)
+    if client is None:
+        client = _default_clients[loop] = Client()
+    return client
+
+
+async def _semaphore(value):
+    """
+    Helper coroutine creating a semaphore for the running event loop
+    """
+    return asyncio.Semaphore(value)
+
+
+async def _limited(semaphore, func, args, kwargs, record=None):
+    """
+    Helper coroutine awaiting `func(*args, **kwargs)` once `semaphore` is
+    acquired, giving the duration of the call (from its start) and whether
+    it failed to `record`, if any
+    """
+    async with semaphore:
+        t0 = _clock()
+        failed = True
+        try:
+            result = await func(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            if record is not None:
+                record(_clock() - t0, failed)
+
+
+async def _send_request(url, url_config, client, query=None, parse=None,
+                        hedge=False):
+    """
+    Helper function to query the OSRM instance (unless the response to
+    `query` is in the cache of `url_config`) and parse its response
+    (with `parse`, default: `osrm.core._parse_response`), hedging the
+    request if `hedge` is True (see `osrm.HostPool`)
+    """
+    parse = parse or _parse_response
+    cache, key, content = _cache_lookup(url_config, query)
+    if content is not None:
+        return parse(content)
+    service = query[0] if query else None
+    pool = getattr(url_config, 'hosts', None)
+    try:
+        with _timed(url_config, service, 'network'):
+            if pool is None:
+                content = await _get_client(client).fetch(
+                    url, url_config.auth)
+            elif hedge and pool.hedge is not None:
+                content = await _fetch_hedged(url, url_config, client, pool)
+            else:
+                content = await _fetch_failover(url, url_config, client, pool)
+    except Exception as err:
+        _record_response(url_config, service,
+                         getattr(err, 'code', None) or type(err).__name__)
+        raise
+    with _timed(url_config, service, 'parse'):
+        parsed_json = parse(content)
+    _record_response(url_config, service, parsed_json.get("code"), len(content))
+    _cache_store(cache, key, content, parsed_json)
+    return parsed_json
+
+
+async def _fetch_failover(url, url_config, client, pool, exclude=(),
+                          hosts=None):
+    """
+    Helper function to send a request to one of the hosts of `pool`, retrying
+    it on another host when the host fails (see `osrm.HostPool`). The hosts
+    of `exclude` are avoided (if possible) and the hosts used are appended
+    to `hosts` (if any)
+    """
+    tried = list(exclude)
+    for attempt in range(pool.retries + 1):
+        host = pool.acquire(tried)
+        if hosts is not None:
+            hosts.append(host)
+        try:
+            content = await _get_client(client).fetch(
+                _switch_host(url, url_config, host), url_config.auth)
+        except asyncio.CancelledError:
+            # Like the losing request of a hedged request :
+            pool.release(host, False)
+            raise
+        except Exception as err:
+            failed = pool.is_failure(err)
+            pool.release(host, failed)
+            if not failed or attempt == pool.retries:
+                raise
+            tried.append(host)
+            await asyncio.sleep(pool.delay(attempt))
+        else:
+            pool.release(host, False)
+            return content
+
+
+async def _fetch_hedged(url, url_config, client, pool):
+    """
+    Helper function to send a request to one of the hosts of `pool` and,
+    if it's still without response after `pool.hedge_delay()` seconds,
+    to another host (not the one the first request is waiting for), the
+    first response being returned and the other request being cancelled
+    """
+    start = _clock()
+
+    def record_latency(task):
+        # The latency of a cancelled first request is at least its duration :
+        if task.cancelled() or task.exception() is None:
+            pool.record_latency(_clock() - start)
+
+    first_hosts = []
+    first = asyncio.ensure_future(
+        _fetch_failover(url, url_config, client, pool, hosts=first_hosts))
+    first.add_done_callback(record_latency)
+    tasks = [first]
+    delay = pool.hedge_delay()
+    try:
+        if delay is not None and not (await asyncio.wait(
+                tasks, timeout=delay))[0]:
+            tasks.append(asyncio.ensure_future(_fetch_failover(
+                url, url_config, client, pool, exclude=first_hosts)))
+        error, pending = None, set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    pool.record_hedge(len(tasks) > 1, task is not first)
+                    return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def match(points, steps=False, overview="simplified",
+                geometry="polyline", timestamps=None, radius=None,
+                annotations="false", gaps="split", tidy=False, waypoints=None,
+                url_config=RequestConfig, output="full", client=None):
+    """
+    Coroutine wrapping OSRM 'match' function, see `osrm.match`.
+
+    Parameters
+    ----------
+    client : osrm.aio.Client, optional
+        The client to use to make the request (default: a Client shared
+        by all the coroutines running on the current event loop).
+    """
+    if output not in ("full", "columnar"):
+        raise ValueError("Invalid output (should be 'full' or 'columnar')")
+    geom_request = _geom_request(geometry)
+    with _timed(url_config, 'match', 'url'):
+        url = _match_url(points, steps, overview, geom_request, timestamps,
+                         radius, annotations, gaps, tidy, waypoints,
+                         url_config)
+    r_json = await _send_request(
+        url, url_config, client,
+        _match_query(points, steps, overview, geom_request, timestamps,
+                     radius, annotations, gaps, tidy, waypoints))
+    with _timed(url_config, 'match', 'geometry'):
+        return _match_result(r_json, geometry, output)
+
+
+async def simple_route(coord_origin, coord_dest, coord_intermediate=None,
+                       alternatives=False, steps=False, output="full",
+                       geometry='polyline', overview="simplified",
+                       annotations='true', continue_straight='default',
+                       url_config=RequestConfig, send_as_polyline=True,
+                       client=None):
+    """
+    Coroutine wrapping OSRM 'viaroute' function, see `osrm.simple_route`.
+
+    Parameters
+    ----------
+    client : osrm.aio.Client, optional
+        The client to use to make the request (default: a Client shared
+        by all the coroutines running on the current event loop).
+    """
+    geom_request = _geom_request(geometry)
+    with _timed(url_config, 'route', 'url'):
+        url = _route_url(coord_origin, coord_dest, coord_intermediate,
+                         alternatives, steps, geom_request, overview,
+                         annotations, continue_straight, url_config,
+                         send_as_polyline)
+    parsed_json = await _send_request(
+        url, url_config, client,
+        _route_query(coord_origin, coord_dest, coord_intermediate,
+                     alternatives, steps, geom_request, overview, annotations,
+                     continue_straight),
+        hedge=True)
+    with _timed(url_config, 'route', 'geometry'):
+        return _route_result(parsed_json, geometry, output)
+
+
+async def table(coords_src, coords_dest=None,
+                ids_origin=None, ids_dest=None,
+                output='np', minutes=False, annotations='duration',
+                url_config=RequestConfig, send_as_polyline=True, client=None):
+    """
+    Coroutine wrapping OSRM 'table' function, see `osrm.table`.
+
+    Parameters
+    ----------
+    client : osrm.aio.Client, optional
+        The client to use to make the request (default: a Client shared
+        by all the coroutines running on the current event loop).
+    """
+    output = _table_output(output)
+    with _timed(url_config, 'table', 'url'):
+        url, compact = _table_request_url(
+            coords_src, coords_dest, annotations, url_config,
+            send_as_polyline)
+    parsed_json = await _send_request(
+        url, url_config, client,
+        _table_query(coords_src, coords_dest, annotations, compact),
+        _parse_response if output == 3 else _parse_table_response)
+    if compact:
+        parsed_json = _table_trim(parsed_json, coords_src, coords_dest)
+    with _timed(url_config, 'table', 'format'):
+        return _table_result(parsed_json, coords_src, coords_dest,
+                             ids_origin, ids_dest, output, minutes,
+                             annotations)
+
+
+async def nearest(coord, number=1, url_config=RequestConfig, client=None):
+    """
+    Coroutine wrapping OSRM 'nearest' function, see `osrm.nearest`.
+
+    Parameters
+    ----------
+    client : osrm.aio.Client, optional
+        The client to use to make the request (default: a Client shared
+        by all the coroutines running on the current event loop).
+    """
+    with _timed(url_config, 'nearest', 'url'):
+        url = _nearest_url(coord, number, url_config)
+    return await _send_request(
+        url, url_config, client, _nearest_query(coord, number), hedge=True)
+
+
+async def trip(coords, steps=False, output="full",
+               geometry='polyline', overview="simplified",
+               roundtrip=True, source="any", destination="any",
+               annotations="false", url_config=RequestConfig,
+               send_as_polyline=True, client=None):
+    """
+    Coroutine wrapping OSRM 'trip' function, see `osrm.trip`.
+
+    Parameters
+    ----------
+    client : osrm.aio.Client, optional
+        The client to use to make the request (default: a Client shared
+        by all the coroutines running on the current event loop).
+    """
+    geom_request = _geom_request(geometry)
+    with _timed(url_config, 'trip', 'url'):
+        url = _trip_url(coords, steps, geom_request, overview, roundtrip,
+                        source, destination, annotations, url_config,
+                        send_as_polyline)
+    parsed_json = await _send_request(
+        url, url_config, client,
+        _trip_query(coords, steps, geom_request, overview, roundtrip, source,
+                    destination, annotations))
+    with _timed(url_config, 'trip', 'geometry'):
+        return _trip_result(parsed_json, geometry, output)
@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+"""
+Batch queries, executed concurrently by a pool of workers.
+"""
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import threading
+import time
+import numpy as np
+
+from . import RequestConfig
+from .core import simple_route, match
+from .geometry import decode_polyline
+
+BatchResult = namedtuple("BatchResult", ("index", "result", "error"))
+MatchSegment = namedtuple(
+    "MatchSegment",
+    ("start", "stop", "tracepoints", "legs", "geometry", "error"))
+
+
+try:
+    _clock = time.perf_counter
+except AttributeError:
+    _clock = time.time
+
+
+class BatchStats:
+    """
+    Statistics (throughput and latency of the queries) of the batches
+    executed by `route_many` or `match_many`, when given as their
+    `stats` parameter.
+
+    Attributes
+    ----------
+    latencies : list of float
+        The duration (in seconds) of each query.
+    errors : int
+        The number of failed queries.
+    elapsed : float
+        The total duration (in seconds) of the batches.
+
+    Examples
+    --------
+    >>> stats = osrm.BatchStats()
+    >>> results = list(osrm.match_many(traces, workers=16, stats=stats))
+    >>> stats.summary()
+    {'count': 20000, 'errors': 12, 'elapsed': 95.2, 'throughput': 210.1,
+     'latency_mean': 0.076, 'latency_p50': 0.061, 'latency_p95': 0.168,
+     'latency_max': 1.254}
+    """
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def _record(self, latency, failed):
+        with self._lock:
+            self.latencies.append(latency)
+            self.errors += bool(failed)
+
+    def _timed(self, func):
+        """ Wrap `func` in order to record the duration of each call """
+        def timed_func(*args, **kwargs):
+            t0 = _clock()
+            failed = True
+            try:
+                result = func(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                self._record(_clock() - t0, failed)
+        return timed_func
+
+    def summary(self):
+        """
+        Return the number of queries, of errors, the total duration (in
+        seconds), the throughput (in queries per second) and the mean,
+        median, 95th percentile and maximum latency (in seconds) as a dict.
+        """
+        with self._lock:
+            latencies = np.array(self.latencies)
+            errors, elapsed = self.errors, self.elapsed
+        empty = not len(latencies)
+        return {
+            'count': len(latencies),
+            'errors': errors,
+            'elapsed': elapsed,
+            'throughput': len(latencies) / elapsed if elapsed else 0.0,
+            'latency_mean': 0.0 if empty else float(latencies.mean()),
+            'latency_p50': 0.0 if empty else float(np.percentile(latencies, 50)),
+            'latency_p95': 0.0 if empty else float(np.percentile(latencies, 95)),
+            'latency_max': 0.0 if empty else float(latencies.max()),
+            }
+
+
+class _AsyncExecutor:
+    """
+    Run coroutines from the `osrm.aio` module on an event loop living in
+    a background thread (at most `max_workers` at the same time, the others
+    waiting for their turn), exposing them as `concurrent.futures.Future`,
+    the duration of each call being given to `record`, if any.
+    """
+    def __init__(self, max_workers, record=None):
+        import asyncio
+        from .aio import _semaphore, _limited
+        self._asyncio = asyncio
+        self._limited = _limited
+        self._record = record
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        self._semaphore = asyncio.run_coroutine_threadsafe(
+            _semaphore(max_workers), self.loop).result()
+
+    def submit(self, func, *args, **kwargs):
+        return self._asyncio.run_coroutine_threadsafe(
+            self._limited(self._semaphore, func, args, kwargs, self._record),
+            self.loop)
+
+    def shutdown(self, wait=True):
+        from .aio import _default_clients
+        client = _default_clients.get(self.loop)
+        if client is not None:
+            self._asyncio.run_coroutine_threadsafe(
+                client.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+def _execute_many(func, args_iterable, workers, mode, ordered, stats=None):
+    """
+    Helper function calling `func` with each of the argument tuples of
+    `args_iterable` (at most `workers` calls being executed concurrently),
+    and yielding the results as `BatchResult` objects (the latency of
+    each call being recorded in `stats`, if any).
+    """
+    if mode == 'thread':
+        executor = ThreadPoolExecutor(max_workers=workers)
+        if stats is not None:
+            func = stats._timed(func)
+    else:
+        executor = _AsyncExecutor(
+            workers, None if stats is None else stats._record)
+
+    # Only keep a bounded number of pending queries, in order to consume the
+    # input lazily (it can be a generator of millions of items) :
+    max_pending = workers * 2
+    pending = deque()
+    args_iterable = enumerate(args_iterable)
+    exhausted = False
+    started = _clock()
+    try:
+        while True:
+            while not exhausted and len(pending) < max_pending:
+                try:
+                    i, (args, kwargs) = next(args_iterable)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.append((i, executor.submit(func, *args, **kwargs)))
+
+            if not pending:
+                break
+
+            if ordered:
+                done = [pending.popleft()]
+                done[0][1].exception()  # Wait for the first query to finish
+            else:
+                wait([fut for _, fut in pending], return_when=FIRST_COMPLETED)
+                done = [(i, fut) for i, fut in pending if fut.done()]
+                for item in done:
+                    pending.remove(item)
+
+            for i, fut in done:
+                err = fut.exception()
+                if err is not None:
+                    yield BatchResult(i, None, err)
+                else:
+                    yield BatchResult(i, fut.result(), None)
+    finally:
+        for _, fut in pending:
+            fut.cancel()
+        executor.shutdown(wait=True)
+        if stats is not None:
+            stats.elapsed += _clock() - started
+
+
+def route_many(pairs, workers=8, mode='thread', ordered=True,
+               url_config=RequestConfig, stats=None, **kwargs):
+    """
+    Function computing the routes between many origin/destination pairs,
+    sending the 'route' queries concurrently.
+
+    Parameters
+    ----------
+    pairs : iterable
+        An iterable (list, generator, etc.) of (origin, destination) or
+        (origin, destination, intermediates) tuples, where origin and
+        destination are (x, y) coordinates and intermediates is a list of
+        (x, y) coordinates. It is consumed lazily.
+    workers : int, optional
+        The number of concurrent queries (default: 8).
+    mode : str, optional
+        Either 'thread' to send the queries from a pool of threads
+        or 'async' to send them from an asyncio event loop running in a
+        background thread (default: 'thread').
+    ordered : bool, optional
+        Whether to yield the results in the order of `pairs` (default: True)
+        or in the order of completion of the queries.
+    url_config : osrm.RequestConfig, optional
+        Parameters regarding the host, version and profile to use (attaching
+        a `osrm.Session` to it is recommended in 'thread' mode, in order
+        to reuse the connections).
+    stats : osrm.BatchStats, optional
+        An object in which to record the latency of the queries.
+    **kwargs
+        Other parameters to use for each query
+        (see the parameters of `osrm.simple_route`).
+
+    Returns
+    -------
+    results : generator
+        A generator of `BatchResult` named tuples (index, result, error)
+        where `index` is the position of the pair in `pairs`, `result` is
+        the value which would have been returned by `osrm.simple_route`
+        (or None if the query failed) and `error` is the exception raised
+        by the query (or None if it succeeded).
+        A failed query doesn't interrupt the batch.
+
+    Examples
+    --------
+    >>> pairs = [((13.38, 52.51), (10.00, 53.55)),
+    ...          ((13.38, 52.51), (9.73, 52.37))]
+    >>> for res in osrm.route_many(pairs, output="routes", overview="false"):
+    ...     if res.error is None:
+    ...         print(res.index, res.result[0]["duration"])
+    """
+    if mode == 'async':
+        from .aio import simple_route as func
+    elif mode == 'thread':
+        func = simple_route
+    else:
+        raise ValueError("Invalid mode (should be 'thread' or 'async')")
+
+    def args_iterable():
+        for pair in pairs:
+            kw = dict(kwargs, url_config=url_config)
+            if len(pair) > 2:
+                kw["coord_intermediate"] = pair[2]
+            yield (pair[0], pair[1]), kw
+
+    return _execute_many(func, args_iterable(), workers, mode, ordered, stats)
+
+
+def match_many(traces, workers=8, mode='thread', ordered=True,
+               url_config=RequestConfig, stats=None, **kwargs):
+    """
+    Function map-matching many GPS traces, sending the 'match'
+    queries concurrently.
+
+    Parameters
+    ----------
+    traces : iterable
+        An iterable (list, generator, etc.) of traces, each trace being a
+        list of (x, y), (x, y, timestamp) or (x, y, timestamp, radius)
+        tuples. It is consumed lazily.
+    workers : int, optional
+        The number of concurrent queries (default: 8).
+    mode : str, optional
+        Either 'thread' or 'async' (default: 'thread'), see `route_many`.
+    ordered : bool, optional
+        Whether to yield the results in the order of `traces` (default: True)
+        or in the order of completion of the queries.
+    url_config : osrm.RequestConfig, optional
+        Parameters regarding the host, version and profile to use.
+    stats : osrm.BatchStats, optional
+        An object in which to record the latency of the queries.
+    **kwargs
+        Other parameters to use for each query
+        (see the parameters of `osrm.match`).
+
+    Returns
+    -------
+    results : generator
+        A generator of `BatchResult` named tuples (index, result, error)
+        where `result` is the value which would have been returned by
+        `osrm.match` for the trace at position `index` in `traces`.
+
+    Examples
+    --------
+    >>> stats = osrm.BatchStats()
+    >>> for res in osrm.match_many(traces, workers=16, stats=stats):
+    ...     if res.error is None:
+    ...         print(res.index, res.result["matchings"][0]["confidence"])
+    >>> stats.summary()["throughput"]
+    """
+    if mode == 'async':
+        from .aio import match as func
+    elif mode == 'thread':
+        func = match
+    else:
+        raise ValueError("Invalid mode (should be 'thread' or 'async')")
+
+    def args_iterable():
+        for trace in traces:
+            kw = dict(kwargs, url_config=url_config)
+            if len(trace) and len(trace[0]) > 2:
+                kw["timestamps"] = [pt[2] for pt in trace]
+            if len(trace) and len(trace[0]) > 3:
+                kw["radius"] = [pt[3] for pt in trace]
+            yield ([pt[:2] for pt in trace], ), kw
+
+    return _execute_many(func, args_iterable(), workers, mode, ordered, stats)
+
+
+def match_stream(trace, chunk_size=100, overlap=10, workers=4, ordered=True,
+                 annotations="false", gaps="split", tidy=False,
+                 url_config=RequestConfig):
+    """
+    Function map-matching a (long) GPS trace, split in overlapping windows
+    of `chunk_size` points which are sent concurrently to the OSRM 'match'
+    service, and yielding the matched segments as the queries complete.
+
+    Each point of the trace belongs to exactly one segment (the overlap
+    between two windows being split in its middle) and the legs of the
+    segments follow each other, so that the matching of the whole trace is
+    the concatenation of the segments.
+
+    Parameters
+    ----------
+    trace : iterable
+        An iterable (list, generator, etc.) of (x, y), (x, y, timestamp) or
+        (x, y, timestamp, radius) tuples. It is consumed lazily.
+    chunk_size : int, optional
+        The number of points of each window, which should be lower than the
+        `max-matching-size` of the OSRM instance (default: 100).
+    overlap : int, optional
+        The number of points shared by two consecutive windows (at least 1,
+        to link the segments, and preferably a few more, to give some
+        context to the matching of their boundary) (default: 10).
+    workers : int, optional
+        The number of concurrent queries (default: 4).
+    ordered : bool, optional
+        Whether to yield the segments in the order of the trace
+        (default: True) or in the order of completion of the queries.
+    annotations : str, optional
+        The annotations of the legs (like "duration,nodes"), see `osrm.match`
+        (default: "false").
+    gaps : str, optional
+        See `osrm.match` (default: "split").
+    tidy : bool, optional
+        See `osrm.match` (default: False).
+    url_config : osrm.RequestConfig, optional
+        Parameters regarding the host, version and profile to use.
+
+    Returns
+    -------
+    segments : generator
+        A generator of `MatchSegment` named tuples (start, stop, tracepoints,
+        legs, geometry, error) where `start` and `stop` are the indexes of the
+        points of the trace covered by the segment, `tracepoints` the
+        matched points (None for the points which couldn't be matched),
+        `legs` the legs (distance, duration, etc.) starting from these
+        points, `geometry` the lines followed by these legs, as a list of
+        (N, 2) arrays (a new line starting after each gap in the matching),
+        and `error` the exception raised by the query (or None).
+
+    Examples
+    --------
+    >>> for segment in osrm.match_stream(gps_fixes, chunk_size=500):
+    ...     if segment.error is None:
+    ...         distance += sum(leg["distance"] for leg in segment.legs)
+    """
+    if not 0 < overlap < chunk_size:
+        raise ValueError("`overlap` should be between 1 and `chunk_size` - 1")
+
+    def args_iterable():
+        for start, points, last in _match_windows(trace, chunk_size, overlap):
+            lo = 0 if start == 0 else overlap // 2
+            hi = len(points) if last else len(points) - overlap + overlap // 2
+            yield ((points, start, lo, hi, annotations, gaps, tidy,
+                    url_config), {})
+
+    return (res.result for res in _execute_many(
+        _match_segment, args_iterable(), workers, 'thread', ordered))
+
+
+def _match_windows(trace, chunk_size, overlap):
+    """
+    Helper function yielding the (start, points, is_last) windows
+    of `chunk_size` points of `trace`, overlapping by `overlap` points
+    """
+    window, pending, start = [], None, 0
+    for point in trace:
+        if pending is not None:
+            yield pending[0], pending[1], False
+            pending = None
+        window.append(point)
+        if len(window) == chunk_size:
+            pending = (start, window)
+            window = window[chunk_size - overlap:]
+            start += chunk_size - overlap
+    if pending is not None:
+        yield pending[0], pending[1], True
+    elif len(window) > (overlap if start else 0):
+        yield start, window, True
+
+
+def _match_segment(points, start, lo, hi, annotations, gaps, tidy,
+                   url_config):
+    """
+    Helper function matching a window of a trace and returning the
+    `MatchSegment` made of its points between `lo` and `hi`
+    """
+    try:
+        coords = [pt[:2] for pt in points]
+        timestamps = [pt[2] for pt in points] if len(points[0]) > 2 else None
+        radius = [pt[3] for pt in points] if len(points[0]) > 3 else None
+        r_json = match(coords, steps=True, overview="false",
+                       timestamps=timestamps, radius=radius,
+                       annotations=annotations, gaps=gaps, tidy=tidy,
+                       url_config=url_config)
+        if r_json.get("code") != "Ok":
+            raise ValueError('Error - OSRM status : {}'.format(
+                r_json.get("code")))
+    except Exception as err:
+        return MatchSegment(start + lo, start + hi, None, None, None, err)
+
+    tracepoints = r_json["tracepoints"][lo:hi]
+    legs, geometry, previous = [], [], None
+    for tracepoint in tracepoints:
+        if tracepoint is None:
+            continue
+        m, w = tracepoint["matchings_index"], tracepoint["waypoint_index"]
+        matching_legs = r_json["matchings"][m]["legs"]
+        if w >= len(matching_legs):
+            continue
+        leg = matching_legs[w]
+        line = _steps_line(leg.pop("steps", []))
+        # The lines of consecutive legs are joined, until a gap :
+        if previous == (m, w - 1) and geometry:
+            geometry[-1] = np.concatenate((geometry[-1], line[1:]))
+        else:
+            geometry.append(line)
+        legs.append(leg)
+        previous = (m, w)
+
+    return MatchSegment(start + lo, start + hi, tracepoints, legs,
+                        geometry, None)
+
+
+def _steps_line(steps):
+    """ Helper function to join the (encoded) geometries of the steps """
+    lines = [decode_polyline(step["geometry"]) for step in steps]
+    if not lines:
+        return np.empty((0, 2))
+    return np.concatenate([lines[0]] + [line[1:] for line in lines[1:]])
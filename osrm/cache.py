@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""
+Caches of the responses of the OSRM instance (in memory)
+and of the computed matrices (on disk).
+"""
+from collections import namedtuple, OrderedDict
+import threading
+import time
+import numpy as np
+
+try:
+    _clock = time.monotonic
+except AttributeError:
+    _clock = time.time
+
+CacheInfo = namedtuple("CacheInfo", ("hits", "misses", "maxsize", "currsize"))
+
+
+def _hashable(value):
+    """ Helper function to convert the lists of a query option to tuples """
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(v) for v in value)
+    return value
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache, with an optional time-to-live, of the responses
+    returned by the OSRM instance.
+
+    Once attached to a RequestConfig object (through its `cache` attribute),
+    the responses to the queries made by `match`, `simple_route`, `table`,
+    `nearest` and `trip` with this config are stored, using as key the
+    service, the profile, the coordinates (rounded to `precision` decimals)
+    and the options of the query.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        The maximum number of responses to keep, the least recently used
+        being evicted first (default: 1024).
+    ttl : float, optional
+        The number of seconds after which a stored response expires
+        (default: None, ie. responses don't expire).
+    precision : int, optional
+        The number of decimals to which the coordinates are rounded
+        in the keys (default: 5, like in encoded polylines).
+
+    Attributes
+    ----------
+    hits : int
+        The number of queries answered from the cache.
+    misses : int
+        The number of queries sent to the OSRM instance.
+    data_version : str
+        The last 'data_version' seen in a response (if the OSRM instance
+        provides it). A response with a different value (ie. the dataset
+        was reloaded) clears the cache.
+
+    Examples
+    --------
+    >>> MyConfig = osrm.RequestConfig("localhost:5000/v1/driving",
+    ...                               cache=osrm.ResponseCache(10000, ttl=3600))
+    >>> result = osrm.simple_route(p1, p2, url_config=MyConfig)
+    >>> MyConfig.cache.info()
+    CacheInfo(hits=0, misses=1, maxsize=10000, currsize=1)
+    """
+    def __init__(self, maxsize=1024, ttl=None, precision=5):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.precision = precision
+        self.hits = 0
+        self.misses = 0
+        self.data_version = None
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def make_key(self, url_config, service, coords, options):
+        """
+        Build the key of a query.
+
+        Parameters
+        ----------
+        url_config : osrm.RequestConfig
+            The config used for the query.
+        service : str
+            The name of the OSRM service ('route', 'table', etc.).
+        coords : list
+            The coordinates of the query, as (x, y) tuples.
+        options : tuple
+            The other parameters of the query.
+
+        Returns
+        -------
+        key : tuple
+        """
+        precision = self.precision
+        return (
+            service, url_config.host, url_config.version, url_config.profile,
+            tuple([(round(float(c[0]), precision), round(float(c[1]), precision))
+                   for c in coords]),
+            _hashable(options)
+            )
+
+    def get(self, key):
+        """
+        Return the response stored for `key` (or None if there is no
+        such response or if it expired).
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self.ttl is not None \
+                    and _clock() - entry[0] > self.ttl:
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data[key] = self._data.pop(key)  # Most recently used
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, content, data_version=None):
+        """
+        Store the (bytes) response `content` for `key`, clearing the cache
+        first if `data_version` differs from the one of the stored responses.
+        """
+        with self._lock:
+            if data_version is not None and data_version != self.data_version:
+                self._data.clear()
+                self.data_version = data_version
+            self._data.pop(key, None)
+            self._data[key] = (_clock(), content)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove all the stored responses (to be used when the dataset of the
+        OSRM instance is reloaded) and reset the counters.
+        """
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """ Return the statistics of the cache as a `CacheInfo` tuple """
+        with self._lock:
+            return CacheInfo(self.hits, self.misses,
+                             self.maxsize, len(self._data))
+
+
+def _coords_keys(coords):
+    """
+    Helper function to identify each (x, y) coordinate (rounded to 5 decimals)
+    by an integer
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    x = np.round(coords[:, 0] * 1e5).astype(np.int64) + 18000000
+    y = np.round(coords[:, 1] * 1e5).astype(np.int64) + 9000000
+    return (x << 32) | y
+
+
+class MatrixCache:
+    """
+    Persistent cache (stored in a SQLite database) of the values of the
+    matrices computed by `osrm.table`, allowing to only query the OSRM
+    instance for the parts of a matrix which weren't already computed.
+
+    The values are stored by source, for each destination, along with the
+    snapped location of each coordinate, and are identified by the
+    profile of the query, its annotations and the `dataset_version`.
+
+    Parameters
+    ----------
+    path : str
+        The path of the SQLite database to use (created if needed).
+    dataset_version : str, optional
+        The version of the dataset used by the OSRM instance (like the date of
+        the OSM extract). Values computed with another version are ignored
+        (default: '').
+
+    Examples
+    --------
+    >>> cache = osrm.MatrixCache("/data/matrices.sqlite", "2019-02-01")
+    >>> durations, snapped_src, snapped_dest = osrm.table(
+    ...     stores, customers, matrix_cache=cache, tile_size=500)
+    """
+    def __init__(self, path, dataset_version=''):
+        import sqlite3
+        self.path = path
+        self.dataset_version = dataset_version
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS matrix_rows (ns TEXT, src INTEGER,"
+                " dests BLOB, vals BLOB, PRIMARY KEY (ns, src))")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS locations (ns TEXT, key INTEGER,"
+                " x REAL, y REAL, PRIMARY KEY (ns, key))")
+
+    def _namespace(self, url_config, annotations=None):
+        return '|'.join([url_config.profile, str(self.dataset_version)]
+                        + ([annotations] if annotations else []))
+
+    def _select(self, table, columns, ns, column, keys):
+        """ Helper method to fetch the rows of `table` for many `keys` """
+        keys = [int(k) for k in set(keys.tolist())]
+        result = []
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i+500]
+            result.extend(self._conn.execute(
+                "SELECT {} FROM {} WHERE ns = ? AND {} IN ({})".format(
+                    columns, table, column, ','.join('?' * len(chunk))),
+                [ns] + chunk).fetchall())
+        return result
+
+    def get(self, url_config, annotations, coords_src, coords_dest):
+        """
+        Get the values of a matrix stored in the cache.
+
+        Parameters
+        ----------
+        url_config : osrm.RequestConfig
+            The config used to query the OSRM instance.
+        annotations : str
+            Either 'duration' or 'distance'.
+        coords_src : list
+            The coordinates of the sources, as (x, y) tuples.
+        coords_dest : list
+            The coordinates of the destinations, as (x, y) tuples.
+
+        Returns
+        -------
+        values : numpy.ndarray
+            The (float) matrix of values (NaN if missing).
+        found : numpy.ndarray
+            The boolean matrix telling which values were in the cache.
+        """
+        src_keys = _coords_keys(coords_src)
+        dest_keys = _coords_keys(coords_dest)
+        values = np.full((len(src_keys), len(dest_keys)), np.nan)
+        found = np.zeros(values.shape, dtype=bool)
+        with self._lock:
+            rows = self._select('matrix_rows', 'src, dests, vals',
+                                self._namespace(url_config, annotations),
+                                'src', src_keys)
+        rows = {src: (np.frombuffer(dests, dtype=np.int64),
+                      np.frombuffer(vals, dtype=np.float64))
+                for src, dests, vals in rows}
+        for i, src in enumerate(src_keys.tolist()):
+            if src not in rows or not len(rows[src][0]):
+                continue
+            keys, vals = rows[src]
+            pos = np.minimum(np.searchsorted(keys, dest_keys), len(keys) - 1)
+            found[i] = keys[pos] == dest_keys
+            values[i, found[i]] = vals[pos[found[i]]]
+        return values, found
+
+    def put(self, url_config, annotations, coords_src, coords_dest, values):
+        """
+        Store the (float) matrix of `values` between `coords_src`
+        and `coords_dest` (see the parameters of `MatrixCache.get`).
+        """
+        src_keys = _coords_keys(coords_src)
+        dest_keys = _coords_keys(coords_dest)
+        if not len(dest_keys):
+            return
+        values = np.asarray(values, dtype=np.float64)
+        ns = self._namespace(url_config, annotations)
+        with self._lock, self._conn:
+            rows = {src: (np.frombuffer(dests, dtype=np.int64),
+                          np.frombuffer(vals, dtype=np.float64))
+                    for src, dests, vals in self._select(
+                        'matrix_rows', 'src, dests, vals', ns, 'src', src_keys)}
+            for i, src in enumerate(src_keys.tolist()):
+                keys, vals = rows.get(src, (dest_keys[:0], values[i, :0]))
+                # The new values (placed first) replace the previous ones :
+                keys = np.concatenate((dest_keys[::-1], keys))
+                vals = np.concatenate((values[i, ::-1], vals))
+                keys, idx = np.unique(keys, return_index=True)
+                rows[src] = (keys, vals[idx])
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO matrix_rows VALUES (?, ?, ?, ?)",
+                [(ns, src, keys.tobytes(), vals.tobytes())
+                 for src, (keys, vals) in rows.items()])
+
+    def get_locations(self, url_config, coords):
+        """
+        Get the snapped locations of `coords` (as [x, y] lists, or None
+        for the coordinates which aren't in the cache).
+        """
+        keys = _coords_keys(coords)
+        with self._lock:
+            locations = {key: [x, y] for key, x, y in self._select(
+                'locations', 'key, x, y', self._namespace(url_config),
+                'key', keys)}
+        return [locations.get(key) for key in keys.tolist()]
+
+    def put_locations(self, url_config, coords, locations):
+        """ Store the snapped `locations` of `coords` """
+        ns = self._namespace(url_config)
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO locations VALUES (?, ?, ?, ?)",
+                [(ns, key, loc[0], loc[1]) for key, loc
+                 in zip(_coords_keys(coords).tolist(), locations)
+                 if loc is not None])
+
+    def clear(self):
+        """ Remove all the values stored in the cache """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM matrix_rows")
+            self._conn.execute("DELETE FROM locations")
+
+    def close(self):
+        """ Close the connection to the database """
+        self._conn.close()
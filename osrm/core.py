@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
 import numpy as np
-from polyline.codec import PolylineCodec
 from polyline import encode as polyline_encode
-from pandas import DataFrame
 from . import RequestConfig
+from .geometry import decode_polyline, line_to_wkb, line_to_wkt
+from .hosts import _clock
+from .session import (
+    _Abort, _abortable_urlopen, _aborted, _sleep, _watch, _watched)
 
 try:
     from urllib.request import urlopen, Request
@@ -12,12 +14,22 @@ except:
     from urllib2 import urlopen, Request
     from urllib2 import quote
 
-try:
-    from osgeo.ogr import Geometry
-except:
-    from ogr import Geometry
-
 import json
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+TableResult = namedtuple(
+    "TableResult", ("durations", "distances", "sources", "destinations"))
+MatchColumns = namedtuple(
+    "MatchColumns",
+    ("coords", "offsets", "confidences", "distances", "durations",
+     "matchings_index", "waypoint_index", "locations"))
+
+# Threads sending the hedged requests (created when first needed) :
+_HEDGE_EXECUTOR = None
+_HEDGE_LOCK = threading.Lock()
 
 
 def _chain(*lists):
@@ -38,11 +50,299 @@ def check_host(host):
         return host
 
 
+def _send_request(url, url_config, query=None, parse=None, hedge=False):
+    """
+    Helper function to query the OSRM instance (through the keep-alive
+    connections of `url_config.session` if any) and parse its JSON response
+    (with `parse`, default: `_parse_response`), `query` being the
+    (service, coordinates, options) tuple identifying the request
+    in the cache of `url_config` (if any). The request can be hedged
+    (see `osrm.HostPool`) if `hedge` is True
+    """
+    parse = parse or _parse_response
+    cache, key, content = _cache_lookup(url_config, query)
+    if content is not None:
+        return parse(content)
+    service = query[0] if query else None
+    pool = getattr(url_config, 'hosts', None)
+    try:
+        with _timed(url_config, service, 'network'):
+            if pool is None:
+                content = _fetch(url, url_config)
+            elif hedge and pool.hedge is not None:
+                content = _fetch_hedged(url, url_config, pool)
+            else:
+                content = _fetch_failover(url, url_config, pool)
+    except Exception as err:
+        _record_response(url_config, service,
+                         getattr(err, 'code', None) or type(err).__name__)
+        raise
+    with _timed(url_config, service, 'parse'):
+        parsed_json = parse(content)
+    _record_response(url_config, service, parsed_json.get("code"), len(content))
+    _cache_store(cache, key, content, parsed_json)
+    return parsed_json
+
+
+@contextmanager
+def _timed(url_config, service, stage):
+    """
+    Helper context manager recording the duration of a `stage` of a query
+    in the metrics of `url_config` (if any, see `osrm.Metrics`)
+    """
+    metrics = getattr(url_config, 'metrics', None)
+    if metrics is None:
+        yield
+        return
+    start = _clock()
+    yield
+    metrics.observe(service, url_config.profile, stage, _clock() - start)
+
+
+def _record_response(url_config, service, status, size=None):
+    """
+    Helper function to record the status and the size of a response
+    in the metrics of `url_config` (if any)
+    """
+    metrics = getattr(url_config, 'metrics', None)
+    if metrics is not None:
+        metrics.record_response(service, url_config.profile, status, size)
+
+
+def _fetch(url, url_config):
+    """ Helper function to send a request and to read its (bytes) response """
+    req = Request(url)
+    if url_config.auth:
+        req.add_header("Authorization", url_config.auth)
+    session = getattr(url_config, 'session', None)
+    if session is not None:
+        rep = session.open(req)
+    elif _watched():
+        rep = _abortable_urlopen(req)
+    else:
+        rep = urlopen(req)
+    return rep.read()
+
+
+def _fetch_failover(url, url_config, pool, exclude=(), hosts=None):
+    """
+    Helper function to send a request to one of the hosts of `pool` (an
+    `osrm.HostPool`), retrying it on another host (after a backoff) when
+    the host fails. The hosts of `exclude` are avoided (if possible) and
+    the hosts used are appended to `hosts` (if any)
+    """
+    tried = list(exclude)
+    for attempt in range(pool.retries + 1):
+        host = pool.acquire(tried)
+        if hosts is not None:
+            hosts.append(host)
+        try:
+            content = _fetch(_switch_host(url, url_config, host), url_config)
+        except Exception as err:
+            # An interrupted request (see `_fetch_hedged`) isn't a failure :
+            failed = pool.is_failure(err) and not _aborted()
+            pool.release(host, failed)
+            if not failed or attempt == pool.retries:
+                raise
+            tried.append(host)
+            _sleep(pool.delay(attempt))
+            if _aborted():
+                raise
+        else:
+            pool.release(host, False)
+            return content
+
+
+def _fetch_hedged(url, url_config, pool):
+    """
+    Helper function to send a request to one of the hosts of `pool` (from
+    the calling thread) and, if it's still without response after
+    `pool.hedge_delay()` seconds, to another host (from the threads of
+    `_hedge_executor`), the first response being returned : the first
+    request is interrupted if the hedged one wins, and the hedged one is
+    interrupted if the first one wins
+    """
+    start = _clock()
+    delay = pool.hedge_delay()
+    if delay is None:
+        content = _fetch_failover(url, url_config, pool)
+        pool.record_latency(_clock() - start)
+        pool.record_hedge(False, False)
+        return content
+
+    abort, hedge_abort = _Abort(), _Abort()
+    first_hosts = []
+    finished = threading.Event()
+    sent = threading.Event()
+    lock = threading.Lock()
+    won = []
+
+    def hedge():
+        if finished.wait(delay):
+            return
+        with lock:
+            # The first request may have finished meanwhile :
+            if finished.is_set():
+                return
+            sent.set()
+        with _watch(hedge_abort):
+            content = _fetch_failover(
+                url, url_config, pool, exclude=first_hosts)
+        with lock:
+            if not finished.is_set():
+                won.append(content)
+                abort.abort()
+        return content
+
+    hedged = _hedge_executor().submit(hedge)
+    error = None
+    try:
+        with _watch(abort):
+            content = _fetch_failover(url, url_config, pool, hosts=first_hosts)
+    except Exception as err:
+        error = err
+    with lock:
+        finished.set()
+    # The latency of the first request is recorded even if it lost
+    # (its duration until then being a lower bound) :
+    if error is None or won:
+        pool.record_latency(_clock() - start)
+    if won or error is None:
+        if not won:
+            hedge_abort.abort()
+        pool.record_hedge(sent.is_set(), bool(won))
+        return won[0] if won else content
+
+    # The first request failed, the hedged one (if sent) may still succeed :
+    if hedged.cancel() or not sent.is_set():
+        raise error
+    try:
+        content = hedged.result()
+    except Exception:
+        raise error
+    pool.record_hedge(True, True)
+    return content
+
+
+def _hedge_executor():
+    """
+    Helper function returning the pool of threads sending the hedged requests
+    """
+    global _HEDGE_EXECUTOR
+    with _HEDGE_LOCK:
+        if _HEDGE_EXECUTOR is None:
+            _HEDGE_EXECUTOR = ThreadPoolExecutor(max_workers=64)
+        return _HEDGE_EXECUTOR
+
+
+def _switch_host(url, url_config, host):
+    """
+    Helper function to send to `host` a `url` built for `url_config.host`
+    """
+    base = check_host(url_config.host)
+    if not url.startswith(base):
+        return url
+    return ''.join([check_host(host), url[len(base):]])
+
+
+def _cache_lookup(url_config, query):
+    """
+    Helper function returning the cache of `url_config`, the key of `query`
+    and the response stored for this key (or None)
+    """
+    cache = getattr(url_config, 'cache', None)
+    if cache is None or query is None:
+        return None, None, None
+    key = cache.make_key(url_config, *query)
+    return cache, key, cache.get(key)
+
+
+def _cache_store(cache, key, content, parsed_json):
+    """ Helper function to store a successful response in the cache """
+    if cache is not None and parsed_json.get("code") == "Ok":
+        cache.put(key, content, parsed_json.get("data_version"))
+
+
+def set_json_backend(backend=None):
+    """
+    Set the library used to parse the JSON responses of the OSRM instance.
+
+    Parameters
+    ----------
+    backend : str or callable, optional
+        Either 'orjson', 'ujson', 'json' (the standard library) or a function
+        parsing the (bytes) body of a response (default: None, ie. the fastest
+        of the installed libraries).
+
+    Returns
+    -------
+    name : str
+        The name of the library used.
+    """
+    global _json_loads
+    if callable(backend):
+        _json_loads = backend
+        return getattr(backend, '__module__', None) or repr(backend)
+    if backend not in (None, 'orjson', 'ujson', 'json'):
+        raise ValueError("Invalid JSON backend (should be 'orjson', 'ujson', "
+                         "'json' or a function)")
+    for name in ('orjson', 'ujson'):
+        if backend in (None, name):
+            try:
+                _json_loads = __import__(name).loads
+                return name
+            except ImportError:
+                if backend is not None:
+                    raise
+    _json_loads = lambda content: json.loads(content.decode('utf-8'))
+    return 'json'
+
+
+def _parse_response(content):
+    """ Helper function to parse the (bytes) body of a response from OSRM """
+    return _json_loads(content)
+
+
+def _parse_table_response(content):
+    """
+    Helper function to parse the (bytes) body of a 'table' response, the
+    'durations' and 'distances' matrices being read directly in float arrays
+    (with NaN for the missing values) instead of nested lists
+    """
+    matrices = {}
+    for name in (b'durations', b'distances'):
+        start = content.find(b''.join([b'"', name, b'":[[']))
+        if start < 0:
+            continue
+        start += len(name) + 3
+        end = content.index(b']]', start) + 2
+        matrices[name.decode()] = _parse_matrix(content[start:end])
+        content = b''.join([content[:start], b'null', content[end:]])
+    parsed_json = _parse_response(content)
+    parsed_json.update(matrices)
+    return parsed_json
+
+
+def _parse_matrix(text):
+    """
+    Helper function to parse a JSON matrix of numbers (or nulls), like
+    b'[[0,12.5],[null,0]]', in a 2-D float array
+    """
+    n_rows = text.count(b'],[') + 1
+    values = text[2:-2].replace(b'],[', b',').replace(b'null', b'nan')
+    return np.fromstring(values, sep=',').reshape(n_rows, -1)
+
+
+set_json_backend()
+
+
 def match(points, steps=False, overview="simplified", geometry="polyline",
           timestamps=None, radius=None, annotations="false", gaps="split",
-          tidy=False, waypoints=None, url_config=RequestConfig):
+          tidy=False, waypoints=None, url_config=RequestConfig,
+          output="full"):
     """
     Function wrapping OSRM 'match' function, returning the reponse in JSON
+    (with the geometries decoded in WKT or WKB if needed) or as arrays
 
     Parameters
     ----------
@@ -65,12 +365,42 @@ def match(points, steps=False, overview="simplified", geometry="polyline",
     waypoints : list of tuple/list of point, optional
     url_config : osrm.RequestConfig, optional
         Parameters regarding the host, version and profile to use
+    output : str, optional
+        Either "full" (default) for the response of the OSRM instance or
+        "columnar" for a `MatchColumns` named tuple of arrays.
 
     Returns
     -------
-    dict
-        The response from the osrm instance, parsed as a dict
+        - if output=='full' : a dict, the response from the osrm instance,
+                              with the geometries in the format defined
+                              in `geometry`.
+        - if output=='columnar' : a `MatchColumns` named tuple made of the
+            coordinates of all the matchings (concatenated in a (N, 2)
+            array), the `offsets` of the coordinates of each matching
+            in this array (the coordinates of the matching i being
+            coords[offsets[i]:offsets[i+1]]), the confidences, distances and
+            durations of the matchings, and, for each point, its
+            matchings_index, waypoint_index (-1 if the point wasn't matched)
+            and matched location (NaN if not matched).
     """
+    if output not in ("full", "columnar"):
+        raise ValueError("Invalid output (should be 'full' or 'columnar')")
+    geom_request = _geom_request(geometry)
+    with _timed(url_config, 'match', 'url'):
+        url = _match_url(points, steps, overview, geom_request, timestamps,
+                         radius, annotations, gaps, tidy, waypoints,
+                         url_config)
+    r_json = _send_request(
+        url, url_config,
+        _match_query(points, steps, overview, geom_request, timestamps,
+                     radius, annotations, gaps, tidy, waypoints))
+    with _timed(url_config, 'match', 'geometry'):
+        return _match_result(r_json, geometry, output)
+
+
+def _match_url(points, steps, overview, geometry, timestamps, radius,
+               annotations, gaps, tidy, waypoints, url_config):
+    """ Helper function to build the url of a 'match' query """
     host = check_host(url_config.host)
 
     url = [
@@ -90,25 +420,72 @@ def match(points, steps=False, overview="simplified", geometry="polyline",
     if waypoints:
         url.append("&waypoints=")
         url.append(";".join([str(waypoint) for waypoint in waypoints]))
+    return "".join(url)
 
-    req = Request("".join(url))
-    if url_config.auth:
-        req.add_header("Authorization", url_config.auth)
-    r = urlopen(req)
-    r_json = json.loads(r.read().decode('utf-8'))
-    if "code" not in r_json or "Ok" not in r_json["code"]:
-        if 'matchings' in r_json.keys():
-            for i, _ in enumerate(r_json['matchings']):
-                geom_encoded = r_json["matchings"][i]["geometry"]
-                geom_decoded = [[point[1] / 10.0,
-                                 point[0] / 10.0] for point
-                                in PolylineCodec().decode(geom_encoded)]
-                r_json["matchings"][i]["geometry"] = geom_decoded
-        else:
-            print('No matching geometry to decode')
+
+def _match_query(points, steps, overview, geometry, timestamps, radius,
+                 annotations, gaps, tidy, waypoints):
+    """ Helper function to identify a 'match' query in the cache """
+    return ('match', points, (steps, overview, geometry, timestamps, radius,
+                              annotations, gaps, tidy, waypoints))
+
+
+def _match_result(r_json, geometry="polyline", output="full"):
+    """
+    Helper function to convert the geometries of a 'match' response
+    in the format defined in `geometry`, or the response to arrays
+    """
+    if output == "columnar":
+        return _match_columns(r_json)
+    if "Ok" in r_json.get("code", "") \
+            and geometry.lower() not in ("polyline", "geojson"):
+        func = _geom_converter(geometry)
+        for matching in r_json.get("matchings", []):
+            if "geometry" in matching:
+                matching["geometry"] = func(matching["geometry"])
     return r_json
 
 
+def _match_columns(r_json):
+    """
+    Helper function to convert a 'match' response to a `MatchColumns`
+    named tuple of arrays
+    """
+    if "Ok" not in r_json.get("code", ""):
+        raise ValueError(
+            'Error - OSRM status : {} \n Full json reponse : {}'.format(
+                r_json.get("code"), r_json))
+    matchings = r_json.get("matchings", [])
+    lines = [_line_coords(matching.get("geometry")) for matching in matchings]
+    offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(line) for line in lines])
+    tracepoints = r_json.get("tracepoints", [])
+    return MatchColumns(
+        np.concatenate(lines) if lines else np.empty((0, 2)),
+        offsets,
+        np.array([m.get("confidence", np.nan) for m in matchings], dtype=float),
+        np.array([m.get("distance", np.nan) for m in matchings], dtype=float),
+        np.array([m.get("duration", np.nan) for m in matchings], dtype=float),
+        np.array([-1 if tp is None else tp["matchings_index"]
+                  for tp in tracepoints], dtype=np.int64),
+        np.array([-1 if tp is None else tp["waypoint_index"]
+                  for tp in tracepoints], dtype=np.int64),
+        np.array([(np.nan, np.nan) if tp is None else tp["location"]
+                  for tp in tracepoints], dtype=float).reshape(-1, 2))
+
+
+def _line_coords(geometry):
+    """
+    Helper function returning the coordinates of an (encoded polyline
+    or GeoJSON) geometry as an (N, 2) array
+    """
+    if geometry is None:
+        return np.empty((0, 2))
+    elif isinstance(geometry, dict):
+        return np.asarray(geometry["coordinates"], dtype=float).reshape(-1, 2)
+    return decode_polyline(geometry)
+
+
 def decode_geom(encoded_polyline):
     """
     Function decoding an encoded polyline (with 'encoded polyline
@@ -124,11 +501,25 @@ def decode_geom(encoded_polyline):
     line : ogr.Geometry
         The line geometry, as an ogr.Geometry instance.
     """
-    ma_ligne = Geometry(2)
-    lineAddPts = ma_ligne.AddPoint_2D
-    for coord in PolylineCodec().decode(encoded_polyline):
-        lineAddPts(coord[1], coord[0])
-    return ma_ligne
+    # GDAL is only needed (and loaded) here :
+    try:
+        from osgeo.ogr import Geometry
+    except ImportError:
+        try:
+            from ogr import Geometry
+        except ImportError:
+            raise ImportError("GDAL/OGR is required by `decode_geom`")
+    return Geometry(wkb=line_to_wkb(decode_polyline(encoded_polyline)))
+
+
+def _geom_converter(geometry):
+    """
+    Helper function returning the function converting an encoded polyline
+    to the (WKT or WKB) format defined in `geometry`
+    """
+    encode = line_to_wkb if geometry.lower() in ('wkb', 'well-known-binary') \
+        else line_to_wkt
+    return lambda encoded_polyline: encode(decode_polyline(encoded_polyline))
 
 def simple_route(coord_origin, coord_dest, coord_intermediate=None,
                  alternatives=False, steps=False, output="full",
@@ -170,13 +561,38 @@ def simple_route(coord_origin, coord_dest, coord_intermediate=None,
         The result, parsed as a dict, with the geometry decoded in the format
         defined in `geometry`.
     """
+    geom_request = _geom_request(geometry)
+    with _timed(url_config, 'route', 'url'):
+        url = _route_url(coord_origin, coord_dest, coord_intermediate,
+                         alternatives, steps, geom_request, overview,
+                         annotations, continue_straight, url_config,
+                         send_as_polyline)
+    parsed_json = _send_request(
+        url, url_config,
+        _route_query(coord_origin, coord_dest, coord_intermediate,
+                     alternatives, steps, geom_request, overview, annotations,
+                     continue_straight),
+        hedge=True)
+    with _timed(url_config, 'route', 'geometry'):
+        return _route_result(parsed_json, geometry, output)
+
+
+def _geom_request(geometry):
+    """
+    Helper function to validate the `geometry` output format asked by the user
+    and to return the format of the geometries to request to OSRM
+    """
     if geometry.lower() not in ('wkt', 'well-known-text', 'text', 'polyline',
                                 'wkb', 'well-known-binary', 'geojson'):
         raise ValueError("Invalid output format")
     else:
-        geom_request = "geojson" if "geojson" in geometry.lower() \
-            else "polyline"
+        return "geojson" if "geojson" in geometry.lower() else "polyline"
 
+
+def _route_url(coord_origin, coord_dest, coord_intermediate, alternatives,
+               steps, geom_request, overview, annotations, continue_straight,
+               url_config, send_as_polyline):
+    """ Helper function to build the url of a 'route' query """
     host = check_host(url_config.host)
 
     if not send_as_polyline:
@@ -209,26 +625,33 @@ def simple_route(coord_origin, coord_dest, coord_intermediate=None,
                  str(alternatives).lower(), geom_request, annotations,
                  continue_straight)
             ]
-    req = Request("".join(url))
-    if url_config.auth:
-        req.add_header("Authorization", url_config.auth)
-    rep = urlopen(req)
-    parsed_json = json.loads(rep.read().decode('utf-8'))
+    return "".join(url)
+
+
+def _route_query(coord_origin, coord_dest, coord_intermediate, alternatives,
+                 steps, geom_request, overview, annotations, continue_straight):
+    """ Helper function to identify a 'route' query in the cache """
+    return ('route',
+            list(_chain([coord_origin], coord_intermediate or [], [coord_dest])),
+            (alternatives, steps, geom_request, overview, annotations,
+             continue_straight))
 
+
+def _route_result(parsed_json, geometry, output):
+    """
+    Helper function to check the status of a 'route' response and to convert
+    its geometries in the format defined in `geometry`
+    """
     if "Ok" in parsed_json['code']:
         if geometry in ("polyline", "geojson") and output == "full":
             return parsed_json
         elif geometry in ("polyline", "geojson") and output == "routes":
             return parsed_json["routes"]
         else:
-            if geometry.lower() == "wkb":
-                func = Geometry.ExportToWkb
-            elif geometry.lower() == "wkt":
-                func = Geometry.ExportToWkt
-
+            func = _geom_converter(geometry)
             for route in parsed_json["routes"]:
-                route["geometry"] = func(decode_geom(route["geometry"]))
-                
+                route["geometry"] = func(route["geometry"])
+
         return parsed_json if output == "full" else parsed_json["routes"]
 
     else:
@@ -240,7 +663,9 @@ def simple_route(coord_origin, coord_dest, coord_intermediate=None,
 def table(coords_src, coords_dest=None,
           ids_origin=None, ids_dest=None,
           output='np', minutes=False, annotations='duration',
-          url_config=RequestConfig, send_as_polyline=True):
+          url_config=RequestConfig, send_as_polyline=True,
+          tile_size=None, workers=4, out=None, dtype=None,
+          matrix_cache=None, dedupe=False):
     """
     Function wrapping OSRM 'table' function in order to get a matrix of
     time distance as a numpy array or as a DataFrame
@@ -270,9 +695,42 @@ def table(coords_src, coords_dest=None,
                 'pandas', 'df' or 'DataFrame' for a DataFrame
                 'numpy', 'array' or 'np' for a numpy array (default is "np")
     annotations : str, optional
-        Either 'duration' (default) or 'distance'
+        Either 'duration' (default), 'distance' or 'duration,distance'
+        to get both matrices from the same query (returned in a
+        `TableResult` named tuple).
     url_config: osrm.RequestConfig, optional
         Parameters regarding the host, version and profile to use
+    tile_size : int or 2-ints tuple, optional
+        The maximum number of sources and of destinations to send in one query
+        (like the `max-table-size` option of the OSRM instance) as an integer
+        or as a (n_sources, n_destinations) tuple. Larger matrices are
+        computed by blocks, queried concurrently and assembled in one
+        matrix (default: None, ie. always send a single query).
+        Not available with output=='raw'.
+    workers : int, optional
+        The number of concurrent queries when the matrix is computed
+        by blocks (default: 4).
+    out : str or numpy.ndarray, optional
+        The path of a .npy file to create (and to fill block by block through
+        a `numpy.memmap`, allowing to compute matrices larger than the memory)
+        or an existing array to fill (or a list of them, one for each of the
+        `annotations`). Only available with output=='np'
+        (default: None, ie. the matrix is allocated in memory).
+    dtype : str or numpy.dtype, optional
+        The type of the values of the matrix, like 'float32' or 'uint32'
+        (default: None, ie. 'float64'). Values are rounded for
+        integer types, with missing values set to the maximum of the type.
+    matrix_cache : osrm.MatrixCache, optional
+        A persistent cache of the values already computed: only the missing
+        values are queried (by blocks of rows and columns) and stored in the
+        cache. Not available with output=='raw' (default: None).
+    dedupe : bool or float, optional
+        Whether to only query the distinct coordinates of `coords_src` and of
+        `coords_dest` (True for identical coordinates, or a positive float,
+        in degrees, for coordinates identical once snapped to a grid of this
+        size),
+        the resulting matrix being expanded to the requested shape.
+        Not available with output=='raw' (default: False).
 
 
     Returns
@@ -284,70 +742,611 @@ def table(coords_src, coords_dest=None,
         - if output=='pandas' : a labeled DataFrame containing the time matrix in minutes,
                                 a list of snapped origin coordinates,
                                 a list of snapped destination coordinates.
+        With several annotations, the matrices and the snapped coordinates
+        are returned as a `TableResult` named tuple
+        (durations, distances, sources, destinations).
+    """
+    output = _table_output(output)
+    names = _table_annotations(annotations)
+    if dedupe is not None and not isinstance(dedupe, (bool, np.bool_)) \
+            and not dedupe > 0:
+        raise ValueError("The tolerance of `dedupe` should be positive")
+    n_src, n_dest = len(coords_src), len(coords_dest or coords_src)
+    src_size, dest_size = _table_tile_size(tile_size, n_src, n_dest)
+    if not tile_size and output != 3:
+        # Too long urls are avoided by querying the matrix by blocks :
+        src_size, dest_size = _table_fit_size(
+            coords_src, coords_dest, annotations, url_config,
+            send_as_polyline, src_size, dest_size)
+        tile_size = (src_size, dest_size)
+
+    if dedupe or out is not None or dtype is not None \
+            or matrix_cache is not None \
+            or n_src > src_size or n_dest > dest_size:
+        if output == 3:
+            raise ValueError("Raw output isn't available for a matrix queried "
+                             "by blocks, cached, deduplicated or with a "
+                             "custom dtype")
+        if out is not None and output != 1:
+            raise ValueError("Only numpy output is available with `out`")
+        outs = out if isinstance(out, (list, tuple)) else [out] * len(names)
+        if len(outs) != len(names):
+            raise ValueError("`out` should contain one file (or array) "
+                             "for each of the annotations")
+        matrices, new_src_coords, new_dest_coords = _table_matrices(
+            coords_src, coords_dest, annotations, url_config,
+            send_as_polyline, tile_size, workers, outs, dtype, matrix_cache,
+            dedupe, minutes)
+        with _timed(url_config, 'table', 'format'):
+            return _table_return(
+                [_table_format(matrix, coords_src, coords_dest, ids_origin,
+                               ids_dest, output, False, name)
+                 for matrix, name in zip(matrices, names)],
+                names, new_src_coords, new_dest_coords)
+
+    # The raw output keeps the matrices as (JSON) nested lists :
+    parsed_json = _table_request(
+        coords_src, coords_dest, annotations, url_config, send_as_polyline,
+        _parse_response if output == 3 else _parse_table_response)
+    with _timed(url_config, 'table', 'format'):
+        return _table_result(parsed_json, coords_src, coords_dest,
+                             ids_origin, ids_dest, output, minutes,
+                             annotations)
+
+
+def _table_annotations(annotations):
+    """
+    Helper function to validate the `annotations` asked to `table`
+    and to return them as a list
+    """
+    names = [name.strip() for name in annotations.split(',')]
+    if not names or any(name not in ('duration', 'distance')
+                        for name in names):
+        raise ValueError("Invalid annotations (should be 'duration', "
+                         "'distance' or 'duration,distance')")
+    return names
+
+
+def _table_tile_size(tile_size, n_src, n_dest):
+    """
+    Helper function returning the maximum number of sources and of
+    destinations to send in one 'table' query
+    """
+    if not tile_size:
+        return max(n_src, 1), max(n_dest, 1)
+    elif isinstance(tile_size, (tuple, list)):
+        return tuple(tile_size)
+    else:
+        return tile_size, tile_size
+
+
+def _table_return(matrices, names, new_src_coords, new_dest_coords):
+    """
+    Helper function to return the matrix (or the `TableResult` if several
+    annotations were asked) and the snapped coordinates
+    """
+    if len(names) == 1:
+        return matrices[0], new_src_coords, new_dest_coords
+    matrices = dict(zip(names, matrices))
+    return TableResult(matrices.get('duration'), matrices.get('distance'),
+                       new_src_coords, new_dest_coords)
+
+
+def _table_matrices(coords_src, coords_dest, annotations, url_config,
+                    send_as_polyline, tile_size, workers, outs, dtype,
+                    matrix_cache, dedupe, minutes):
+    """
+    Helper function to compute the matrices of the `annotations` (by blocks,
+    from the cache and/or between the distinct coordinates) and to
+    write them in the arrays (or the .npy files) of `outs`
+    """
+    if dedupe:
+        return _table_dedupe(coords_src, coords_dest, annotations, url_config,
+                             send_as_polyline, tile_size, workers, outs,
+                             dtype, matrix_cache, dedupe, minutes)
+
+    n_src, n_dest = len(coords_src), len(coords_dest or coords_src)
+    src_size, dest_size = _table_tile_size(tile_size, n_src, n_dest)
+    matrices = [_table_array(out, (n_src, n_dest), dtype) for out in outs]
+    fill_args = (matrices, coords_src, coords_dest, annotations, url_config,
+                 send_as_polyline, src_size, dest_size, workers, minutes)
+    if matrix_cache is not None:
+        new_src_coords, new_dest_coords = \
+            _table_cached(matrix_cache, *fill_args)
+    else:
+        new_src_coords, new_dest_coords = _table_tiled(*fill_args)
+    for matrix in matrices:
+        if isinstance(matrix, np.memmap):
+            matrix.flush()
+    return matrices, new_src_coords, new_dest_coords
+
+
+def _dedupe_coords(coords, tolerance):
     """
+    Helper function returning the distinct coordinates of `coords` (identical
+    or in the same cell of a grid of `tolerance` degrees) and the index of
+    the distinct coordinate corresponding to each of `coords`
+    """
+    arr = np.asarray(coords, dtype=float).reshape(-1, 2)
+    if not isinstance(tolerance, (bool, np.bool_)):
+        arr = np.floor(arr / tolerance)
+    _, index, inverse = np.unique(
+        arr, axis=0, return_index=True, return_inverse=True)
+    # Keep the distinct coordinates in their order of appearance :
+    order = np.argsort(index)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return [coords[i] for i in index[order]], rank[inverse.ravel()]
+
+
+def _table_dedupe(coords_src, coords_dest, annotations, url_config,
+                  send_as_polyline, tile_size, workers, outs, dtype,
+                  matrix_cache, dedupe, minutes):
+    """
+    Helper function to compute the matrices between the distinct coordinates
+    and to expand them (with the snapped coordinates) to the requested shape
+    """
+    src, src_inverse = _dedupe_coords(coords_src, dedupe)
+    if coords_dest:
+        dest, dest_inverse = _dedupe_coords(coords_dest, dedupe)
+    else:
+        dest, dest_inverse = None, src_inverse
+
+    values, new_src, new_dest = _table_matrices(
+        src, dest, annotations, url_config, send_as_polyline, tile_size,
+        workers, [None] * len(outs), dtype, matrix_cache, False, minutes)
+
+    matrices = []
+    for out, small in zip(outs, values):
+        matrix = _table_array(out, (len(src_inverse), len(dest_inverse)),
+                              small.dtype)
+        for i in range(0, len(src_inverse), 1000):
+            matrix[i:i+1000] = small[src_inverse[i:i+1000]][:, dest_inverse]
+        if isinstance(matrix, np.memmap):
+            matrix.flush()
+        matrices.append(matrix)
+
+    new_src_coords = [new_src[i] for i in src_inverse]
+    new_dest_coords = None if not coords_dest \
+        else [new_dest[j] for j in dest_inverse]
+    return matrices, new_src_coords, new_dest_coords
+
+
+def _table_array(out, shape, dtype):
+    """
+    Helper function to allocate the array to fill with the result of a
+    'table' query (in memory or in a .npy file mapped in memory)
+    """
+    if isinstance(out, np.ndarray):
+        if out.shape != shape:
+            raise ValueError(
+                "`out` should be an array of shape {}".format(shape))
+        return out
+    dtype = np.dtype(dtype or float)
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+    return np.lib.format.open_memmap(out, mode='w+', dtype=dtype, shape=shape)
+
+
+def _table_block(values, dtype, minutes):
+    """
+    Helper function to convert the values of a block of the matrix
+    (in minutes and/or rounded for an integer `dtype`, in which missing
+    values are replaced by the maximum value of the type)
+    """
+    block = np.asarray(values, dtype=float)
+    if minutes:  # Conversion in minutes with 2 decimals:
+        block = np.around((block / 60), 2)
+    if dtype.kind in 'iu':
+        missing = np.isnan(block)
+        block = np.rint(block)
+        block[missing] = np.iinfo(dtype).max
+    return block
+
+
+def _table_tiled(matrices, coords_src, coords_dest, annotations, url_config,
+                 send_as_polyline, src_size, dest_size, workers, minutes):
+    """
+    Helper function to query a matrix by blocks of (at most) `src_size`
+    sources and `dest_size` destinations, and to write the results in
+    the `matrices` arrays (one for each of the `annotations`)
+    """
+    names = _table_annotations(annotations)
+    symmetric = not coords_dest
+    if symmetric:
+        coords_dest = coords_src
+    n_src, n_dest = len(coords_src), len(coords_dest)
+    tiles = [(slice(i, min(i + src_size, n_src)),
+              slice(j, min(j + dest_size, n_dest)))
+             for i in range(0, n_src, src_size)
+             for j in range(0, n_dest, dest_size)]
+
+    new_src_coords = [None] * n_src
+    new_dest_coords = [None] * n_dest
+
+    def query_tile(tile):
+        rows, cols = tile
+        src, dest = coords_src[rows], coords_dest[cols]
+        # A block on the diagonal of a symmetric matrix only needs
+        # its coordinates to be sent once :
+        if symmetric and rows == cols:
+            dest = None
+        parsed_json = _table_request(src, dest, annotations,
+                                     url_config, send_as_polyline)
+        if "code" not in parsed_json or "Ok" not in parsed_json["code"]:
+            raise ValueError('No distance table return by OSRM instance')
+
+        # Each block is written (in its own part of the matrix)
+        # as soon as it is received :
+        for matrix, name in zip(matrices, names):
+            matrix[rows, cols] = _table_block(
+                parsed_json['{}s'.format(name)], matrix.dtype,
+                minutes and name == 'duration')
+        if cols.start == 0:
+            new_src_coords[rows] = \
+                [ft["location"] for ft in parsed_json["sources"]]
+        if rows.start == 0:
+            new_dest_coords[cols] = \
+                [ft["location"] for ft in parsed_json["destinations"]]
+
+    _run_concurrently(query_tile, tiles, workers)
+    return new_src_coords, None if symmetric else new_dest_coords
+
+
+def _run_concurrently(func, items, workers):
+    """
+    Helper function calling `func` on each of `items` from a pool of
+    `workers` threads (the first exception raised being propagated)
+    """
+    if len(items) <= 1:
+        for item in items:
+            func(item)
+        return
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = [executor.submit(func, item) for item in items]
+    try:
+        for future in as_completed(futures):
+            future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def _table_cached(matrix_cache, matrices, coords_src, coords_dest,
+                  annotations, url_config, send_as_polyline, src_size,
+                  dest_size, workers, minutes):
+    """
+    Helper function to fill the `matrices` arrays with the values stored in
+    `matrix_cache`, only querying (by blocks) the missing values, which
+    are then stored in the cache
+    """
+    names = _table_annotations(annotations)
+    symmetric = not coords_dest
+    if symmetric:
+        coords_dest = coords_src
+    n_src, n_dest = len(coords_src), len(coords_dest)
+
+    # Rows without any value in the cache (like new sources) are queried
+    # entirely, the other missing values are queried in one block, made of
+    # the rows and the columns (like new destinations) where they are :
+    all_missing = np.zeros(n_src, dtype=bool)
+    some_missing = np.zeros(n_src, dtype=bool)
+    missing_cols = np.zeros(n_dest, dtype=bool)
+    for i in range(0, n_src, 1000):
+        rows = slice(i, min(i + 1000, n_src))
+        found = True
+        for matrix, name in zip(matrices, names):
+            values, found_values = matrix_cache.get(
+                url_config, name, coords_src[rows], coords_dest)
+            matrix[rows] = _table_block(values, matrix.dtype,
+                                        minutes and name == 'duration')
+            found = found & found_values
+        all_missing[rows] = ~found.any(axis=1)
+        some_missing[rows] = found.any(axis=1) & ~found.all(axis=1)
+        missing_cols |= ~found[some_missing[rows]].all(axis=0)
+
+    for rows, cols in ((np.flatnonzero(all_missing), np.arange(n_dest)),
+                       (np.flatnonzero(some_missing),
+                        np.flatnonzero(missing_cols))):
+        if not len(rows) or not len(cols):
+            continue
+        src = [coords_src[i] for i in rows]
+        dest = [coords_dest[j] for j in cols]
+        values = [np.empty((len(src), len(dest))) for _ in names]
+        new_src, new_dest = _table_tiled(
+            values, src, dest, annotations, url_config, send_as_polyline,
+            src_size, dest_size, workers, False)
+        matrix_cache.put_locations(url_config, src + dest, new_src + new_dest)
+        for matrix, name, block in zip(matrices, names, values):
+            matrix_cache.put(url_config, name, src, dest, block)
+            matrix[np.ix_(rows, cols)] = _table_block(
+                block, matrix.dtype, minutes and name == 'duration')
+
+    return (matrix_cache.get_locations(url_config, coords_src),
+            None if symmetric
+            else matrix_cache.get_locations(url_config, coords_dest))
+
+
+def table_one_to_many(coord_origin, coords_dest, minutes=False,
+                      annotations='duration', url_config=RequestConfig,
+                      send_as_polyline=True, chunk_size=None, workers=4,
+                      dtype=None):
+    """
+    Function wrapping OSRM 'table' function in order to get the time distance
+    from one origin to many destinations, as a 1-D numpy array
+
+    Parameters
+    ----------
+    coord_origin : list/tuple of two floats
+        (x ,y) where x is longitude and y is latitude
+    coords_dest : list
+        A list of coord as (longitude, latitude).
+    minutes : bool, optional
+        Whether to convert the durations in minutes (default: False).
+    annotations : str, optional
+        Either 'duration' (default), 'distance' or 'duration,distance'
+        (see `table`).
+    url_config: osrm.RequestConfig, optional
+        Parameters regarding the host, version and profile to use
+    chunk_size : int, optional
+        The maximum number of destinations to send in one query, the chunks
+        being queried concurrently (default: None, ie. a single query).
+    workers : int, optional
+        The number of concurrent queries (default: 4).
+    dtype : str or numpy.dtype, optional
+        The type of the values (default: None, ie. 'float64'), see `table`.
+
+    Returns
+    -------
+    values : numpy.ndarray
+        The time (or distance) to each destination.
+    snapped_origin : list
+        The snapped origin coordinates.
+    snapped_dest : list
+        The list of snapped destination coordinates.
+    """
+    names = _table_annotations(annotations)
+    values, new_origin, new_dest_coords = _table_vector(
+        coord_origin, coords_dest, True, minutes, annotations, url_config,
+        send_as_polyline, chunk_size, workers, dtype)
+    return _table_return(values, names, new_origin, new_dest_coords)
+
+
+def table_many_to_one(coords_src, coord_dest, minutes=False,
+                      annotations='duration', url_config=RequestConfig,
+                      send_as_polyline=True, chunk_size=None, workers=4,
+                      dtype=None):
+    """
+    Function wrapping OSRM 'table' function in order to get the time distance
+    from many origins to one destination, as a 1-D numpy array
+
+    Parameters
+    ----------
+    coords_src : list
+        A list of coord as (longitude, latitude).
+    coord_dest : list/tuple of two floats
+        (x ,y) where x is longitude and y is latitude
+    minutes : bool, optional
+        Whether to convert the durations in minutes (default: False).
+    annotations : str, optional
+        Either 'duration' (default), 'distance' or 'duration,distance'
+        (see `table`).
+    url_config: osrm.RequestConfig, optional
+        Parameters regarding the host, version and profile to use
+    chunk_size : int, optional
+        The maximum number of origins to send in one query, the chunks
+        being queried concurrently (default: None, ie. a single query).
+    workers : int, optional
+        The number of concurrent queries (default: 4).
+    dtype : str or numpy.dtype, optional
+        The type of the values (default: None, ie. 'float64'), see `table`.
+
+    Returns
+    -------
+    values : numpy.ndarray
+        The time (or distance) from each origin.
+    snapped_src : list
+        The list of snapped origin coordinates.
+    snapped_dest : list
+        The snapped destination coordinates.
+    """
+    names = _table_annotations(annotations)
+    values, new_dest, new_src_coords = _table_vector(
+        coord_dest, coords_src, False, minutes, annotations, url_config,
+        send_as_polyline, chunk_size, workers, dtype)
+    return _table_return(values, names, new_src_coords, new_dest)
+
+
+def _table_vector(coord, coords_many, one_to_many, minutes, annotations,
+                  url_config, send_as_polyline, chunk_size, workers, dtype):
+    """
+    Helper function to query (by chunks) the values between one coordinate
+    and many others and to write them in 1-D arrays (one for each of the
+    `annotations`)
+    """
+    names = _table_annotations(annotations)
+    n = len(coords_many)
+    if not chunk_size and n:
+        # Too long urls are avoided by querying the values by chunks :
+        src, dest = ([coord], coords_many) if one_to_many \
+            else (coords_many, [coord])
+        sizes = _table_fit_size(src, dest, annotations, url_config,
+                                send_as_polyline, len(src), len(dest), True)
+        chunk_size = sizes[1] if one_to_many else sizes[0]
+    chunk_size = chunk_size or max(n, 1)
+    values = [np.empty(n, dtype=np.dtype(dtype or float)) for _ in names]
+    new_coords = [None] * n
+    new_coord = [None]
+    one_key, many_key = ("sources", "destinations") if one_to_many \
+        else ("destinations", "sources")
+
+    def query_chunk(chunk):
+        src, dest = ([coord], coords_many[chunk]) if one_to_many \
+            else (coords_many[chunk], [coord])
+        parsed_json = _table_request(src, dest, annotations,
+                                     url_config, send_as_polyline)
+        if "code" not in parsed_json or "Ok" not in parsed_json["code"]:
+            raise ValueError('No distance table return by OSRM instance')
+        for vector, name in zip(values, names):
+            vector[chunk] = _table_block(
+                parsed_json['{}s'.format(name)], vector.dtype,
+                minutes and name == 'duration').ravel()
+        new_coords[chunk] = [ft["location"] for ft in parsed_json[many_key]]
+        new_coord[0] = parsed_json[one_key][0]["location"]
+
+    _run_concurrently(
+        query_chunk,
+        [slice(i, i + chunk_size) for i in range(0, n, chunk_size)],
+        workers)
+    return values, new_coord[0], new_coords
+
+
+def _table_output(output):
+    """ Helper function to get the type of output asked to `table` """
     if output.lower() in ('numpy', 'array', 'np'):
-        output = 1
+        return 1
     elif output.lower() in ('pandas', 'dataframe', 'df'):
-        output = 2
+        return 2
     else:
-        output = 3
+        return 3
 
-    host = check_host(url_config.host)
-    url = ''.join(
-        [host, '/table/', url_config.version, '/', url_config.profile, '/'])
 
+def _table_url(coords_src, coords_dest, annotations,
+               url_config, send_as_polyline, compact=False):
+    """
+    Helper function to build the url of a 'table' query (without the longest
+    of the `sources` and `destinations` lists if `compact`, see `_table_trim`)
+    """
+    host = check_host(url_config.host)
     if not send_as_polyline:
-        if not coords_dest:
-            url = ''.join([
-                  url,
-                  ';'.join([','.join([str(coord[0]), str(coord[1])])
-                            for coord in coords_src]),
-                  '?annotations={}'.format(annotations)
-                ])
-        else:
-            src_end = len(coords_src)
-            dest_end = src_end + len(coords_dest)
-            url = ''.join([
-                url,
-                ';'.join([','.join([str(coord[0]), str(coord[1])])
-                          for coord in _chain(coords_src, coords_dest)]),
-                '?sources=',
-                ';'.join([str(i) for i in range(src_end)]),
-                '&destinations=',
-                ';'.join([str(j) for j in range(src_end, dest_end)]),
-                '&annotations={}'.format(annotations)
-                ])
+        coords = ';'.join([','.join([str(coord[0]), str(coord[1])])
+                           for coord in _chain(coords_src, coords_dest or [])])
     else:
-        if not coords_dest:
-            url = ''.join([
-                  url,
-                  "polyline(",
-                  quote(polyline_encode([(c[1], c[0]) for c in coords_src])),
-                  ")",
-                  '?annotations={}'.format(annotations)
-                ])
+        coords = ''.join([
+            "polyline(",
+            quote(polyline_encode(
+                [(c[1], c[0]) for c in _chain(coords_src, coords_dest or [])])),
+            ")"])
+    url = [host, '/table/', url_config.version, '/', url_config.profile, '/',
+           coords, '?']
+
+    if coords_dest:
+        src_end = len(coords_src)
+        dest_end = src_end + len(coords_dest)
+        omit_dest = compact and len(coords_dest) >= len(coords_src)
+        if not compact or omit_dest:
+            url.extend(['sources=',
+                        ';'.join([str(i) for i in range(src_end)]), '&'])
+        if not omit_dest:
+            url.extend(['destinations=',
+                        ';'.join([str(j) for j in range(src_end, dest_end)]),
+                        '&'])
+    url.append('annotations={}'.format(annotations))
+    return ''.join(url)
+
+
+def _table_request_url(coords_src, coords_dest, annotations,
+                       url_config, send_as_polyline):
+    """
+    Helper function returning the url of a 'table' query and whether it was
+    compacted (if the full url is longer than `url_config.max_url_length`)
+    """
+    url = _table_url(coords_src, coords_dest, annotations,
+                     url_config, send_as_polyline)
+    max_length = getattr(url_config, 'max_url_length', None)
+    if coords_dest and max_length and len(url) > max_length:
+        return _table_url(coords_src, coords_dest, annotations,
+                          url_config, send_as_polyline, True), True
+    return url, False
+
+
+def _table_request(coords_src, coords_dest, annotations, url_config,
+                   send_as_polyline, parse=_parse_table_response):
+    """
+    Helper function to send a 'table' query (compacted if its url is too long)
+    and to return the parsed response (with the matrices as arrays by default)
+    """
+    with _timed(url_config, 'table', 'url'):
+        url, compact = _table_request_url(
+            coords_src, coords_dest, annotations, url_config,
+            send_as_polyline)
+    parsed_json = _send_request(
+        url, url_config,
+        _table_query(coords_src, coords_dest, annotations, compact), parse)
+    return _table_trim(parsed_json, coords_src, coords_dest) \
+        if compact else parsed_json
+
+
+def _table_trim(parsed_json, coords_src, coords_dest):
+    """
+    Helper function to remove, from the response to a compacted 'table' query,
+    the rows of the destinations (if the `sources` list was omitted, all the
+    coordinates being used as sources) or the columns of the sources (if
+    the `destinations` list was omitted)
+    """
+    if "code" not in parsed_json or "Ok" not in parsed_json["code"]:
+        return parsed_json
+    n_src = len(coords_src)
+    names = [name for name in ('durations', 'distances') if name in parsed_json]
+    if len(parsed_json["sources"]) > n_src:
+        parsed_json["sources"] = parsed_json["sources"][:n_src]
+        for name in names:
+            parsed_json[name] = parsed_json[name][:n_src]
+    if len(parsed_json["destinations"]) > len(coords_dest):
+        parsed_json["destinations"] = parsed_json["destinations"][n_src:]
+        for name in names:
+            parsed_json[name] = parsed_json[name][:, n_src:] \
+                if isinstance(parsed_json[name], np.ndarray) \
+                else [row[n_src:] for row in parsed_json[name]]
+    return parsed_json
+
+
+def _table_fit_size(coords_src, coords_dest, annotations, url_config,
+                    send_as_polyline, src_size, dest_size, compact=False):
+    """
+    Helper function to reduce the maximum number of sources and of
+    destinations of the blocks of a matrix until the url of a block is
+    (approximately) shorter than `url_config.max_url_length`.
+
+    The blocks are sized from their full url, as the server computes the
+    rows or the columns of the list omitted from a compacted url (see
+    `_table_trim`), unless `compact` (for the one-to-many and many-to-one
+    queries, where it only costs one more row or column).
+    """
+    max_length = getattr(url_config, 'max_url_length', None)
+    if not max_length or len(_table_url(
+            coords_src[:src_size], (coords_dest or [])[:dest_size],
+            annotations, url_config, send_as_polyline,
+            compact)) <= max_length:
+        return src_size, dest_size
+    # The blocks outside the diagonal of a symmetric matrix
+    # are queried with both their sources and destinations :
+    coords_dest = coords_dest or coords_src
+    while src_size > 1 or dest_size > 1:
+        url = _table_url(coords_src[:src_size], coords_dest[:dest_size],
+                         annotations, url_config, send_as_polyline, compact)
+        if len(url) <= max_length:
+            break
+        if src_size >= dest_size:
+            src_size = (src_size + 1) // 2
         else:
-            src_end = len(coords_src)
-            dest_end = src_end + len(coords_dest)
-            url = ''.join([
-                url,
-                "polyline(",
-                quote(polyline_encode(
-                    [(c[1], c[0]) for c in _chain(coords_src, coords_dest)])),
-                ")",
-                '?sources=',
-                ';'.join([str(i) for i in range(src_end)]),
-                '&destinations=',
-                ';'.join([str(j) for j in range(src_end, dest_end)]),
-                '&annotations={}'.format(annotations)
-                ])
+            dest_size = (dest_size + 1) // 2
+    return src_size, dest_size
+
+
+def _table_query(coords_src, coords_dest, annotations, compact=False):
+    """ Helper function to identify a 'table' query in the cache """
+    return ('table', list(_chain(coords_src, coords_dest or [])),
+            (len(coords_src), bool(coords_dest), annotations, compact))
 
-    req = Request(url)
-    if url_config.auth:
-        req.add_header("Authorization", url_config.auth)
-    rep = urlopen(req)
-    parsed_json = json.loads(rep.read().decode('utf-8'))
 
+def _table_result(parsed_json, coords_src, coords_dest, ids_origin, ids_dest,
+                  output, minutes, annotations):
+    """
+    Helper function to check the status of a 'table' response and to convert
+    it in the type of output asked by the user
+    """
     if "code" not in parsed_json or "Ok" not in parsed_json["code"]:
         raise ValueError('No distance table return by OSRM instance')
 
@@ -355,28 +1354,44 @@ def table(coords_src, coords_dest=None,
         return parsed_json
 
     else:
-        annoted = np.array(parsed_json['{}s'.format(annotations)], dtype=float)
-
+        names = _table_annotations(annotations)
         new_src_coords = [ft["location"] for ft in parsed_json["sources"]]
         new_dest_coords = None if not coords_dest \
             else [ft["location"] for ft in parsed_json["destinations"]]
 
-        if minutes and annotations == 'duration':  # Conversion in minutes with 2 decimals:
-            annoted = np.around((annoted / 60), 2)
+        return _table_return(
+            [_table_format(
+                np.asarray(parsed_json['{}s'.format(name)], dtype=float),
+                coords_src, coords_dest, ids_origin, ids_dest, output,
+                minutes, name)
+             for name in names],
+            names, new_src_coords, new_dest_coords)
+
 
-        if output == 2:
-            if not ids_origin:
-                ids_origin = [i for i in range(len(coords_src))]
-            if not ids_dest:
-                ids_dest = ids_origin if not coords_dest \
-                    else [i for i in range(len(coords_dest))]
+def _table_format(annoted, coords_src, coords_dest, ids_origin, ids_dest,
+                  output, minutes, annotations):
+    """
+    Helper function to convert the matrix in minutes and/or to
+    a labeled DataFrame if asked by the user
+    """
+    if minutes and annotations == 'duration':  # Conversion in minutes with 2 decimals:
+        annoted = np.around((annoted / 60), 2)
 
-            annoted = DataFrame(annoted,
-                                  index=ids_origin,
-                                  columns=ids_dest,
-                                  dtype=float)
+    if output == 2:
+        from pandas import DataFrame
 
-        return annoted, new_src_coords, new_dest_coords
+        if not ids_origin:
+            ids_origin = [i for i in range(len(coords_src))]
+        if not ids_dest:
+            ids_dest = ids_origin if not coords_dest \
+                else [i for i in range(len(coords_dest))]
+
+        annoted = DataFrame(annoted,
+                            index=ids_origin,
+                            columns=ids_dest,
+                            dtype=annoted.dtype)
+
+    return annoted
 
 
 def nearest(coord, number=1, url_config=RequestConfig):
@@ -397,19 +1412,26 @@ def nearest(coord, number=1, url_config=RequestConfig):
     result : dict
         The response from the osrm instance, parsed as a dict
     """
+    with _timed(url_config, 'nearest', 'url'):
+        url = _nearest_url(coord, number, url_config)
+    parsed_json = _send_request(url, url_config, _nearest_query(coord, number),
+                                hedge=True)
+    return parsed_json
+
+
+def _nearest_query(coord, number):
+    """ Helper function to identify a 'nearest' query in the cache """
+    return ('nearest', [coord], (number,))
+
+
+def _nearest_url(coord, number, url_config):
+    """ Helper function to build the url of a 'nearest' query """
     host = check_host(url_config.host)
-    url = ''.join([
+    return ''.join([
         host, '/nearest/', url_config.version, '/', url_config.profile, '/',
          ','.join(map(str, coord)), '?number={}'.format(number)
     ])
 
-    req = Request(url)
-    if url_config.auth:
-        req.add_header("Authorization", url_config.auth)
-    rep = urlopen(req)
-    parsed_json = json.loads(rep.read().decode('utf-8'))
-    return parsed_json
-
 
 def trip(coords, steps=False, output="full",
          geometry='polyline', overview="simplified",
@@ -449,13 +1471,22 @@ def trip(coords, steps=False, output="full",
         - if 'WKB' : the json returned by OSRM with the 'route_geometry' converted
                      in WKB format
     """
-    if geometry.lower() not in ('wkt', 'well-known-text', 'text', 'polyline',
-                                'wkb', 'well-known-binary', 'geojson'):
-        raise ValueError("Invalid output format")
-    else:
-        geom_request = "geojson" if "geojson" in geometry.lower() \
-            else "polyline"
+    geom_request = _geom_request(geometry)
+    with _timed(url_config, 'trip', 'url'):
+        url = _trip_url(coords, steps, geom_request, overview, roundtrip,
+                        source, destination, annotations, url_config,
+                        send_as_polyline)
+    parsed_json = _send_request(
+        url, url_config,
+        _trip_query(coords, steps, geom_request, overview, roundtrip, source,
+                    destination, annotations))
+    with _timed(url_config, 'trip', 'geometry'):
+        return _trip_result(parsed_json, geometry, output)
+
 
+def _trip_url(coords, steps, geom_request, overview, roundtrip, source,
+              destination, annotations, url_config, send_as_polyline):
+    """ Helper function to build the url of a 'trip' query """
     host = check_host(url_config.host)
 
     coords_request = \
@@ -465,7 +1496,7 @@ def trip(coords, steps=False, output="full",
         if send_as_polyline \
         else ';'.join([','.join([str(c[0]), str(c[1])]) for c in coords])
 
-    url = ''.join([
+    return ''.join([
          host, '/trip/', url_config.version, '/', url_config.profile, '/',
          coords_request,
          '?steps={}'.format(str(steps).lower()),
@@ -477,12 +1508,19 @@ def trip(coords, steps=False, output="full",
          '&annotations={}'.format(annotations)
          ])
 
-    req = Request(url)
-    if url_config.auth:
-        req.add_header("Authorization", url_config.auth)
-    rep = urlopen(req)
-    parsed_json = json.loads(rep.read().decode('utf-8'))
 
+def _trip_query(coords, steps, geom_request, overview, roundtrip, source,
+                destination, annotations):
+    """ Helper function to identify a 'trip' query in the cache """
+    return ('trip', coords, (steps, geom_request, overview, roundtrip, source,
+                             destination, annotations))
+
+
+def _trip_result(parsed_json, geometry, output):
+    """
+    Helper function to check the status of a 'trip' response and to convert
+    its geometries in the format defined in `geometry`
+    """
     if "Ok" in parsed_json['code']:
         if "only_index" in output:
             return [
@@ -494,12 +1532,9 @@ def trip(coords, steps=False, output="full",
         elif geometry in ("polyline", "geojson") and output == "trip":
             return parsed_json["trips"]
         else:
-            func = Geometry.ExportToWkb if geometry.lower() == "wkb" \
-                else Geometry.ExportToWkt
-
+            func = _geom_converter(geometry)
             for trip_route in parsed_json["trips"]:
-                trip_route["geometry"] = func(decode_geom(
-                                            trip_route["geometry"]))
+                trip_route["geometry"] = func(trip_route["geometry"])
 
         return parsed_json if output == "full" else parsed_json["routes"]
 
@@ -2,21 +2,29 @@
 """
 @author: mthh
 """
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import matplotlib
 import numpy as np
-from geopandas import GeoDataFrame, pd
-from shapely.geometry import MultiPolygon, Polygon, Point
+import multiprocessing
+from geopandas import GeoDataFrame, points_from_xy
+from shapely.geometry import Polygon, Point
+try:
+    from shapely import contains_xy
+except ImportError:  # shapely < 2.0
+    from shapely.vectorized import contains as contains_xy
 
 from . import RequestConfig, Point as _Point
-from .core import table
+from .batch import BatchResult
+from .core import table, table_one_to_many
 
 if not matplotlib.get_backend():
     matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 from scipy.interpolate import griddata
+from scipy.spatial import cKDTree
 
 
-def contour_poly(gdf, field_name, n_class):
+def contour_poly(gdf, field_name, n_class, levels=None):
     """
     Interpolate the time values (stored in the column `field_name`)
     from the points contained in `gdf` and compute the contour polygons
@@ -31,6 +39,9 @@ def contour_poly(gdf, field_name, n_class):
     n_class : int
         The number of class to use for contour polygons if levels is an
         integer (exemple: levels=8).
+    levels : list of ints/floats, optional
+        The upper bounds of the classes to use instead of `n_class` equal
+        classes (default: None).
 
     Returns
     -------
@@ -40,37 +51,15 @@ def contour_poly(gdf, field_name, n_class):
         The levels actually used when making the contours, excluding
         the minimum (should be a list of `n_class` values).
     """
-    # Dont take point without value :
-    gdf = gdf.iloc[gdf[field_name].to_numpy().nonzero()[0]][:]
-    # Try to avoid unvalid geom :
-    if len(gdf.geometry.valid()) != len(gdf):
-        # Invalid geoms have been encountered :
-        valid_geoms = gdf.geometry.valid()
-        valid_geoms = valid_geoms.reset_index()
-        valid_geoms['idx'] = valid_geoms['index']
-        del valid_geoms['index']
-        valid_geoms[field_name] = \
-            valid_geoms.idx.apply(lambda x: gdf[field_name][x])
-    else:
-        valid_geoms = gdf[['geometry', field_name]][:]
-
-    # Always in order to avoid invalid value which will cause the fail
-    # of the griddata function :
-    try:  # Normal way (fails if a non valid geom is encountered)
-        x = np.array([geom.coords.xy[0][0] for geom in valid_geoms.geometry])
-        y = np.array([geom.coords.xy[1][0] for geom in valid_geoms.geometry])
-        z = valid_geoms[field_name].values
-    except:  # Taking the long way to load the value... :
-        x = np.array([])
-        y = np.array([])
-        z = np.array([], dtype=float)
-        for idx, geom, val in gdf[['geometry', field_name]].itertuples():
-            try:
-                x = np.append(x, geom.coords.xy[0][0])
-                y = np.append(y, geom.coords.xy[1][0])
-                z = np.append(z, val)
-            except Exception as err:
-                print(err)
+    # Dont take point without value (nor invalid geometries/values, which
+    # would cause the fail of the griddata function) :
+    gdf = gdf[(gdf[field_name].to_numpy() != 0)
+              & gdf.geometry.is_valid.to_numpy()]
+    x = gdf.geometry.x.to_numpy()
+    y = gdf.geometry.y.to_numpy()
+    z = gdf[field_name].to_numpy(dtype=float)
+    valid = ~(np.isnan(x) | np.isnan(y) | np.isnan(z))
+    x, y, z = x[valid], y[valid], z[valid]
 
 #    # compute min and max and values :
     minx = np.nanmin(x)
@@ -81,18 +70,21 @@ def contour_poly(gdf, field_name, n_class):
     # Assuming we want a square grid for the interpolation
     xi = np.linspace(minx, maxx, 200)
     yi = np.linspace(miny, maxy, 200)
-    zi = griddata(x, y, z, xi, yi, interp='linear')
+    zi = griddata((x, y), z, (xi[None, :], yi[:, None]), method='linear')
 
-    interval_time = int(round(np.nanmax(z) / n_class))
-    nb_inter = n_class + 1
-#    jmp = int(round((np.nanmax(z) - np.nanmin(z)) / 15))
-#    levels = [nb for nb in range(0, int(round(np.nanmax(z))+1)+jmp, jmp)]
-    levels = tuple([nb for nb in range(0, int(
-        np.nanmax(z) + 1) + interval_time, interval_time)][:nb_inter+1])
+    if levels is not None:
+        levels = (0,) + tuple(levels)
+    else:
+        interval_time = int(round(np.nanmax(z) / n_class))
+        nb_inter = n_class + 1
+#        jmp = int(round((np.nanmax(z) - np.nanmin(z)) / 15))
+#        levels = [nb for nb in range(0, int(round(np.nanmax(z))+1)+jmp, jmp)]
+        levels = tuple([nb for nb in range(0, int(
+            np.nanmax(z) + 1) + interval_time, interval_time)][:nb_inter+1])
 
     collec_poly = plt.contourf(
         xi, yi, zi, levels, cmap=plt.cm.rainbow,
-        vmax=abs(zi).max(), vmin=-abs(zi).max(), alpha=0.35
+        vmax=np.nanmax(abs(zi)), vmin=-np.nanmax(abs(zi)), alpha=0.35
         )
 
     return collec_poly, levels[1:]
@@ -123,26 +115,28 @@ def isopoly_to_gdf(collec_poly, field_name, levels):
     """
     polygons, data = [], []
 
-    for i, polygon in enumerate(collec_poly.collections):
-        mpoly = []
-        for path in polygon.get_paths():
+    if hasattr(collec_poly, 'collections'):
+        paths_by_level = [c.get_paths() for c in collec_poly.collections]
+    else:  # matplotlib >= 3.8 makes a single path by level
+        paths_by_level = [[path] for path in collec_poly.get_paths()]
+
+    for i, paths in enumerate(paths_by_level):
+        mpoly = None
+        for path in paths:
             path.should_simplify = False
-            poly = path.to_polygons()
-            exterior, holes = [], []
-            if len(poly) > 0 and len(poly[0]) > 3:
-                exterior = poly[0]
-                if len(poly) > 1:  # There's some holes
-                    holes = [h for h in poly[1:] if len(h) > 3]
-            mpoly.append(Polygon(exterior, holes))
-        if len(mpoly) > 1:
-            mpoly = MultiPolygon(mpoly)
+            for ring in path.to_polygons():
+                if len(ring) <= 3:
+                    continue
+                poly = Polygon(ring)
+                poly = poly if poly.is_valid else poly.buffer(0)
+                # The rings within another one are its holes (or islands
+                # within these holes) :
+                mpoly = poly if mpoly is None \
+                    else mpoly.symmetric_difference(poly)
+        if mpoly is not None and not mpoly.is_empty:
             polygons.append(mpoly)
             if levels:
                 data.append(levels[i])
-        elif len(mpoly) == 1:
-            polygons.append(mpoly[0])
-            if levels:
-                data.append(levels[i])
 
     if len(data) == len(polygons):
         return GeoDataFrame(geometry=polygons,
@@ -152,7 +146,49 @@ def isopoly_to_gdf(collec_poly, field_name, levels):
         return GeoDataFrame(geometry=polygons)
 
 
-def make_grid(gdf, nb_points):
+def grid_coords(bounds, nb_points, hexagonal=False, clip=None):
+    """
+    Return the coordinates of the points of a regular grid covering `bounds`
+    (the centers of its cells, column by column), as an array.
+
+    Parameters
+    ----------
+    bounds : 4-floats tuple
+        The (xmin, ymin, xmax, ymax) bounds of the grid.
+    nb_points : int
+        The number of expected points of the grid (before clipping).
+    hexagonal : bool, optional
+        Whether to shift every other row by half a cell (with rows closer
+        together, each point being at the same distance of its 6
+        neighbours) instead of making a square grid (default: False).
+    clip : shapely.geometry.Polygon, optional
+        The polygon in which the points must be (default: None).
+
+    Returns
+    -------
+    coords : numpy.ndarray
+        The (x, y) coordinates of the points, as a (n, 2) array.
+    """
+    xmin, ymin, xmax, ymax = bounds
+    width, height = xmax - xmin, ymax - ymin
+    if hexagonal:
+        step = (2 * width * height / (3 ** 0.5 * nb_points)) ** 0.5
+        cols = max(int(round(width / step)), 1)
+        rows = max(int(round(height / (step * 3 ** 0.5 / 2))), 1)
+    else:
+        rows = cols = int(nb_points**0.5)
+    dx, dy = width / cols, height / rows
+    x, y = np.meshgrid(xmin + dx * (np.arange(cols) + 0.5),
+                       ymax - dy * (np.arange(rows) + 0.5), indexing='ij')
+    if hexagonal:
+        x = x + np.where(np.arange(rows) % 2, dx / 4, -dx / 4)
+    coords = np.column_stack([x.ravel(), y.ravel()])
+    if clip is not None:
+        coords = coords[contains_xy(clip, coords[:, 0], coords[:, 1])]
+    return coords
+
+
+def make_grid(gdf, nb_points, hexagonal=False, clip=False):
     """
     Return a grid, based on the shape of *gdf* and on a *height* value (in
     units of *gdf*).
@@ -163,39 +199,35 @@ def make_grid(gdf, nb_points):
         The collection of polygons to be covered by the grid.
     nb_points : int
         The number of expected points of the grid.
+    hexagonal : bool, optional
+        Whether to make a hexagonal grid (see `grid_coords`, default: False).
+    clip : bool, optional
+        Whether to only keep the points within the polygons (default: False).
 
     Returns
     -------
     grid : GeoDataFrame
-        A collection of polygons.
+        A collection of points.
     """
-    xmin, ymin, xmax, ymax = gdf.total_bounds
-    rows = int(nb_points**0.5)
-    cols = int(nb_points**0.5)
-    height = (ymax-ymin) / rows
-    width = (xmax-xmin) / cols
-    x_left_origin = xmin
-    x_right_origin = xmin + width
-    y_top_origin = ymax
-    y_bottom_origin = ymax - height
-
-    res_geoms = []
-    for countcols in range(cols):
-        y_top = y_top_origin
-        y_bottom = y_bottom_origin
-        for countrows in range(rows):
-            res_geoms.append((
-                (x_left_origin + x_right_origin) / 2, (y_top + y_bottom) / 2
-                ))
-            y_top = y_top - height
-            y_bottom = y_bottom - height
-        x_left_origin = x_left_origin + width
-        x_right_origin = x_right_origin + width
+    polygons = None
+    if clip:
+        polygons = gdf.union_all() if hasattr(gdf, 'union_all') \
+            else gdf.unary_union
+    coords = grid_coords(gdf.total_bounds, nb_points, hexagonal, polygons)
+    return GeoDataFrame(
+        geometry=points_from_xy(coords[:, 0], coords[:, 1]), crs=gdf.crs)
+
 
+def _times_grid(coords, times):
+    """
+    Helper function returning the points of `coords` reached (in some time)
+    as a GeoDataFrame, with their time in a 'time' column
+    """
+    reached = (times != 0) & ~np.isnan(times)
+    coords = coords[reached]
     return GeoDataFrame(
-        geometry=pd.Series(res_geoms).apply(lambda x: Point(x)),
-        crs=gdf.crs
-        )
+        {'time': times[reached]},
+        geometry=points_from_xy(coords[:, 0], coords[:, 1]))
 
 
 class AccessIsochrone:
@@ -210,59 +242,357 @@ class AccessIsochrone:
     point_origin : 2-floats tuple
         The coordinates of the center point to use as (x, y).
     points_grid : int
-        The number of points of the underlying grid to use.
+        The number of points of the underlying grid to use (or of the coarse
+        grid to start with, when `breaks` are given).
     size : float
         Search radius (in degree).
     url_config : osrm.RequestConfig
         The OSRM url to be requested.
+    hexagonal : bool, optional
+        Whether to use a hexagonal grid (see `grid_coords`, default: False).
+    clip : bool, optional
+        Whether to only query the points of the grid within `size` of
+        `point_origin` (instead of the whole square, default: False).
+    breaks : list of ints/floats, optional
+        The times (in minutes) of the contours to be rendered. When given,
+        the cells of the (square) grid whose time and the times of the cells
+        around straddle one of these breaks are split in 4, the centers of
+        the new cells being queried, until the cells are `precision` wide
+        (default: None, ie. a uniform grid).
+    precision : float, optional
+        The width (in degree) of the smallest cells, when refining the grid
+        around `breaks` (default: None, ie. an eighth of the width of the
+        cells of the coarse grid).
 
     Attributes
     ----------
     center_point : collections.namedtuple
         The coordinates of the point used a center (potentially moved from the
         original point in order to be on the network).
+    coords : numpy.ndarray
+        The (x, y) locations of the points of the grid retrieved from OSRM
+        (ie. potentially moved to be on the routable network).
     grid : geopandas.GeoDataFrame
-        The point locations retrieved from OSRM (ie. potentially moved
-        to be on the routable network).
+        The reached points (from `coords`) and their time, created when
+        first accessed.
     times : numpy.ndarray
         The time-distance table retrieved from OSRM.
+    breaks : list of ints/floats
+        The sorted `breaks` (or None).
 
     Methods
     -------
     render_contour(nb_class)
-        Render the contour polygon according to the choosen number of class.
+        Render the contour polygon according to the choosen number of class
+        (or to the `breaks`).
     """
 
     def __init__(self, point_origin, points_grid=250,
-                 size=0.4, url_config=RequestConfig):
-        gdf = GeoDataFrame(geometry=[Point(point_origin).buffer(size)])
-        grid = make_grid(gdf, points_grid)
-        coords_grid = \
-            [(i.coords.xy[0][0], i.coords.xy[1][0]) for i in grid.geometry]
-        self.times, new_pt_origin, pts_dest = \
-            table([point_origin], coords_grid, url_config=url_config)
-        self.times = (self.times[0] / 60.0).round(2)  # Round values in minutes
-        geoms, values = [], []
-        for time, coord in zip(self.times, pts_dest):
-            if time:
-                geoms.append(Point(coord))
-                values.append(time)
-        self.grid = GeoDataFrame(geometry=geoms, data=values, columns=['time'])
+                 size=0.4, url_config=RequestConfig, hexagonal=False,
+                 clip=False, breaks=None, precision=None):
+        if breaks is not None and hexagonal:
+            raise ValueError("The grid can only be refined around the breaks "
+                             "when it is a square one")
+        x, y = point_origin
+        clip = Point(point_origin).buffer(size) if clip else None
+        coords_grid = grid_coords(
+            (x - size, y - size, x + size, y + size), points_grid, hexagonal,
+            clip)
+        # Values in minutes (rounded to 2 decimals) :
+        self.times, new_pt_origin, pts_dest = table_one_to_many(
+            point_origin, coords_grid.tolist(), minutes=True,
+            url_config=url_config)
+        self.coords = np.array(pts_dest, dtype=float).reshape(-1, 2)
+        self.breaks = None if breaks is None else sorted(breaks)
+        if breaks is not None:
+            width = 2. * size / int(points_grid**0.5)
+            self._refine(point_origin, coords_grid, width,
+                         precision or width / 8., clip, url_config)
+        self._grid = None
         self.center_point = _Point(
-            latitude=new_pt_origin[0][0], longitude=new_pt_origin[0][1])
+            latitude=new_pt_origin[0], longitude=new_pt_origin[1])
 
-    def render_contour(self, n_class):
+    def _refine(self, point_origin, coords_grid, width, precision, clip,
+                url_config):
+        """
+        Split in 4 the cells (of `width`, centered on `coords_grid`) whose
+        time and the times of the cells around straddle one of the breaks,
+        querying the centers of the new cells in a single (batched) table
+        request by level, until the cells are `precision` wide.
+        """
+        breaks = np.asarray(self.breaks, dtype=float)
+        # The 4 children of a cell, relative to its center (in cell width) :
+        offsets = np.array([(-1, 1), (-1, -1), (1, 1), (1, -1)]) / 4.
+        grid = coords_grid
+        level = np.ones(len(grid), dtype=bool)
+        while width > precision and level.any():
+            # The unreachable points are beyond any break :
+            times = np.where(np.isnan(self.times), np.inf, self.times)
+            # The points around a cell of the current level (itself, the
+            # cells of the same level and the larger adjacent cells) :
+            around = cKDTree(grid / width).query_ball_point(
+                grid[level] / width, 1.01)
+            owner = np.repeat(np.arange(len(around)), [len(a) for a in around])
+            around = np.concatenate(around).astype(int)
+            lowest = np.full(level.sum(), np.inf)
+            highest = np.full(level.sum(), -np.inf)
+            np.minimum.at(lowest, owner, times[around])
+            np.maximum.at(highest, owner, times[around])
+            split = ((lowest[:, None] < breaks)
+                     & (breaks <= highest[:, None])).any(axis=1)
+
+            children = (grid[level][split][:, None, :]
+                        + offsets * width).reshape(-1, 2)
+            if clip is not None:
+                children = children[
+                    contains_xy(clip, children[:, 0], children[:, 1])]
+            width /= 2.
+            if not len(children):
+                break
+            times, _, pts_dest = table_one_to_many(
+                point_origin, children.tolist(), minutes=True,
+                url_config=url_config)
+            self.times = np.concatenate([self.times, times])
+            self.coords = np.vstack([
+                self.coords, np.array(pts_dest, dtype=float).reshape(-1, 2)])
+            grid = np.vstack([grid, children])
+            level = np.arange(len(grid)) >= len(grid) - len(children)
+
+    @property
+    def grid(self):
+        if self._grid is None:
+            self._grid = _times_grid(self.coords, self.times)
+        return self._grid
+
+    def render_contour(self, n_class=None):
         """
         Parameters
         ----------
-        n_class : int
-             The desired number of class.
+        n_class : int, optional
+             The desired number of class (default: None, ie. one class
+             by break, if `breaks` were given).
 
         Returns
         -------
         gdf_poly : GeoDataFrame
             The shape of the computed accessibility polygons.
         """
-        collec_poly, levels = contour_poly(self.grid, 'time', n_class=n_class)
+        if n_class is None and self.breaks is None:
+            raise ValueError("The number of class is needed "
+                             "(no breaks were given)")
+        collec_poly, levels = contour_poly(
+            self.grid, 'time', n_class=n_class,
+            levels=self.breaks if n_class is None else None)
         gdf_poly = isopoly_to_gdf(collec_poly, 'time', levels)
         return gdf_poly
+
+
+def isochrone_many(origins, n_class=None, breaks=None, points_grid=250,
+                   size=0.4, clip=False, url_config=RequestConfig,
+                   group_size=50, tile_size=None, workers=4, processes=None):
+    """
+    Function computing the accessibility isochrones around many origins
+    (like `AccessIsochrone(origin, ...).render_contour(...)` for each
+    of them), in a single pipeline:
+
+        - the grids of all the origins are aligned on a common grid (of the
+          precision of a `points_grid` points grid of `size`), so the points
+          shared by origins with overlapping extents are queried once,
+        - the origins are packed, by groups of at most `group_size`
+          origins whose grids overlap (each origin of a group being within
+          `size` of its first origin, in x and in y), in the sources of
+          many-to-many 'table' queries (split in blocks of `tile_size`,
+          queried concurrently), an isolated origin being only queried
+          with the points of its own grid,
+        - the interpolation and the contour polygons of each origin are
+          computed in a pool of `processes` processes, while the next
+          groups are queried.
+
+    Parameters
+    ----------
+    origins : list of 2-floats tuples
+        The (x, y) coordinates of the origins.
+    n_class : int, optional
+        The number of class of the contour polygons (see
+        `AccessIsochrone.render_contour`).
+    breaks : list of ints/floats, optional
+        The times (in minutes) of the contour polygons,
+        instead of `n_class` equal classes.
+    points_grid : int, optional
+        The number of points of the grid of each origin (default: 250).
+    size : float, optional
+        Search radius (in degree, default: 0.4).
+    clip : bool, optional
+        Whether to only query the points of the grid within `size` of
+        each origin (instead of the whole square, default: False).
+    url_config : osrm.RequestConfig, optional
+        Parameters regarding the host, version and profile to use.
+    group_size : int, optional
+        The number of origins queried in the same matrix (default: 50).
+    tile_size : int or 2-ints tuple, optional
+        The maximum number of sources and of destinations to send in one
+        query, like the `max-table-size` option of the OSRM instance
+        (default: None, ie. as many as allowed by the length of the url,
+        see `osrm.table`).
+    workers : int, optional
+        The number of concurrent queries of the blocks of a matrix
+        (default: 4).
+    processes : int, optional
+        The number of processes computing the contour polygons (default: None,
+        ie. the number of processors) or 0 to compute them in the calling
+        process.
+
+    Returns
+    -------
+    results : generator
+        A generator of `osrm.BatchResult` named tuples (index, result, error),
+        in the order of completion, where `index` is the position of the
+        origin in `origins`, `result` the contour polygons of this origin
+        as a GeoDataFrame (or None) and `error` the exception raised while
+        computing them (or None). A failed origin (or group of origins, for
+        a failed query) doesn't interrupt the batch.
+
+    Examples
+    --------
+    >>> for res in osrm.isochrone_many(facilities, breaks=[10, 20, 30],
+    ...                                size=0.2, processes=4):
+    ...     if res.error is None:
+    ...         res.result.to_file("isochrone_{}.geojson".format(res.index))
+    """
+    if (n_class is None) == (breaks is None):
+        raise ValueError("Either the number of class or the breaks "
+                         "are needed")
+    breaks = None if breaks is None else sorted(breaks)
+    origins = np.asarray(origins, dtype=float).reshape(-1, 2)
+    width = 2. * size / int(points_grid**0.5)
+    return _isochrone_results(origins, n_class, breaks, size, width, clip,
+                              url_config, group_size, tile_size, workers,
+                              processes)
+
+
+def _isochrone_results(origins, n_class, breaks, size, width, clip,
+                       url_config, group_size, tile_size, workers,
+                       processes):
+    """
+    Helper function (generator) querying the grids of the `origins` by groups
+    and yielding the contour polygons of each origin as `BatchResult` tuples
+    (see `isochrone_many`)
+    """
+    executor = ProcessPoolExecutor(processes) if processes != 0 else None
+    max_pending = 2 * max(group_size, processes or multiprocessing.cpu_count())
+    pending = {}
+
+    def results(futures):
+        for fut in futures:
+            index = pending.pop(fut)
+            err = fut.exception()
+            yield BatchResult(index, None if err else fut.result(), err)
+
+    try:
+        for group in _isochrone_groups(origins, size, group_size):
+            try:
+                grids = _isochrone_grids(
+                    origins[group], size, width, clip, url_config,
+                    tile_size, workers)
+            except Exception as err:
+                for i in group:
+                    yield BatchResult(int(i), None, err)
+                continue
+            for i, (coords, times) in zip(group, grids):
+                if executor is None:
+                    try:
+                        gdf = _isochrone_contours(coords, times, n_class,
+                                                  breaks)
+                        yield BatchResult(int(i), gdf, None)
+                    except Exception as err:
+                        yield BatchResult(int(i), None, err)
+                else:
+                    pending[executor.submit(_isochrone_contours, coords,
+                                            times, n_class, breaks)] = int(i)
+            # Only keep a bounded number of pending contours (and of
+            # grids in memory) :
+            while len(pending) > max_pending:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for res in results(done):
+                    yield res
+            for res in results([fut for fut in pending if fut.done()]):
+                yield res
+        while pending:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for res in results(done):
+                yield res
+    finally:
+        for fut in pending:
+            fut.cancel()
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def _isochrone_groups(origins, size, group_size):
+    """
+    Helper function (generator) splitting the `origins` in groups of at most
+    `group_size` origins whose grids overlap : taken in the order of strips
+    of the height of a grid, each origin not yet grouped is grouped with the
+    nearest other ones within `size` of it in x and in y (so the grids of a
+    group overlap by at least a quarter)
+    """
+    order = np.lexsort((origins[:, 0], np.floor(origins[:, 1] / (2 * size))))
+    tree = cKDTree(origins)
+    grouped = np.zeros(len(origins), dtype=bool)
+    for seed in order:
+        if grouped[seed]:
+            continue
+        near = np.array(tree.query_ball_point(origins[seed], size, p=np.inf),
+                        dtype=int)
+        near = near[~grouped[near]]
+        dist = np.abs(origins[near] - origins[seed]).max(axis=1)
+        group = near[np.argsort(dist, kind='stable')][:group_size]
+        grouped[group] = True
+        yield group
+
+
+def _isochrone_grids(origins, size, width, clip, url_config, tile_size,
+                     workers):
+    """
+    Helper function querying the times from each of the `origins` to the
+    points of its grid (a square, or a disk if `clip`, of `size` taken from
+    a common grid of `width` wide cells) in one many-to-many matrix, and
+    returning the snapped points and the times of each origin
+    """
+    cells, counts = [], []
+    for x, y in origins:
+        # The indexes of the cells whose center is within `size` :
+        cols = np.arange(np.ceil((x - size) / width - 0.5),
+                         np.floor((x + size) / width - 0.5) + 1)
+        rows = np.arange(np.ceil((y - size) / width - 0.5),
+                         np.floor((y + size) / width - 0.5) + 1)
+        cols, rows = np.meshgrid(cols, rows, indexing='ij')
+        cell = np.column_stack([cols.ravel(), rows.ravel()])
+        if clip:
+            cell = cell[np.hypot((cell[:, 0] + 0.5) * width - x,
+                                 (cell[:, 1] + 0.5) * width - y) <= size]
+        cells.append(cell)
+        counts.append(len(cell))
+    # Each point shared by several origins is only queried once :
+    cells, inverse = np.unique(np.vstack(cells), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    times, _, pts_dest = table(
+        origins.tolist(), ((cells + 0.5) * width).tolist(), minutes=True,
+        url_config=url_config, tile_size=tile_size, workers=workers)
+    pts_dest = np.array(pts_dest, dtype=float).reshape(-1, 2)
+    offsets = np.cumsum([0] + counts)
+    return [(pts_dest[inverse[start:stop]], times[k, inverse[start:stop]])
+            for k, (start, stop) in enumerate(zip(offsets[:-1], offsets[1:]))]
+
+
+def _isochrone_contours(coords, times, n_class, breaks):
+    """
+    Helper function (run in the worker processes of `isochrone_many`)
+    rendering the contour polygons from the `times` to the `coords`
+    """
+    collec_poly, levels = contour_poly(
+        _times_grid(coords, times), 'time', n_class=n_class, levels=breaks)
+    gdf_poly = isopoly_to_gdf(collec_poly, 'time', levels)
+    # Don't accumulate the contours in the current figure :
+    plt.close('all')
+    return gdf_poly
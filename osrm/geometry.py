@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Conversion of the geometries returned by OSRM.
+"""
+import struct
+import numpy as np
+
+
+def decode_polyline(encoded_polyline, precision=5):
+    """
+    Function decoding an encoded polyline (with 'encoded polyline
+    algorithm') to an array of coordinates, in one vectorized pass.
+
+    Parameters
+    ----------
+    encoded_polyline : str
+        The encoded string to decode.
+    precision : int, optional
+        The number of decimals used when encoding the coordinates, 5 for
+        OSRM 'polyline' geometries, 6 for 'polyline6' geometries (default: 5).
+
+    Returns
+    -------
+    coords : numpy.ndarray
+        The coordinates of the line, as an (N, 2) array of float64
+        where each row is (x, y), ie. (longitude, latitude).
+    """
+    if not isinstance(encoded_polyline, bytes):
+        encoded_polyline = encoded_polyline.encode('ascii')
+    chunks = np.frombuffer(encoded_polyline, dtype=np.uint8).astype(np.int64)
+    if len(chunks) == 0:
+        return np.empty((0, 2), dtype=np.float64)
+    chunks -= 63
+
+    # Each value is encoded in consecutive chunks of 5 bits, its last
+    # chunk being the one without the 0x20 continuation bit :
+    is_last = chunks < 0x20
+    if not is_last[-1]:
+        raise ValueError("Invalid encoded polyline")
+    starts = np.flatnonzero(np.concatenate(([True], is_last[:-1])))
+    value_index = np.cumsum(is_last) - is_last
+    shifts = 5 * (np.arange(len(chunks)) - starts[value_index])
+    values = np.add.reduceat((chunks & 0x1f) << shifts, starts)
+    if len(values) % 2:
+        raise ValueError("Invalid encoded polyline")
+
+    # Zigzag decoding of the signed values, which are the offsets
+    # from the previous (latitude, longitude) pair :
+    values = np.where(values & 1, ~(values >> 1), values >> 1)
+    coords = np.cumsum(values.reshape(-1, 2), axis=0)[:, ::-1]
+    return coords / float(10 ** precision)
+
+
+def line_to_wkb(coords, byte_order=0):
+    """
+    Function encoding the coordinates of a line as a WKB LineString,
+    without any dependency on GDAL/OGR.
+
+    Parameters
+    ----------
+    coords : numpy.ndarray
+        The (N, 2) array of (x, y) coordinates of the line.
+    byte_order : int, optional
+        0 for big endian (XDR, like the default of ogr ExportToWkb)
+        or 1 for little endian (NDR) (default: 0).
+
+    Returns
+    -------
+    wkb : bytes
+        The line, as Well-Known-Binary.
+    """
+    endian = '>' if byte_order == 0 else '<'
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    return b''.join([
+        struct.pack(endian + 'BII', byte_order, 2, len(coords)),
+        coords.astype(endian + 'f8').tobytes()
+        ])
+
+
+def line_to_wkt(coords):
+    """
+    Function encoding the coordinates of a line as a WKT LineString,
+    without any dependency on GDAL/OGR.
+
+    Parameters
+    ----------
+    coords : numpy.ndarray
+        The (N, 2) array of (x, y) coordinates of the line.
+
+    Returns
+    -------
+    wkt : str
+        The line, as Well-Known-Text.
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if len(coords) == 0:
+        return 'LINESTRING EMPTY'
+    return ''.join([
+        'LINESTRING (',
+        ','.join(['%.15g %.15g'] * len(coords)) % tuple(coords.ravel().tolist()),
+        ')'
+        ])
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Load balancing, circuit breaking and retries across several replicas
+of an OSRM instance.
+"""
+from collections import namedtuple, deque
+import random
+import socket
+import threading
+import time
+
+try:
+    from http.client import HTTPException
+    from urllib.request import URLError, HTTPError
+except:
+    from httplib import HTTPException
+    from urllib2 import URLError, HTTPError
+
+try:
+    _clock = time.monotonic
+except AttributeError:
+    _clock = time.time
+
+HostStatus = namedtuple(
+    "HostStatus", ("host", "outstanding", "failures", "available"))
+HedgeInfo = namedtuple("HedgeInfo", ("requests", "hedged", "wins", "delay"))
+
+
+class HostPool:
+    """
+    Hosts of several replicas of an OSRM instance (serving the same dataset
+    and profile), between which the requests are balanced.
+
+    Once attached to a RequestConfig object (through its `hosts` attribute,
+    or with `osrm.RequestConfig(addr, hosts=[...])`), each request made by
+    `match`, `simple_route`, `table`, `nearest` and `trip` with this config
+    is sent to one of the available hosts. A request failing because of
+    the host (unreachable host, timeout or 5xx status) is retried, after an
+    exponential backoff, on another host, and a host failing `max_failures`
+    times in a row is left aside (its circuit is open) for `reset_timeout`
+    seconds, after which a single request is tried on it again.
+
+    Parameters
+    ----------
+    hosts : list of str
+        The hosts of the replicas, like ["10.0.0.1:5000", "10.0.0.2:5000"].
+    strategy : str, optional
+        Either 'round-robin' (default), to use each host in turn, or
+        'least-outstanding', to use the host with the fewest requests
+        in progress.
+    retries : int, optional
+        The maximum number of times a failed request is retried (default: 2).
+    backoff : float, optional
+        The delay (in seconds) before the first retry, doubled for each
+        following retry (default: 0.1).
+    max_failures : int, optional
+        The number of consecutive failures of a host opening
+        its circuit (default: 3).
+    reset_timeout : float, optional
+        The number of seconds during which a host whose circuit is
+        open isn't used (default: 30).
+    hedge : float, optional
+        The percentile (like 95) of the latencies of the recent 'route' and
+        'nearest' requests after which such a request, still without
+        response, is sent again to another host, the first response being
+        used (default: None, ie. no hedged requests).
+
+    Examples
+    --------
+    >>> MyConfig = osrm.RequestConfig(
+    ...     "localhost:5000/v1/driving",
+    ...     hosts=osrm.HostPool(["10.0.0.1:5000", "10.0.0.2:5000"],
+    ...                         strategy='least-outstanding'))
+    >>> result = osrm.simple_route(p1, p2, url_config=MyConfig)
+    >>> MyConfig.hosts.status()
+    """
+    # The number of latencies kept (and needed) to compute the hedging delay :
+    hedge_window = 1000
+    hedge_min_samples = 20
+
+    def __init__(self, hosts, strategy='round-robin', retries=2, backoff=0.1,
+                 max_failures=3, reset_timeout=30, hedge=None):
+        if not hosts:
+            raise ValueError("At least one host is needed")
+        if strategy not in ('round-robin', 'least-outstanding'):
+            raise ValueError("Invalid strategy (should be 'round-robin' "
+                             "or 'least-outstanding')")
+        self.hosts = list(hosts)
+        self.strategy = strategy
+        self.retries = retries
+        self.backoff = backoff
+        self.max_failures = max_failures
+        self.reset_timeout = reset_timeout
+        self.hedge = hedge
+        self._latencies = deque(maxlen=self.hedge_window)
+        self._hedge_counts = [0, 0, 0]
+        self._outstanding = dict.fromkeys(self.hosts, 0)
+        self._failures = dict.fromkeys(self.hosts, 0)
+        self._opened = dict.fromkeys(self.hosts)
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def _available(self, host, now):
+        opened = self._opened[host]
+        return opened is None or now - opened >= self.reset_timeout
+
+    def acquire(self, exclude=()):
+        """
+        Choose the host to send a request to (preferably not one of the
+        `exclude` hosts, which already failed for this request), to be
+        given back with `release` once the request is done.
+
+        Raises
+        ------
+        URLError
+            If the circuits of all the hosts are open.
+        """
+        with self._lock:
+            now = _clock()
+            candidates = [h for h in self.hosts if self._available(h, now)]
+            candidates = [h for h in candidates if h not in exclude] \
+                or candidates
+            if not candidates:
+                raise URLError("No available OSRM host (the circuits of "
+                               "all the hosts are open)")
+            if self.strategy == 'round-robin':
+                n = len(self.hosts)
+                host = next(self.hosts[(self._next + k) % n] for k in range(n)
+                            if self.hosts[(self._next + k) % n] in candidates)
+                self._next = (self.hosts.index(host) + 1) % n
+            else:
+                host = min(candidates, key=self._outstanding.get)
+            if self._opened[host] is not None:
+                # Only one request is tried on a host whose circuit is open :
+                self._opened[host] = now
+            self._outstanding[host] += 1
+            return host
+
+    def release(self, host, failed):
+        """
+        Give back a `host` obtained from `acquire`, telling whether
+        the request `failed` because of it.
+        """
+        with self._lock:
+            self._outstanding[host] -= 1
+            if failed:
+                self._failures[host] += 1
+                if self._failures[host] >= self.max_failures:
+                    self._opened[host] = _clock()
+            else:
+                self._failures[host] = 0
+                self._opened[host] = None
+
+    @staticmethod
+    def is_failure(err):
+        """
+        Whether the exception `err`, raised while sending a request,
+        is a failure of the host (worth retrying the request elsewhere)
+        rather than an error of the request itself (like a 400 status).
+        """
+        if isinstance(err, HTTPError):
+            return err.code >= 500 or err.code == 429
+        return isinstance(err, (URLError, socket.error, HTTPException))
+
+    def delay(self, attempt):
+        """
+        Return the number of seconds to wait before the retry following
+        the `attempt`-th one (between half and all of the exponential
+        backoff, to avoid retrying all the requests at the same time).
+        """
+        return self.backoff * 2 ** attempt * random.uniform(0.5, 1)
+
+    def status(self):
+        """ Return the status of each host as a list of `HostStatus` tuples """
+        with self._lock:
+            now = _clock()
+            return [HostStatus(host, self._outstanding[host],
+                               self._failures[host],
+                               self._available(host, now))
+                    for host in self.hosts]
+
+    def hedge_delay(self):
+        """
+        Return the number of seconds after which a request still without
+        response is hedged (or None if hedging is disabled, if there is a
+        single host or if not enough latencies were recorded yet).
+        """
+        if self.hedge is None or len(self.hosts) < 2:
+            return None
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.hedge_min_samples:
+            return None
+        return latencies[min(int(len(latencies) * self.hedge / 100.),
+                             len(latencies) - 1)]
+
+    def record_latency(self, seconds):
+        """ Record the latency of a (first, not hedged) request """
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def record_hedge(self, hedged, won):
+        """
+        Count a request which could be hedged, telling whether it was
+        `hedged` and whether the hedged request `won` (ie. answered first).
+        """
+        with self._lock:
+            self._hedge_counts[0] += 1
+            self._hedge_counts[1] += bool(hedged)
+            self._hedge_counts[2] += bool(won)
+
+    def hedge_info(self):
+        """
+        Return the number of requests which could be hedged, of hedged
+        requests, of hedged requests answered first and the current hedging
+        delay as a `HedgeInfo` tuple
+        """
+        with self._lock:
+            counts = list(self._hedge_counts)
+        return HedgeInfo(*(counts + [self.hedge_delay()]))
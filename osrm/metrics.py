@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+In-process metrics (per-stage timings, response sizes and status codes)
+of the requests made to the OSRM instance.
+"""
+from collections import namedtuple
+import bisect
+import threading
+
+Histogram = namedtuple("Histogram", ("buckets", "counts", "sum", "count"))
+
+DEFAULT_TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                        0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DEFAULT_SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+
+class _Histogram:
+    """ Counts of observed values by bucket (like a Prometheus histogram) """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last one for +Inf
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        return Histogram(self.buckets, list(self.counts), self.sum, self.count)
+
+
+class Metrics:
+    """
+    Thread-safe registry of the timings of the requests made to the OSRM
+    instance, by service (like 'route' or 'table'), profile and stage:
+
+        - 'url': building the url of the query,
+        - 'network': sending the query and reading the response,
+        - 'parse': parsing the JSON response,
+        - 'geometry': decoding/converting the geometries of a 'route',
+          'match' or 'trip' result,
+        - 'format': converting a 'table' result to the asked output,
+
+    along with the size of the responses and the count of each status
+    ('Ok', 'NoRoute', etc. or the HTTP status code, or 'URLError').
+
+    Once attached to a RequestConfig object (through its `metrics` attribute),
+    every request made by `match`, `simple_route`, `table`, `nearest` and
+    `trip` with this config is recorded.
+
+    Parameters
+    ----------
+    time_buckets : sequence of float, optional
+        The upper bounds (in seconds) of the buckets of the
+        timing histograms (default: from 0.5ms to 30s).
+    size_buckets : sequence of float, optional
+        The upper bounds (in bytes) of the buckets of the response
+        size histograms (default: from 1kB to 100MB).
+    hook : callable, optional
+        A function called with (service, profile, stage, value) for each
+        recorded value, `stage` being 'size' for the response sizes and
+        'status' for the status codes (default: None).
+
+    Examples
+    --------
+    >>> MyConfig = osrm.RequestConfig("localhost:5000/v1/driving",
+    ...                               metrics=osrm.Metrics())
+    >>> result = osrm.simple_route(p1, p2, url_config=MyConfig)
+    >>> MyConfig.metrics.histograms()[('route', 'driving', 'network')].sum
+    >>> print(MyConfig.metrics.to_prometheus())
+    """
+    def __init__(self, time_buckets=DEFAULT_TIME_BUCKETS,
+                 size_buckets=DEFAULT_SIZE_BUCKETS, hook=None):
+        self.time_buckets = tuple(sorted(time_buckets))
+        self.size_buckets = tuple(sorted(size_buckets))
+        self.hook = hook
+        self._timings = {}
+        self._sizes = {}
+        self._statuses = {}
+        self._lock = threading.Lock()
+
+    def observe(self, service, profile, stage, seconds):
+        """ Record the duration of a `stage` of a request """
+        key = (service, profile, stage)
+        with self._lock:
+            hist = self._timings.get(key)
+            if hist is None:
+                hist = self._timings[key] = _Histogram(self.time_buckets)
+            hist.observe(seconds)
+        if self.hook is not None:
+            self.hook(service, profile, stage, seconds)
+
+    def record_response(self, service, profile, status, size):
+        """ Record the `status` and the `size` (in bytes) of a response """
+        key = (service, profile)
+        status = str(status)
+        with self._lock:
+            hist = self._sizes.get(key)
+            if hist is None:
+                hist = self._sizes[key] = _Histogram(self.size_buckets)
+            if size is not None:
+                hist.observe(size)
+            self._statuses[key + (status,)] = \
+                self._statuses.get(key + (status,), 0) + 1
+        if self.hook is not None:
+            if size is not None:
+                self.hook(service, profile, 'size', size)
+            self.hook(service, profile, 'status', status)
+
+    def histograms(self):
+        """
+        Return the timing histograms as a dict of `Histogram` tuples
+        (buckets, counts, sum, count), the counts not being cumulative and
+        the last one being for the values above the last bucket, indexed
+        by (service, profile, stage) tuples
+        """
+        with self._lock:
+            return {key: hist.snapshot()
+                    for key, hist in self._timings.items()}
+
+    def sizes(self):
+        """
+        Return the response size histograms (see `histograms`)
+        indexed by (service, profile) tuples
+        """
+        with self._lock:
+            return {key: hist.snapshot() for key, hist in self._sizes.items()}
+
+    def statuses(self):
+        """
+        Return the number of responses of each status,
+        indexed by (service, profile, status) tuples
+        """
+        with self._lock:
+            return dict(self._statuses)
+
+    def clear(self):
+        """ Remove all the recorded values """
+        with self._lock:
+            self._timings.clear()
+            self._sizes.clear()
+            self._statuses.clear()
+
+    def to_prometheus(self, prefix='osrm_client'):
+        """
+        Export the metrics in the Prometheus text exposition format.
+
+        Parameters
+        ----------
+        prefix : str, optional
+            The prefix of the names of the metrics (default: 'osrm_client').
+
+        Returns
+        -------
+        text : str
+        """
+        lines = []
+        _prometheus_histograms(
+            lines, prefix + '_stage_seconds',
+            'Duration of each stage of the requests to OSRM',
+            ('service', 'profile', 'stage'), self.histograms())
+        _prometheus_histograms(
+            lines, prefix + '_response_bytes',
+            'Size of the responses from OSRM',
+            ('service', 'profile'), self.sizes())
+        name = prefix + '_responses_total'
+        lines.append('# HELP {} Responses from OSRM by status'.format(name))
+        lines.append('# TYPE {} counter'.format(name))
+        for key, count in sorted(self.statuses().items()):
+            lines.append('{}{{{}}} {}'.format(
+                name, _labels(('service', 'profile', 'status'), key), count))
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(names, values):
+    """ Helper function to format the labels of a Prometheus sample """
+    return ','.join('{}="{}"'.format(
+        name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in zip(names, values))
+
+
+def _prometheus_histograms(lines, name, help_text, label_names, histograms):
+    """
+    Helper function to append the `histograms` (indexed by the values of
+    their `label_names`) to `lines` in the Prometheus text format
+    """
+    lines.append('# HELP {} {}'.format(name, help_text))
+    lines.append('# TYPE {} histogram'.format(name))
+    for key, hist in sorted(histograms.items()):
+        labels = _labels(label_names, key)
+        cumulated = 0
+        for bound, count in zip(hist.buckets + ('+Inf',), hist.counts):
+            cumulated += count
+            lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                name, labels, bound, cumulated))
+        lines.append('{}_sum{{{}}} {}'.format(name, labels, repr(hist.sum)))
+        lines.append('{}_count{{{}}} {}'.format(name, labels, hist.count))
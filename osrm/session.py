@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent (keep-alive) HTTP connections for the osrm.core functions.
+"""
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from io import BytesIO
+
+try:
+    from http.client import HTTPConnection, HTTPSConnection, HTTPException
+    from urllib.parse import urlsplit
+    from urllib.request import (
+        URLError, HTTPError, HTTPHandler, HTTPSHandler, build_opener)
+except:
+    from httplib import HTTPConnection, HTTPSConnection, HTTPException
+    from urlparse import urlsplit
+    from urllib2 import (
+        URLError, HTTPError, HTTPHandler, HTTPSHandler, build_opener)
+
+# The `_Abort` watching the requests sent by the current thread (if any) :
+_WATCHING = threading.local()
+_ABORTABLE_OPENER = None
+_OPENER_LOCK = threading.Lock()
+
+
+class SessionResponse:
+    """
+    The (fully read) response to a request sent through a `Session`.
+
+    Attributes
+    ----------
+    status : int
+        The HTTP status code of the response.
+    headers : http.client.HTTPMessage
+        The headers of the response.
+    """
+    def __init__(self, content, status, headers):
+        self.content = content
+        self.status = status
+        self.headers = headers
+
+    def read(self):
+        return self.content
+
+    def getcode(self):
+        return self.status
+
+
+class Session:
+    """
+    Thread-safe pool of HTTP/1.1 keep-alive connections, organized by host.
+
+    Once attached to a RequestConfig object (through its `session` attribute),
+    every request made by `match`, `simple_route`, `table`, `nearest` and `trip`
+    with this config reuses an idle connection to the same host (if any)
+    instead of paying a new TCP (and TLS) handshake.
+
+    Parameters
+    ----------
+    pool_size : int, optional
+        The maximum number of idle connections kept open per host (default: 10).
+        More connections can be opened when more threads are querying
+        simultaneously, but only `pool_size` of them will be kept afterwards.
+    timeout : float, optional
+        Timeout (in seconds) for the blocking operations on the connections
+        (default: None, ie. the global default timeout).
+
+    Examples
+    --------
+    >>> MyConfig = osrm.RequestConfig("localhost:5000/v1/driving",
+    ...                               session=osrm.Session())
+    >>> result = osrm.simple_route(p1, p2, url_config=MyConfig)
+    """
+    def __init__(self, pool_size=10, timeout=None):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _get_connection(self, scheme, netloc):
+        with self._lock:
+            pool = self._pools.get((scheme, netloc))
+            if pool:
+                return pool.pop()
+        klass = HTTPSConnection if scheme == 'https' else HTTPConnection
+        if self.timeout is None:
+            return klass(netloc)
+        return klass(netloc, timeout=self.timeout)
+
+    def _release_connection(self, scheme, netloc, conn):
+        with self._lock:
+            pool = self._pools.setdefault((scheme, netloc), [])
+            if len(pool) < self.pool_size:
+                pool.append(conn)
+                return
+        conn.close()
+
+    def open(self, req):
+        """
+        Send a request and read its response, reusing a pooled connection.
+
+        Parameters
+        ----------
+        req : urllib.request.Request
+            The request to send (its url, method, body and headers are used).
+
+        Returns
+        -------
+        response : SessionResponse
+            The response, read entirely, exposing a `read` method
+            like the object returned by `urlopen`.
+
+        Raises
+        ------
+        URLError
+            If the host can't be reached.
+        HTTPError
+            If the server replied with an HTTP error code.
+        """
+        url = req.get_full_url()
+        scheme, netloc, path, query, _ = urlsplit(url)
+        if query:
+            path = '?'.join([path, query])
+        headers = dict(req.header_items())
+        body = getattr(req, 'data', None)
+
+        for attempt in range(2):
+            conn = self._get_connection(scheme, netloc)
+            reused = conn.sock is not None
+            try:
+                conn.request(req.get_method(), path or '/', body, headers)
+                _register_socket(conn.sock)
+                rep = conn.getresponse()
+                content = rep.read()
+            except (socket.error, HTTPException) as err:
+                conn.close()
+                # The server may have closed an idle connection from the pool,
+                # so try again once with a fresh one (unless it's the request
+                # which was interrupted) :
+                if reused and attempt == 0 and not _aborted():
+                    continue
+                raise URLError(err)
+            break
+
+        _unregister_socket(conn.sock)
+        if rep.will_close:
+            conn.close()
+        else:
+            self._release_connection(scheme, netloc, conn)
+
+        if rep.status >= 400:
+            raise HTTPError(url, rep.status, rep.reason, rep.msg,
+                            BytesIO(content))
+        return SessionResponse(content, rep.status, rep.msg)
+
+    def close(self):
+        """ Close all the idle connections of the pool """
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            for conn in pool:
+                conn.close()
+
+
+class _Abort:
+    """
+    Interruption, from another thread, of the requests sent by the thread
+    watching it (see `_watch`) : their sockets are shut down, so they fail
+    instead of waiting for their response.
+    """
+    def __init__(self):
+        self.aborted = False
+        self._sockets = []
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+
+    def register(self, sock):
+        with self._lock:
+            if self._sockets is None:
+                return
+            self._sockets.append(sock)
+            if self.aborted:
+                _shutdown(sock)
+
+    def unregister(self, sock):
+        with self._lock:
+            if self._sockets and sock in self._sockets:
+                self._sockets.remove(sock)
+
+    def abort(self):
+        with self._lock:
+            self.aborted = True
+            self._event.set()
+            for sock in self._sockets or []:
+                _shutdown(sock)
+
+    def sleep(self, delay):
+        """ Sleep `delay` seconds, unless (or until) interrupted """
+        self._event.wait(delay)
+
+    def finish(self):
+        """ Stop watching the sockets (pooled ones being reused elsewhere) """
+        with self._lock:
+            self._sockets = None
+
+
+@contextmanager
+def _watch(abort):
+    """
+    Helper context manager making `abort` (an `_Abort`) able to interrupt
+    the requests sent by the current thread in its block
+    """
+    _WATCHING.abort = abort
+    try:
+        yield
+    finally:
+        _WATCHING.abort = None
+        abort.finish()
+
+
+def _watched():
+    """ Whether the requests of the current thread can be interrupted """
+    return getattr(_WATCHING, 'abort', None) is not None
+
+
+def _aborted():
+    """ Whether the requests of the current thread have been interrupted """
+    abort = getattr(_WATCHING, 'abort', None)
+    return abort is not None and abort.aborted
+
+
+def _sleep(delay):
+    """
+    Sleep `delay` seconds, the `_Abort` watching the current thread (if any)
+    being able to interrupt the sleep
+    """
+    abort = getattr(_WATCHING, 'abort', None)
+    if abort is None:
+        time.sleep(delay)
+    else:
+        abort.sleep(delay)
+
+
+def _register_socket(sock):
+    abort = getattr(_WATCHING, 'abort', None)
+    if abort is not None and sock is not None:
+        abort.register(sock)
+
+
+def _unregister_socket(sock):
+    abort = getattr(_WATCHING, 'abort', None)
+    if abort is not None and sock is not None:
+        abort.unregister(sock)
+
+
+def _shutdown(sock):
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except (socket.error, ValueError):
+        pass
+
+
+def _abortable_urlopen(req):
+    """
+    Helper function acting like `urlopen`, but on connections which can be
+    interrupted by the `_Abort` watching the current thread
+    """
+    global _ABORTABLE_OPENER
+    with _OPENER_LOCK:
+        if _ABORTABLE_OPENER is None:
+            _ABORTABLE_OPENER = build_opener(
+                _AbortableHTTPHandler, _AbortableHTTPSHandler)
+    return _ABORTABLE_OPENER.open(req)
+
+
+class _AbortableHTTPConnection(HTTPConnection):
+    def connect(self):
+        HTTPConnection.connect(self)
+        _register_socket(self.sock)
+
+
+class _AbortableHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        HTTPSConnection.connect(self)
+        _register_socket(self.sock)
+
+
+class _AbortableHTTPHandler(HTTPHandler):
+    def do_open(self, http_class, req, **kwargs):
+        return HTTPHandler.do_open(
+            self, _AbortableHTTPConnection, req, **kwargs)
+
+
+class _AbortableHTTPSHandler(HTTPSHandler):
+    def do_open(self, http_class, req, **kwargs):
+        return HTTPSHandler.do_open(
+            self, _AbortableHTTPSConnection, req, **kwargs)
@@ -11,6 +11,7 @@ setup(
     author="Uli Strötz, mthh",
     description="A Python wrapper around the OSRM API",
     install_requires=requirements,
+    extras_require={"gdal": ["GDAL"], "fastjson": ["orjson"]},
     name='osrm',
     packages=['osrm'],
     test_suite="tests",
@@ -10,10 +10,30 @@ try:
 except:
     from urllib2 import URLError
 
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+except:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+
+try:
+    from urllib.parse import urlsplit, parse_qs, unquote
+except:
+    from urlparse import urlsplit, parse_qs
+    from urllib2 import unquote
+
 from pandas import DataFrame
 from geopandas import GeoDataFrame
+import json
 import numpy
 import os
+import polyline
+import shutil
+import sys
+import tempfile
+import threading
+import time
 
 import osrm
 
@@ -26,6 +46,118 @@ class MockReadable:
         return self.content.encode('utf-8')
 
 
+def fake_table_response(url):
+    """
+    Build a 'table' response for the requested url, with a duration/distance
+    between two points depending only on their coordinates.
+    """
+    _, _, path, query, _ = urlsplit(url)
+    coords = unquote(path.split('/')[-1])
+    if coords.startswith('polyline('):
+        coords = [(x, y) for y, x in polyline.decode(coords[9:-1])]
+    else:
+        coords = [tuple(map(float, c.split(','))) for c in coords.split(';')]
+    params = parse_qs(query)
+    sources = list(map(int, params['sources'][0].split(';'))) \
+        if 'sources' in params else list(range(len(coords)))
+    destinations = list(map(int, params['destinations'][0].split(';'))) \
+        if 'destinations' in params else list(range(len(coords)))
+
+    def location(i):
+        return {"location": [round(coords[i][0] + 0.001, 6),
+                             round(coords[i][1] + 0.001, 6)]}
+
+    def value(i, j):
+        return round(abs(coords[i][0] - coords[j][0]) * 1000
+                     + abs(coords[i][1] - coords[j][1]) * 100, 1)
+
+    result = {
+        "code": "Ok",
+        "sources": [location(i) for i in sources],
+        "destinations": [location(j) for j in destinations],
+        }
+    annotations = params.get('annotations', ['duration'])[0].split(',')
+    for annotation in annotations:
+        result["{}s".format(annotation)] = [
+            [value(i, j) for j in destinations] for i in sources]
+    return result
+
+
+def fake_table_urlopen(req):
+    return MockReadable(json.dumps(fake_table_response(req.get_full_url())))
+
+
+def fake_match_response(url):
+    """
+    Build a 'match' response for the requested url, where each point
+    is matched on itself and each leg has a distance of 1.
+    """
+    parts = urlsplit(url)
+    coords = [[float(v) for v in c.split(',')]
+              for c in unquote(parts.path.split('/')[-1]).split(';')]
+    legs = [{"distance": 1, "duration": 2, "steps": [
+                {"geometry": polyline.encode([a[::-1], b[::-1]])}]}
+            for a, b in zip(coords[:-1], coords[1:])]
+    return {
+        "code": "Ok",
+        "matchings": [{"confidence": 1, "legs": legs,
+                       "distance": len(legs), "duration": 2 * len(legs)}],
+        "tracepoints": [{"matchings_index": 0, "waypoint_index": i,
+                         "location": c} for i, c in enumerate(coords)]
+        }
+
+
+def fake_match_urlopen(req):
+    return MockReadable(json.dumps(fake_match_response(req.get_full_url())))
+
+
+class MockOsrmHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    content = u'{"code":"Ok"}'
+    client_ports = set()
+    # The number of requests being answered (and its maximum) :
+    active = max_active = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = MockOsrmHandler
+        with cls.lock:
+            cls.client_ports.add(self.client_address[1])
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+        try:
+            time.sleep(self.server.delay)
+            body = self.content.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def start_mock_server(content, delay=0):
+    MockOsrmHandler.content = content
+    MockOsrmHandler.client_ports = set()
+    MockOsrmHandler.active = MockOsrmHandler.max_active = 0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockOsrmHandler)
+    server.delay = delay
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
 class TestOsrmWrapper(unittest.TestCase):
     def setUp(self):
         pass
@@ -38,6 +170,74 @@ class TestOsrmWrapper(unittest.TestCase):
         self.assertEqual(p1.longitude, p1[0])
         self.assertEqual(p1.latitude, p1[1])
 
+    def test_decode_polyline(self):
+        coords = [(42.004088, 21.056616), (42.00389, 21.056937),
+                  (41.5286973, 20.9574645), (-33.45017, -70.652818)]
+        for precision in (5, 6):
+            encoded = polyline.encode(coords, precision)
+            decoded = osrm.decode_polyline(encoded, precision)
+            self.assertIsInstance(decoded, numpy.ndarray)
+            self.assertEqual(decoded.shape, (4, 2))
+            # Coordinates are returned as (x, y) :
+            self.assertEqual(
+                decoded.tolist(),
+                [[x, y] for y, x in polyline.decode(encoded, precision)])
+
+        self.assertEqual(osrm.decode_polyline('').shape, (0, 2))
+        with self.assertRaises(ValueError):
+            osrm.decode_polyline(encoded[:-1])
+
+    def test_line_to_wkb_wkt(self):
+        import struct
+        coords = osrm.decode_polyline("g|j_Goro_CEO")
+
+        wkt = osrm.line_to_wkt(coords)
+        self.assertEqual(
+            wkt, "LINESTRING (21.05656 42.00404,21.05664 42.00407)")
+        self.assertEqual(osrm.line_to_wkt(coords[:0]), "LINESTRING EMPTY")
+
+        for byte_order, endian in ((0, '>'), (1, '<')):
+            wkb = osrm.line_to_wkb(coords, byte_order=byte_order)
+            self.assertEqual(len(wkb), 9 + 16 * len(coords))
+            self.assertEqual(struct.unpack(endian + 'BII', wkb[:9]),
+                             (byte_order, 2, 2))
+            self.assertEqual(
+                list(struct.unpack(endian + '4d', wkb[9:])),
+                coords.ravel().tolist())
+
+    def test_lazy_imports(self):
+        import subprocess
+        code = ("import sys, osrm; print(','.join(m for m in ("
+                "'pandas', 'geopandas', 'matplotlib', 'scipy', 'shapely', "
+                "'osgeo', 'ogr') if m in sys.modules))")
+        loaded = subprocess.check_output(
+            [sys.executable, '-c', code],
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+        # No heavy dependency should be loaded by `import osrm` :
+        self.assertEqual(loaded.strip(), b'')
+        self.assertEqual(osrm.AccessIsochrone.__name__, 'AccessIsochrone')
+
+    def test_json_backend(self):
+        content = (b'{"code":"Ok","durations":[[0,12.5],[null,0]],'
+                   b'"sources":[{"location":[1,2]},{"location":[3,4]}]}')
+        for backend in ('json', None):
+            osrm.set_json_backend(backend)
+            parsed = osrm.core._parse_table_response(content)
+            self.assertIsInstance(parsed["durations"], numpy.ndarray)
+            self.assertEqual(parsed["durations"].shape, (2, 2))
+            self.assertTrue(numpy.isnan(parsed["durations"][1, 0]))
+            self.assertEqual(parsed["durations"][0, 1], 12.5)
+            self.assertEqual(parsed["sources"][1]["location"], [3, 4])
+            # Matrices which aren't written compactly are parsed as lists :
+            parsed = osrm.core._parse_table_response(
+                b'{"code": "Ok", "distances": [[0, 1], [2, 0]]}')
+            self.assertEqual(parsed["distances"], [[0, 1], [2, 0]])
+
+        self.assertEqual(osrm.set_json_backend(json.loads), 'json')
+        with self.assertRaises(ValueError):
+            osrm.set_json_backend('simplejson')
+        osrm.set_json_backend()
+
     def test_RequestConfig(self):
         default_host = osrm.RequestConfig.host
 
@@ -58,6 +258,95 @@ class TestOsrmWrapper(unittest.TestCase):
         # Parameters from the original RequestConfig object haven't changed:
         self.assertEqual(osrm.RequestConfig.host, default_host)
 
+    def test_session(self):
+        server = start_mock_server(
+            u"""{"waypoints":[{"distance":22064.816067,"name":"","location":[41.324078,21.918251]}],"code":"Ok"}"""
+            )
+        session = osrm.Session()
+        MyConfig = osrm.RequestConfig(
+            "127.0.0.1:{}/v1/driving".format(server.server_port),
+            session=session)
+        try:
+            for _ in range(5):
+                result = osrm.nearest((41.5332, 21.9598), url_config=MyConfig)
+                self.assertEqual(result["code"], "Ok")
+            # All the requests should have been made on the same connection :
+            self.assertEqual(len(MockOsrmHandler.client_ports), 1)
+        finally:
+            session.close()
+            server.shutdown()
+            server.server_close()
+
+        # The default configuration doesn't use any session :
+        self.assertIsNone(osrm.RequestConfig.session)
+
+    @mock.patch('osrm.core.urlopen')
+    def test_response_cache(self, mock_urlopen):
+        mock_urlopen.return_value = MockReadable(
+            u"""{"waypoints":[{"distance":22064.816067,"name":"","location":[41.324078,21.918251]}],"code":"Ok"}"""
+            )
+        cache = osrm.ResponseCache(maxsize=2)
+        MyConfig = osrm.RequestConfig("localhost/v1/driving", cache=cache)
+        for _ in range(3):
+            result = osrm.nearest((41.5332, 21.9598), url_config=MyConfig)
+            self.assertEqual(result["code"], "Ok")
+        # Coordinates are compared once rounded :
+        osrm.nearest((41.533201, 21.959799), url_config=MyConfig)
+        self.assertEqual(mock_urlopen.call_count, 1)
+        self.assertEqual(cache.info(), (3, 1, 2, 1))
+
+        # Other options, other queries :
+        osrm.nearest((41.5332, 21.9598), number=2, url_config=MyConfig)
+        osrm.nearest((41.6, 21.9), url_config=MyConfig)
+        self.assertEqual(mock_urlopen.call_count, 3)
+        self.assertEqual(len(cache), 2)  # The least recently used was evicted
+
+        cache.clear()
+        self.assertEqual(cache.info(), (0, 0, 2, 0))
+
+        # Expired responses aren't used :
+        MyConfig.cache = osrm.ResponseCache(ttl=-1)
+        osrm.nearest((41.5332, 21.9598), url_config=MyConfig)
+        osrm.nearest((41.5332, 21.9598), url_config=MyConfig)
+        self.assertEqual(mock_urlopen.call_count, 5)
+
+        # Neither are failed queries stored :
+        mock_urlopen.return_value = MockReadable(
+            u"""{"code":"NoSegment","message":"Could not find a matching segment for any coordinate."}""")
+        MyConfig.cache = cache
+        osrm.nearest((1.0, 2.0), url_config=MyConfig)
+        self.assertEqual(len(cache), 0)
+
+    @unittest.skipIf(sys.version_info < (3, 5), "Requires python >= 3.5")
+    def test_aio(self):
+        import asyncio
+        import osrm.aio
+
+        server = start_mock_server(
+            u"""{"waypoints":[{"distance":22064.816067,"name":"","location":[41.324078,21.918251]}],"code":"Ok"}"""
+            )
+        MyConfig = osrm.RequestConfig(
+            "127.0.0.1:{}/v1/driving".format(server.server_port))
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        client = osrm.aio.Client(limit_per_host=4)
+        try:
+            results = loop.run_until_complete(asyncio.gather(*[
+                osrm.aio.nearest((41.5332, 21.9598), url_config=MyConfig,
+                                 client=client)
+                for _ in range(20)]))
+            self.assertEqual(len(results), 20)
+            self.assertEqual(results[0]["waypoints"][0]["distance"],
+                             22064.816067)
+            # No more than `limit_per_host` connections should have been used :
+            self.assertLessEqual(len(MockOsrmHandler.client_ports), 4)
+            loop.run_until_complete(client.close())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+            server.shutdown()
+            server.server_close()
+
     @mock.patch('osrm.core.urlopen')
     def test_nearest(self, mock_urlopen):
         mock_urlopen.return_value = MockReadable(
@@ -67,6 +356,175 @@ class TestOsrmWrapper(unittest.TestCase):
         # nearest only return the parsed JSON response
         self.assertEqual(result["waypoints"][0]["distance"], 22064.816067)
 
+    @mock.patch('osrm.core.urlopen')
+    def test_host_pool(self, mock_urlopen):
+        hosts = []
+
+        def fake_urlopen(req):
+            host = urlsplit(req.get_full_url()).netloc
+            hosts.append(host)
+            if host == "10.0.0.2:5000":
+                raise URLError("Connection refused")
+            if host == "10.0.0.3:5000":
+                raise osrm.hosts.HTTPError(
+                    req.get_full_url(), 400, "Bad Request", {}, None)
+            return MockReadable(u'{"code":"Ok","waypoints":[]}')
+
+        mock_urlopen.side_effect = fake_urlopen
+        pool = osrm.HostPool(["10.0.0.1:5000", "10.0.0.2:5000"],
+                             backoff=0, max_failures=2)
+        MyConfig = osrm.RequestConfig("localhost:5000/v1/driving", hosts=pool)
+        self.assertEqual(MyConfig.host, "10.0.0.1:5000")
+
+        # Round-robin, the failed requests being retried on the other host :
+        for _ in range(4):
+            self.assertEqual(osrm.nearest((41.5, 21.9), url_config=MyConfig),
+                             {"code": "Ok", "waypoints": []})
+        self.assertEqual(hosts, ["10.0.0.1:5000", "10.0.0.2:5000",
+                                 "10.0.0.1:5000", "10.0.0.2:5000",
+                                 "10.0.0.1:5000", "10.0.0.1:5000"])
+        # ..until the circuit of the failing host is open :
+        self.assertEqual([(st.failures, st.available) for st in pool.status()],
+                         [(0, True), (2, False)])
+        del hosts[:]
+        osrm.nearest((41.5, 21.9), url_config=MyConfig)
+        self.assertEqual(hosts, ["10.0.0.1:5000"])
+
+        # Errors of the request itself aren't retried :
+        MyConfig = osrm.RequestConfig(hosts=["10.0.0.3:5000", "10.0.0.1:5000"])
+        del hosts[:]
+        with self.assertRaises(URLError):
+            osrm.nearest((41.5, 21.9), url_config=MyConfig)
+        self.assertEqual(hosts, ["10.0.0.3:5000"])
+        self.assertEqual(MyConfig.hosts.status()[0].failures, 0)
+
+        with self.assertRaises(ValueError):
+            osrm.HostPool(["10.0.0.1:5000"], strategy='random')
+
+    def test_hedged_requests(self):
+        content = u'{"code":"Ok","waypoints":[]}'
+        slow = start_mock_server(content, delay=0.5)  # The slow replica
+        fast = start_mock_server(content)
+        medium = start_mock_server(content, delay=0.05)
+        hosts = ["127.0.0.1:{}".format(server.server_address[1])
+                 for server in (slow, fast)]
+        pool = osrm.HostPool(hosts, hedge=95)
+        MyConfig = osrm.RequestConfig(hosts=pool)
+        # No hedging until enough latencies are known :
+        self.assertIsNone(pool.hedge_delay())
+        for _ in range(pool.hedge_min_samples):
+            pool.record_latency(0.01)
+        self.assertEqual(pool.hedge_delay(), 0.01)
+
+        sent = []
+        fetch_failover = osrm.core._fetch_failover
+
+        def spy(url, url_config, pool, exclude=(), hosts=None):
+            sent.append((threading.current_thread().name, list(exclude)))
+            return fetch_failover(url, url_config, pool, exclude, hosts)
+
+        try:
+            with mock.patch('osrm.core._fetch_failover', side_effect=spy):
+                start = time.time()
+                result = osrm.nearest((41.5, 21.9), url_config=MyConfig)
+                elapsed = time.time() - start
+            self.assertEqual(result["code"], "Ok")
+            # The slow request was interrupted by the hedged one :
+            self.assertLess(elapsed, 0.3)
+            # The first request is sent from the calling thread,
+            # the hedged one (only) from a pool, avoiding the first host :
+            self.assertEqual(sent[0], (threading.current_thread().name, []))
+            self.assertNotEqual(sent[1][0], threading.current_thread().name)
+            self.assertEqual(sent[1][1], hosts[:1])
+            info = pool.hedge_info()
+            self.assertEqual((info.requests, info.hedged, info.wins),
+                             (1, 1, 1))
+            # The interrupted host isn't considered as failing :
+            self.assertEqual(pool.status()[0].failures, 0)
+
+            # Only 'route' and 'nearest' requests are hedged :
+            del sent[:]
+            with mock.patch('osrm.core._fetch_failover', side_effect=spy):
+                osrm.trip([(41.5, 21.9), (41.6, 21.8)], url_config=MyConfig)
+            self.assertEqual(len(sent), 1)
+
+            # The hedged request to the slow replica is interrupted
+            # when the first one wins :
+            pool = osrm.HostPool(["127.0.0.1:{}".format(
+                medium.server_address[1]), hosts[0]], hedge=95)
+            MyConfig = osrm.RequestConfig(hosts=pool)
+            for _ in range(pool.hedge_min_samples):
+                pool.record_latency(0.01)
+            hedges = []
+
+            def hedge_spy(url, url_config, pool, exclude=(), hosts=None):
+                if not exclude:
+                    return fetch_failover(url, url_config, pool, exclude,
+                                          hosts)
+                start = time.time()
+                try:
+                    fetch_failover(url, url_config, pool, exclude, hosts)
+                except Exception as err:
+                    hedges.append((err, time.time() - start))
+
+            with mock.patch('osrm.core._fetch_failover',
+                            side_effect=hedge_spy):
+                result = osrm.nearest((41.5, 21.9), url_config=MyConfig)
+                self.assertEqual(result["code"], "Ok")
+                for _ in range(50):
+                    if hedges:
+                        break
+                    time.sleep(0.01)
+            self.assertEqual(len(hedges), 1)
+            self.assertLess(hedges[0][1], 0.3)
+            info = pool.hedge_info()
+            self.assertEqual((info.requests, info.hedged, info.wins),
+                             (1, 1, 0))
+            self.assertEqual([host.failures for host in pool.status()],
+                             [0, 0])
+        finally:
+            slow.shutdown()
+            fast.shutdown()
+            medium.shutdown()
+
+    @mock.patch('osrm.core.urlopen')
+    def test_metrics(self, mock_urlopen):
+        mock_urlopen.side_effect = fake_table_urlopen
+        events = []
+        metrics = osrm.Metrics(hook=lambda *args: events.append(args))
+        MyConfig = osrm.RequestConfig("localhost:5000/v1/car", metrics=metrics)
+        coords = [(21.0 + i / 10.0, 42.0) for i in range(5)]
+        osrm.table(coords, url_config=MyConfig)
+        osrm.table(coords, coords[:2], tile_size=2, url_config=MyConfig)
+
+        mock_urlopen.side_effect = URLError("Connection refused")
+        with self.assertRaises(URLError):
+            osrm.nearest((41.5, 21.9), url_config=MyConfig)
+
+        histograms = metrics.histograms()
+        self.assertEqual(
+            sorted(histograms),
+            [('nearest', 'car', 'url')] + [('table', 'car', stage) for stage
+                                           in ('format', 'network', 'parse',
+                                               'url')])
+        # 1 + 3 queries (blocks of 2 sources) :
+        self.assertEqual(histograms[('table', 'car', 'network')].count, 4)
+        self.assertEqual(histograms[('table', 'car', 'format')].count, 2)
+        self.assertEqual(metrics.statuses(),
+                         {('table', 'car', 'Ok'): 4,
+                          ('nearest', 'car', 'URLError'): 1})
+        self.assertEqual(metrics.sizes()[('table', 'car')].count, 4)
+        self.assertIn(('nearest', 'car', 'status', 'URLError'), events)
+
+        text = metrics.to_prometheus()
+        self.assertIn('# TYPE osrm_client_stage_seconds histogram', text)
+        self.assertIn('osrm_client_stage_seconds_count{service="table",'
+                      'profile="car",stage="network"} 4', text)
+        self.assertIn('osrm_client_stage_seconds_bucket{service="table",'
+                      'profile="car",stage="network",le="+Inf"} 4', text)
+        self.assertIn('osrm_client_responses_total{service="nearest",'
+                      'profile="car",status="URLError"} 1', text)
+
     @mock.patch('osrm.core.urlopen')
     def test_simple_route(self, mock_urlopen):
         mock_urlopen.return_value = MockReadable(
@@ -82,6 +540,92 @@ class TestOsrmWrapper(unittest.TestCase):
         # ... with geometry field transformed to WKT :
         self.assertIn("LINESTRING", result[0]["geometry"])
 
+        result = osrm.simple_route((41.5332, 21.9598), (41.9725, 21.3114),
+                                   output="routes",
+                                   geometry="wkb")
+        self.assertIsInstance(result[0]["geometry"], bytes)
+
+    @mock.patch('osrm.core.urlopen')
+    def test_route_many(self, mock_urlopen):
+        def fake_urlopen(req):
+            if "steps=true" in req.get_full_url():
+                raise URLError("Unreachable")
+            return MockReadable(
+                u'''{"code":"Ok","routes":[{"legs":[],"geometry":"a|wdCobf{F}|@h]","duration":14821.6,"distance":256884.8}],"waypoints":[]}'''
+                )
+        mock_urlopen.side_effect = fake_urlopen
+        pairs = [((41.5332, 21.9598), (41.9725, 21.3114 + i / 100.0))
+                 for i in range(20)]
+        pairs.append(((41.5332, 21.9598), (41.9725, 21.3114),
+                      [(41.7, 21.5)]))
+
+        results = list(osrm.route_many(pairs, workers=4, output="routes"))
+        self.assertEqual([r.index for r in results], list(range(21)))
+        for res in results:
+            self.assertIsInstance(res, osrm.BatchResult)
+            self.assertIsNone(res.error)
+            self.assertEqual(res.result[0]["duration"], 14821.6)
+
+        # Failed queries are reported without interrupting the batch :
+        results = list(osrm.route_many(
+            iter(pairs), workers=4, ordered=False, steps=True))
+        self.assertEqual(sorted(r.index for r in results), list(range(21)))
+        for res in results:
+            self.assertIsNone(res.result)
+            self.assertIsInstance(res.error, URLError)
+
+    @unittest.skipIf(sys.version_info < (3, 5), "Requires python >= 3.5")
+    def test_route_many_async(self):
+        server = start_mock_server(
+            u'''{"code":"Ok","routes":[{"legs":[],"geometry":"a|wdCobf{F}|@h]","duration":14821.6,"distance":256884.8}],"waypoints":[]}''',
+            delay=0.05)
+        MyConfig = osrm.RequestConfig(
+            "127.0.0.1:{}/v1/driving".format(server.server_port))
+        pairs = [((41.5332, 21.9598), (41.9725, 21.3114 + i / 100.0))
+                 for i in range(20)]
+        stats = osrm.BatchStats()
+        try:
+            results = list(osrm.route_many(
+                pairs, workers=4, mode='async', output="routes",
+                url_config=MyConfig, stats=stats))
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual([r.index for r in results], list(range(20)))
+        self.assertTrue(all(r.error is None for r in results))
+        # No more than `workers` queries are in flight at the same time :
+        self.assertEqual(MockOsrmHandler.max_active, 4)
+        # The latencies don't include the wait for a free worker :
+        self.assertEqual(stats.summary()['count'], 20)
+        self.assertLess(max(stats.latencies), 0.15)
+
+    @mock.patch('osrm.core.urlopen')
+    def test_match_many(self, mock_urlopen):
+        def failing_urlopen(req):
+            if "radiuses=" in req.get_full_url():
+                raise URLError("Unreachable")
+            return fake_match_urlopen(req)
+        mock_urlopen.side_effect = failing_urlopen
+        traces = [[(21.0 + i / 1000.0, 42.0 + j / 100.0, 1000 + i)
+                   for i in range(5 + j)] for j in range(10)]
+        traces.append([(21.0, 42.0, 1000, 5), (21.1, 42.1, 1010, 5)])
+
+        stats = osrm.BatchStats()
+        results = list(osrm.match_many(iter(traces), workers=4, stats=stats))
+        self.assertEqual([r.index for r in results], list(range(11)))
+        for res, trace in zip(results[:10], traces):
+            self.assertIsNone(res.error)
+            self.assertEqual(len(res.result["tracepoints"]), len(trace))
+        self.assertIsInstance(results[10].error, URLError)
+        self.assertIn("timestamps=1000;1001;1002",
+                      mock_urlopen.call_args_list[0][0][0].get_full_url())
+
+        summary = stats.summary()
+        self.assertEqual(summary["count"], 11)
+        self.assertEqual(summary["errors"], 1)
+        self.assertGreater(summary["throughput"], 0)
+        self.assertLessEqual(summary["latency_p50"], summary["latency_max"])
+
     @mock.patch('osrm.core.urlopen')
     def test_table_only_origins(self, mock_urlopen):
         mock_urlopen.return_value = MockReadable(
@@ -125,6 +669,340 @@ class TestOsrmWrapper(unittest.TestCase):
         self.assertEqual(durations.shape, expected_shape)
         self.assertTrue(durations.any())
 
+    @mock.patch('osrm.core.urlopen')
+    def test_table_tiles(self, mock_urlopen):
+        mock_urlopen.side_effect = fake_table_urlopen
+        origins = [(21.0 + i / 10.0, 42.0 + (i % 7) / 10.0) for i in range(23)]
+        destinations = [(20.5 + j / 7.0, 41.0 + (j % 3) / 10.0)
+                        for j in range(17)]
+
+        ref, ref_src, ref_dest = osrm.table(origins, destinations)
+        self.assertEqual(mock_urlopen.call_count, 1)
+
+        durations, snapped_src, snapped_dest = osrm.table(
+            origins, destinations, tile_size=5, workers=3)
+        # 5 blocks of sources and 4 blocks of destinations :
+        self.assertEqual(mock_urlopen.call_count, 1 + 5 * 4)
+        self.assertEqual(durations.shape, (23, 17))
+        self.assertTrue(numpy.array_equal(durations, ref))
+        self.assertEqual(snapped_src, ref_src)
+        self.assertEqual(snapped_dest, ref_dest)
+
+        # Symmetric matrix, returned as a labeled DataFrame :
+        names = ['name{}'.format(i) for i in range(23)]
+        ref, ref_src, ref_dest = osrm.table(
+            origins, ids_origin=names, output='df', minutes=True)
+        durations, snapped_src, snapped_dest = osrm.table(
+            origins, ids_origin=names, output='df', minutes=True,
+            tile_size=(10, 6))
+        self.assertIsInstance(durations, DataFrame)
+        self.assertEqual(list(durations.index), names)
+        self.assertEqual(list(durations.columns), names)
+        self.assertTrue(numpy.array_equal(durations.values, ref.values))
+        self.assertEqual(snapped_src, ref_src)
+        self.assertIsNone(snapped_dest)
+
+        with self.assertRaises(ValueError):
+            osrm.table(origins, destinations, output='raw', tile_size=5)
+
+    @mock.patch('osrm.core.urlopen')
+    def test_table_out_file(self, mock_urlopen):
+        mock_urlopen.side_effect = fake_table_urlopen
+        origins = [(21.0 + i / 10.0, 42.0 + (i % 7) / 10.0) for i in range(23)]
+        destinations = [(20.5 + j / 7.0, 41.0 + (j % 3) / 10.0)
+                        for j in range(17)]
+        ref, ref_src, ref_dest = osrm.table(origins, destinations)
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'durations.npy')
+            durations, snapped_src, snapped_dest = osrm.table(
+                origins, destinations, tile_size=5, out=path, dtype='float32')
+            self.assertIsInstance(durations, numpy.memmap)
+            self.assertEqual(snapped_src, ref_src)
+            self.assertEqual(snapped_dest, ref_dest)
+            del durations
+
+            # The file can be reopened without loading it in memory :
+            durations = numpy.load(path, mmap_mode='r')
+            self.assertEqual(durations.dtype, numpy.float32)
+            self.assertTrue(numpy.allclose(durations, ref))
+            del durations
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        durations, _, _ = osrm.table(origins, destinations, dtype='uint32')
+        self.assertEqual(durations.dtype, numpy.uint32)
+        self.assertTrue(numpy.array_equal(durations, numpy.rint(ref)))
+
+        # Missing values are replaced by the maximum of integer types :
+        mock_urlopen.side_effect = None
+        mock_urlopen.return_value = MockReadable(
+            u'''{"code":"Ok","durations":[[0,null],[12.6,0]],"sources":[{"location":[1,2]},{"location":[3,4]}],"destinations":[{"location":[1,2]},{"location":[3,4]}]}''')
+        durations, _, _ = osrm.table([(1, 2), (3, 4)], dtype='uint32')
+        self.assertEqual(durations.tolist(), [[0, 2**32 - 1], [13, 0]])
+
+    @mock.patch('osrm.core.urlopen')
+    def test_table_matrix_cache(self, mock_urlopen):
+        mock_urlopen.side_effect = fake_table_urlopen
+        origins = [(21.0 + i / 10.0, 42.0 + (i % 7) / 10.0) for i in range(12)]
+        destinations = [(20.5 + j / 7.0, 41.0 + (j % 3) / 10.0)
+                        for j in range(9)]
+        ref, ref_src, ref_dest = osrm.table(origins, destinations)
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'matrices.sqlite')
+            cache = osrm.MatrixCache(path, dataset_version='2019-01')
+            durations, snapped_src, snapped_dest = osrm.table(
+                origins[:8], destinations[:6], matrix_cache=cache)
+            self.assertTrue(numpy.allclose(durations, ref[:8, :6]))
+            cache.close()
+
+            # New sources and destinations : only the missing values are
+            # queried (the new rows, then the new columns) :
+            mock_urlopen.reset_mock()
+            cache = osrm.MatrixCache(path, dataset_version='2019-01')
+            durations, snapped_src, snapped_dest = osrm.table(
+                origins, destinations, matrix_cache=cache, minutes=True)
+            self.assertEqual(mock_urlopen.call_count, 2)
+            self.assertTrue(numpy.allclose(durations, (ref / 60).round(2)))
+            self.assertEqual(snapped_src, ref_src)
+            self.assertEqual(snapped_dest, ref_dest)
+
+            mock_urlopen.reset_mock()
+            durations, _, _ = osrm.table(
+                origins[3:], destinations[::-1], matrix_cache=cache,
+                output='df', dtype='uint32')
+            self.assertEqual(mock_urlopen.call_count, 0)
+            self.assertTrue(numpy.array_equal(
+                durations.values, numpy.rint(ref[3:, ::-1])))
+
+            # Another dataset or profile doesn't use the stored values :
+            other_cache = osrm.MatrixCache(path, dataset_version='2019-02')
+            osrm.table(origins, destinations, matrix_cache=other_cache)
+            other_cache.close()
+            osrm.table(origins, destinations, matrix_cache=cache,
+                       url_config=osrm.RequestConfig("localhost/v1/foot"))
+            self.assertEqual(mock_urlopen.call_count, 2)
+
+            # Storing a row without destinations doesn't break the cache :
+            cache.put(osrm.RequestConfig, 'duration', [(10.0, 40.0)], [],
+                      numpy.empty((1, 0)))
+            values, found = cache.get(osrm.RequestConfig, 'duration',
+                                      [(10.0, 40.0)], destinations[:2])
+            self.assertFalse(found.any())
+            cache.close()
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    @mock.patch('osrm.core.urlopen')
+    def test_table_dedupe(self, mock_urlopen):
+        mock_urlopen.side_effect = fake_table_urlopen
+        origins = [(21.1, 42.1), (21.2, 42.3), (21.1, 42.1), (21.100001, 42.1),
+                   (21.2, 42.3)]
+        destinations = [(20.5, 41.0), (20.6, 41.1), (20.5, 41.0)]
+        ref, ref_src, ref_dest = osrm.table(origins, destinations)
+
+        durations, snapped_src, snapped_dest = osrm.table(
+            origins, destinations, dedupe=True)
+        self.assertIn("polyline(" + polyline.encode(
+            [(42.1, 21.1), (42.3, 21.2), (42.1, 21.100001),
+             (41.0, 20.5), (41.1, 20.6)]), unquote(
+                mock_urlopen.call_args[0][0].get_full_url()))
+        self.assertTrue(numpy.allclose(durations, ref))
+        self.assertEqual(snapped_src, ref_src)
+        self.assertEqual(snapped_dest, ref_dest)
+
+        # With a tolerance (in degrees), near-identical coordinates
+        # are only sent once :
+        durations, snapped_src, _ = osrm.table(
+            origins, ids_origin=list('abcde'), output='df', dedupe=1e-4)
+        url = mock_urlopen.call_args[0][0].get_full_url()
+        self.assertIn("polyline(" + polyline.encode(
+            [(42.1, 21.1), (42.3, 21.2)]) + ")", unquote(url))
+        self.assertEqual(list(durations.index), list('abcde'))
+        self.assertEqual(list(durations.columns), list('abcde'))
+        self.assertEqual(durations.values[0, 4], durations.values[2, 1])
+        self.assertEqual(snapped_src[0], snapped_src[3])
+
+        # A numpy boolean isn't taken for a tolerance :
+        durations, _, _ = osrm.table(
+            origins, destinations, dedupe=numpy.bool_(True))
+        self.assertIn("polyline(" + polyline.encode(
+            [(42.1, 21.1), (42.3, 21.2), (42.1, 21.100001),
+             (41.0, 20.5), (41.1, 20.6)]), unquote(
+                mock_urlopen.call_args[0][0].get_full_url()))
+        self.assertTrue(numpy.allclose(durations, ref))
+
+        with self.assertRaises(ValueError):
+            osrm.table(origins, destinations, output='raw', dedupe=True)
+        for tolerance in (0, -1e-4):
+            with self.assertRaises(ValueError):
+                osrm.table(origins, destinations, dedupe=tolerance)
+
+    @mock.patch('osrm.core.urlopen')
+    def test_table_one_to_many(self, mock_urlopen):
+        mock_urlopen.side_effect = fake_table_urlopen
+        origin = (21.5, 42.5)
+        destinations = [(20.5 + j / 7.0, 41.0 + (j % 3) / 10.0)
+                        for j in range(17)]
+        ref, ref_src, ref_dest = osrm.table([origin], destinations)
+
+        durations, snapped_origin, snapped_dest = osrm.table_one_to_many(
+            origin, destinations)
+        self.assertEqual(durations.shape, (17,))
+        self.assertTrue(numpy.allclose(durations, ref[0]))
+        self.assertEqual(snapped_origin, ref_src[0])
+        self.assertEqual(snapped_dest, ref_dest)
+
+        # Many-to-one, queried by chunks :
+        mock_urlopen.reset_mock()
+        ref, ref_src, ref_dest = osrm.table(destinations, [origin])
+        durations, snapped_src, snapped_dest = osrm.table_many_to_one(
+            destinations, origin, minutes=True, chunk_size=5, dtype='float32')
+        self.assertEqual(mock_urlopen.call_count, 5)
+        self.assertEqual(durations.shape, (17,))
+        self.assertEqual(durations.dtype, numpy.float32)
+        self.assertTrue(numpy.allclose(durations, (ref[:, 0] / 60).round(2)))
+        self.assertEqual(snapped_src, ref_src)
+        self.assertEqual(snapped_dest, ref_dest[0])
+
+    @mock.patch('osrm.core.urlopen')
+    def test_table_long_url(self, mock_urlopen):
+        mock_urlopen.side_effect = fake_table_urlopen
+        origins = [(21.0 + i / 10.0, 42.0 + (i % 7) / 10.0) for i in range(3)]
+        destinations = [(20.5 + j / 70.0, 41.0 + (j % 3) / 10.0)
+                        for j in range(60)]
+        MyConfig = osrm.RequestConfig(max_url_length=None)
+        ref, ref_src, ref_dest = osrm.table(
+            origins, destinations, url_config=MyConfig)
+        full_url = mock_urlopen.call_args[0][0].get_full_url()
+
+        # A too long url is split in blocks (sized from their full url, so
+        # that only the requested values are computed by the server) :
+        mock_urlopen.reset_mock()
+        MyConfig.max_url_length = len(full_url) - 1
+        durations, snapped_src, snapped_dest = osrm.table(
+            origins, destinations, url_config=MyConfig)
+        self.assertGreater(mock_urlopen.call_count, 1)
+        for call in mock_urlopen.call_args_list:
+            url = call[0][0].get_full_url()
+            self.assertLessEqual(len(url), MyConfig.max_url_length)
+            self.assertIn("sources=", url)
+            self.assertIn("destinations=", url)
+        self.assertTrue(numpy.array_equal(durations, ref))
+        self.assertEqual(snapped_src, ref_src)
+        self.assertEqual(snapped_dest, ref_dest)
+
+        # ..and the list of destinations is only omitted from the url of
+        # a query which can't be split :
+        result = osrm.table(origins, destinations, output='raw',
+                            url_config=MyConfig)
+        url = mock_urlopen.call_args[0][0].get_full_url()
+        self.assertLess(len(url), len(full_url))
+        self.assertNotIn("destinations=", url)
+        self.assertTrue(numpy.array_equal(result["durations"], ref))
+        self.assertEqual([d["location"] for d in result["destinations"]],
+                         ref_dest)
+
+        mock_urlopen.reset_mock()
+        MyConfig.max_url_length = len(full_url) // 3
+        durations, snapped_src, snapped_dest = osrm.table(
+            origins, destinations, url_config=MyConfig)
+        self.assertGreater(mock_urlopen.call_count, 1)
+        for call in mock_urlopen.call_args_list:
+            self.assertLessEqual(len(call[0][0].get_full_url()),
+                                 MyConfig.max_url_length)
+        self.assertTrue(numpy.array_equal(durations, ref))
+        self.assertEqual(snapped_dest, ref_dest)
+
+        # Same for the values from one origin :
+        values, snapped_origin, snapped_dest = osrm.table_one_to_many(
+            origins[0], destinations, url_config=MyConfig)
+        self.assertTrue(numpy.array_equal(values, ref[0]))
+        self.assertEqual(snapped_dest, ref_dest)
+
+    @mock.patch('osrm.core.urlopen')
+    def test_table_several_annotations(self, mock_urlopen):
+        mock_urlopen.return_value = MockReadable(
+            u'''{"code":"Ok","durations":[[0,120.6],[130.2,0]],"distances":[[0,1510.4],[1620.8,0]],"sources":[{"location":[1,2]},{"location":[3,4]}],"destinations":[{"location":[1,2]},{"location":[3,4]}]}''')
+        result = osrm.table([(1, 2), (3, 4)], minutes=True,
+                            annotations='duration,distance')
+        self.assertEqual(mock_urlopen.call_count, 1)
+        self.assertIn("annotations=duration,distance",
+                      mock_urlopen.call_args[0][0].get_full_url())
+        self.assertIsInstance(result, osrm.TableResult)
+        self.assertEqual(result.durations.tolist(), [[0, 2.01], [2.17, 0]])
+        self.assertEqual(result.distances.tolist(), [[0, 1510.4], [1620.8, 0]])
+        self.assertEqual(result.sources, [[1, 2], [3, 4]])
+        self.assertIsNone(result.destinations)
+
+        # Also by blocks :
+        mock_urlopen.return_value = None
+        mock_urlopen.side_effect = fake_table_urlopen
+        origins = [(21.0 + i / 10.0, 42.0 + (i % 7) / 10.0) for i in range(11)]
+        destinations = [(20.5 + j / 7.0, 41.0 + (j % 3) / 10.0)
+                        for j in range(7)]
+        durations, _, _ = osrm.table(origins, destinations)
+        distances, _, _ = osrm.table(origins, destinations,
+                                     annotations='distance')
+        result = osrm.table(origins, destinations, output='df', tile_size=4,
+                            annotations='distance,duration', dtype='float32')
+        self.assertTrue(numpy.allclose(result.durations.values, durations))
+        self.assertTrue(numpy.allclose(result.distances.values, distances))
+        self.assertEqual(len(result.destinations), 7)
+
+        with self.assertRaises(ValueError):
+            osrm.table(origins, destinations, annotations='speed')
+
+    @mock.patch('osrm.core.urlopen')
+    def test_match_stream(self, mock_urlopen):
+        mock_urlopen.side_effect = fake_match_urlopen
+        trace = [(21.0 + i / 1000.0, 42.0 + (i % 5) / 1000.0, 1000 + i)
+                 for i in range(95)]
+        segments = list(osrm.match_stream(
+            iter(trace), chunk_size=20, overlap=6, workers=3))
+        self.assertEqual(mock_urlopen.call_count, 7)
+        self.assertIn("timestamps=1000;1001",
+                      mock_urlopen.call_args_list[0][0][0].get_full_url())
+
+        # The segments cover the whole trace, without overlapping :
+        self.assertEqual(segments[0].start, 0)
+        self.assertEqual(segments[-1].stop, 95)
+        for seg, next_seg in zip(segments[:-1], segments[1:]):
+            self.assertIsNone(seg.error)
+            self.assertEqual(seg.stop, next_seg.start)
+            self.assertEqual(len(seg.tracepoints), seg.stop - seg.start)
+        self.assertEqual(sum(len(seg.legs) for seg in segments), 94)
+
+        # And their geometries can be concatenated :
+        line = numpy.concatenate(
+            [segments[0].geometry[0]]
+            + [seg.geometry[0][1:] for seg in segments[1:]])
+        self.assertTrue(numpy.allclose(line, [pt[:2] for pt in trace]))
+
+        # The windows are matched by `match`, with the steps of the legs
+        # (and without the overview geometry, covering the overlaps) :
+        mock_urlopen.reset_mock()
+        list(osrm.match_stream(trace[:30], chunk_size=20,
+                               annotations="duration", tidy=True))
+        url = mock_urlopen.call_args_list[0][0][0].get_full_url()
+        for param in ("overview=false", "steps=true", "geometries=polyline",
+                      "annotations=duration", "tidy=true"):
+            self.assertIn(param, url)
+
+        # A failed query is reported in its segment :
+        def failing_urlopen(req):
+            if "1025" in req.get_full_url():
+                raise URLError("Connection refused")
+            return fake_match_urlopen(req)
+        mock_urlopen.side_effect = failing_urlopen
+        segments = list(osrm.match_stream(trace[:30], chunk_size=20))
+        self.assertIsNone(segments[0].error)
+        self.assertIsInstance(segments[1].error, URLError)
+        self.assertEqual((segments[1].start, segments[1].stop), (15, 30))
+
     def test_non_existing_host(self):
         Profile = osrm.RequestConfig("localhost/v1/flying")
         self.assertEqual(Profile.host, "localhost")
@@ -149,6 +1027,30 @@ class TestOsrmWrapper(unittest.TestCase):
                 [(10.00, 53.55), (52.374444, 9.738611)],
                 url_config=Profile)
 
+    def test_make_grid(self):
+        from osrm.extra import grid_coords, make_grid
+        from shapely.geometry import Point
+        coords = grid_coords((0, 0, 4, 2), 16)
+        self.assertEqual(coords.shape, (16, 2))
+        # Column by column, from the top :
+        self.assertEqual(coords[:5].tolist(), [[0.5, 1.75], [0.5, 1.25],
+                                               [0.5, 0.75], [0.5, 0.25],
+                                               [1.5, 1.75]])
+
+        coords = grid_coords((0, 0, 1, 1), 1000, hexagonal=True)
+        self.assertLess(abs(len(coords) - 1000), 50)
+        # The rows are alternately shifted by a half-cell :
+        cols = len(numpy.unique(coords[:, 0].round(9))) // 2
+        self.assertAlmostEqual(coords[1, 0] - coords[0, 0], 0.5 / cols)
+        self.assertAlmostEqual(coords[2, 0], coords[0, 0])
+        self.assertTrue(((coords > 0) & (coords < 1)).all())
+
+        circle = GeoDataFrame(geometry=[Point(0, 0).buffer(1)])
+        grid = make_grid(circle, 400, clip=True)
+        self.assertIsInstance(grid, GeoDataFrame)
+        self.assertLess(len(grid), 400)
+        self.assertTrue(grid.within(circle.geometry[0]).all())
+
     @mock.patch('osrm.core.urlopen')
     def test_accessibility(self, mock_urlopen):
         mock_urlopen.return_value = MockReadable(
@@ -158,7 +1060,8 @@ class TestOsrmWrapper(unittest.TestCase):
         center_pt = osrm.Point(latitude=21.0566163, longitude=42.0040885)
         n_class = 8
 
-        Accessibility = osrm.AccessIsochrone(center_pt, points_grid=100)
+        # The response contains the times to the 64 points of the grid :
+        Accessibility = osrm.AccessIsochrone(center_pt, points_grid=64)
         snapped_center_point = Accessibility.center_point
         gdf = Accessibility.render_contour(n_class=n_class)
 
@@ -174,6 +1077,84 @@ class TestOsrmWrapper(unittest.TestCase):
         gdf = Accessibility.render_contour(n_class=n_class)
         self.assertEqual(n_class, len(gdf))
 
+    @mock.patch('osrm.core.urlopen', side_effect=fake_table_urlopen)
+    def test_accessibility_adaptive(self, mock_urlopen):
+        # The times (in minutes) from (21, 42) are up to 6.6 in this grid :
+        Accessibility = osrm.AccessIsochrone(
+            (21., 42.), points_grid=100, size=0.4, breaks=[4, 2])
+        self.assertEqual(Accessibility.breaks, [2, 4])
+        self.assertEqual(len(Accessibility.times), len(Accessibility.coords))
+        # Only the cells around the breaks were split, 3 times (instead of
+        # querying the 80 x 80 points of a uniform grid this precise) :
+        self.assertLess(len(Accessibility.coords), 80 * 80 / 2)
+        added = Accessibility.times[100:]
+        self.assertGreater(len(added), 0)
+        self.assertLess(abs(added[:, None] - [2, 4]).min(axis=1).max(), 2)
+
+        gdf = Accessibility.render_contour()
+        self.assertEqual(gdf['time'].tolist(), [2, 4])
+        self.assertIsInstance(
+            Accessibility.render_contour(n_class=3), GeoDataFrame)
+
+        with self.assertRaises(ValueError):
+            osrm.AccessIsochrone((21., 42.), points_grid=100, size=0.4,
+                                 hexagonal=True, breaks=[2, 4])
+        with self.assertRaises(ValueError):
+            osrm.AccessIsochrone(
+                (21., 42.), points_grid=100, size=0.4).render_contour()
+
+    @mock.patch('osrm.core.urlopen', side_effect=fake_table_urlopen)
+    def test_isochrone_many(self, mock_urlopen):
+        origins = [(21. + 0.05 * i, 42. + 0.03 * (i % 3)) for i in range(7)]
+        results = list(osrm.isochrone_many(
+            origins, breaks=[4, 2], points_grid=100, size=0.4, group_size=4,
+            processes=2))
+        # The origins are packed in 2 matrices :
+        self.assertEqual(mock_urlopen.call_count, 2)
+        self.assertEqual(sorted(res.index for res in results), list(range(7)))
+        for res in results:
+            self.assertIsNone(res.error)
+            self.assertIsInstance(res.result, GeoDataFrame)
+            self.assertEqual(res.result['time'].tolist(), [2, 4])
+
+        # Same contours as computed by AccessIsochrone :
+        Accessibility = osrm.AccessIsochrone(
+            origins[3], points_grid=100, size=0.4, breaks=[2, 4],
+            precision=1)
+        expected = Accessibility.render_contour()
+        result = next(res.result for res in results if res.index == 3)
+        for geom, expected_geom in zip(result.geometry, expected.geometry):
+            self.assertLess(geom.symmetric_difference(expected_geom).area,
+                            0.01 * expected_geom.area)
+
+        results = list(osrm.isochrone_many(
+            origins[:2], n_class=2, points_grid=100, size=0.4, processes=0))
+        self.assertEqual([res.index for res in results], [0, 1])
+
+        # Far apart origins are only queried with the points of their grid :
+        def requested_cells():
+            cells = 0
+            for call in mock_urlopen.call_args_list:
+                params = parse_qs(urlsplit(call[0][0].get_full_url()).query)
+                cells += (len(params['sources'][0].split(';'))
+                          * len(params['destinations'][0].split(';')))
+            mock_urlopen.reset_mock()
+            return cells
+
+        far = [(21., 42.), (24., 42.), (21., 45.), (27.5, 44.)]
+        mock_urlopen.reset_mock()
+        expected = 0
+        for origin in far:
+            list(osrm.isochrone_many([origin], n_class=2, points_grid=100,
+                                     size=0.4, processes=0))
+            expected += requested_cells()
+        results = list(osrm.isochrone_many(
+            far, n_class=2, points_grid=100, size=0.4, processes=0))
+        self.assertEqual(len(results), 4)
+        self.assertEqual(requested_cells(), expected)
+        with self.assertRaises(ValueError):
+            osrm.isochrone_many(origins, points_grid=100)
+
     @mock.patch('osrm.core.urlopen')
     def test_trips(self, mock_urlopen):
         mock_urlopen.return_value = MockReadable(
@@ -197,6 +1178,29 @@ class TestOsrmWrapper(unittest.TestCase):
         coords = [[21.0566, 42.0040], [21.05667, 42.0041]]
         result = osrm.match(coords)
         self.assertIn("matchings", result)
+        self.assertEqual(result["matchings"][0]["geometry"], "g|j_Goro_CEO")
+
+        # Geometries are decoded when the matching succeeds :
+        result = osrm.match(coords, geometry="wkt")
+        self.assertIn("geometries=polyline",
+                      mock_urlopen.call_args[0][0].get_full_url())
+        self.assertEqual(result["matchings"][0]["geometry"],
+                         "LINESTRING (21.05656 42.00404,21.05664 42.00407)")
+
+        columns = osrm.match(coords, output="columnar")
+        self.assertIsInstance(columns, osrm.MatchColumns)
+        self.assertTrue(numpy.allclose(
+            columns.coords, [[21.05656, 42.00404], [21.05664, 42.00407]]))
+        self.assertEqual(columns.offsets.tolist(), [0, 2])
+        self.assertEqual(columns.confidences.tolist(), [0])
+        self.assertEqual(columns.distances.tolist(), [8])
+        self.assertEqual(columns.matchings_index.tolist(), [0, 0])
+        self.assertEqual(columns.waypoint_index.tolist(), [0, 1])
+        self.assertTrue(numpy.allclose(
+            columns.locations, [[21.05656, 42.004042], [21.056638, 42.004072]]))
+
+        with self.assertRaises(ValueError):
+            osrm.match(coords, output="arrays")
 
     @unittest.skipIf("TRAVIS" in os.environ and os.environ["TRAVIS"] == "true",
                      "Test skipped on Travis")